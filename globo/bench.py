@@ -0,0 +1,314 @@
+"""
+Benchmarks selection, rendering and delivery against synthetic catalogs.
+
+Each size generates a catalog with that many exercises spread over hundreds
+of routines (a quarter of them supersets) and a week of workouts, plus a
+synthetic recipient list. Every benchmark reports throughput, p50/p99
+latency and peak traced memory, and results can be saved as a baseline that
+later runs are compared against:
+
+    python globo/bench.py --sizes 10,1000,100000 --save_baseline bench.json
+    python globo/bench.py --sizes 10,1000,100000 --baseline bench.json
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import catalog
+import metrics
+import runner
+import selection
+import smtp_sink
+
+PROGRAM = "Bench"
+EQUIPMENT = ("barbell", "dumbbell", "bench", "band", "cable", "kettlebell", "pullup bar")
+MUSCLES = ("chest", "back", "shoulders", "biceps", "triceps", "quads", "hamstrings", "glutes", "core")
+
+# A result is flagged when it is this much worse than the baseline.
+DEFAULT_TOLERANCE = 0.2
+
+# Fields of a result describing the run that produced it. Results are only
+# compared with baselines from the same configuration.
+CONFIG_FIELDS = ("benchmark", "exercises", "recipients", "routines", "repeat", "personalize")
+
+
+def synthetic_catalog(exercises, routines=300, seed=0):
+    """Generates catalog data (see `catalog.build`).
+
+    Every exercise is an option of one routine. A quarter of the routines
+    are supersets whose options are split into two or three groups. There's
+    a workout of four to eight routines for each day of the week.
+
+    Args:
+        exercises: `int` Number of exercises.
+        routines: `int` Number of routines. Capped at `exercises`.
+        seed: `int` Seed for the random generator, so runs are comparable.
+
+    Returns:
+        A `dict` of catalog data.
+    """
+    rng = random.Random(seed)
+    routines = min(routines, exercises)
+    data = {"exercises": {}, "routines": {}, "workouts": {}, "programs": {PROGRAM: {}}}
+    options = [[] for _ in range(routines)]
+    for i in range(exercises):
+        key = f"Exercise{i}"
+        data["exercises"][key] = {
+            "name": f"Synthetic exercise {i}",
+            "url": f"https://example.com/exercises/{i}",
+            "equipment": rng.sample(EQUIPMENT, rng.randint(0, 2)),
+            "muscles": rng.sample(MUSCLES, rng.randint(1, 3)),
+            "difficulty": rng.randint(1, 3),
+        }
+        # The first pass gives every routine an option.
+        options[i if i < routines else rng.randrange(routines)].append(key)
+
+    for i, keys in enumerate(options):
+        entry = {"name": f"Routine {i}", "instructions": "Perform 3 sets of 8-12 reps."}
+        if i % 4 == 0 and len(keys) >= 2:
+            groups = min(len(keys), rng.randint(2, 3))
+            entry["exercise_groups"] = [keys[g::groups] for g in range(groups)]
+        else:
+            entry["exercises"] = keys
+        data["routines"][f"Routine{i}"] = entry
+
+    for day in catalog.DAYS:
+        data["workouts"][f"Workout{day}"] = {
+            "name": f"Synthetic {day.title()} workout",
+            "routines": rng.sample(sorted(data["routines"]), min(routines, rng.randint(4, 8))),
+        }
+        data["programs"][PROGRAM][day] = f"Workout{day}"
+    return data
+
+
+def synthetic_recipients(count):
+    """Returns `count` distinct addresses."""
+    return [f"user{i}@bench.invalid" for i in range(count)]
+
+
+def measure(operations, traced=False):
+    """Runs and times a sequence of operations.
+
+    Args:
+        operations: An iterable of zero argument callables.
+        traced: `bool` Trace allocations to report peak memory. Slows
+            everything down, so timings from a traced run are discarded.
+
+    Returns:
+        A `(latencies in seconds, wall seconds, peak bytes)` tuple. Peak
+        bytes is None unless `traced`.
+    """
+    gc.collect()
+    if traced:
+        tracemalloc.start()
+    latencies = []
+    started = time.perf_counter()
+    for operation in operations:
+        start = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - start)
+    wall = time.perf_counter() - started
+    peak = None
+    if traced:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return latencies, wall, peak
+
+
+def best_of(operations, repeat):
+    """Measures peak memory once (which also warms up caches), then keeps the fastest of `repeat` timed runs.
+
+    Args:
+        operations: Callable returning a fresh iterable of operations.
+        repeat: `int` Number of timed runs.
+
+    Returns:
+        A `(latencies in seconds, wall seconds, peak bytes)` tuple.
+    """
+    _, _, peak = measure(operations(), traced=True)
+    latencies, wall, _ = min((measure(operations()) for _ in range(repeat)), key=lambda run: run[1])
+    return latencies, wall, peak
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def record(name, size, operations, latencies, wall, peak):
+    latencies = sorted(latencies)
+    return {
+        "benchmark": name,
+        "exercises": size,
+        "operations": operations,
+        "throughput": round(operations / wall, 1) if wall else 0,
+        "p50_us": round(percentile(latencies, 0.5) * 1e6, 2),
+        "p99_us": round(percentile(latencies, 0.99) * 1e6, 2),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def bench_selection(size, workouts, date, recipients, supersets, repeat=3):
+    """Times `get_exercises` for every recipient and routine of one kind.
+
+    Returns:
+        The result, or None if there are no routines of that kind.
+    """
+    pickers = [selection.HashPicker(PROGRAM, date, recipient) for recipient in recipients]
+    routines = [r for w in workouts for r in w.routines if (len(r.exercise_groups) > 1) == supersets]
+    if not routines:
+        return None
+
+    def operations():
+        for picker in pickers:
+            for r in routines:
+                yield lambda r=r, picker=picker: r.get_exercises(picker)
+
+    latencies, wall, peak = best_of(operations, repeat)
+    return record("select_superset" if supersets else "select", size, len(latencies), latencies, wall, peak)
+
+
+def bench_render(size, workout, date, recipients, repeat=3):
+    """Times `Workout.as_html` with a personal selection for every recipient."""
+    pickers = [selection.HashPicker(PROGRAM, date, recipient) for recipient in recipients]
+
+    def operations():
+        return (lambda picker=picker: workout.as_html(picker) for picker in pickers)
+
+    latencies, wall, peak = best_of(operations, repeat)
+    return record("render", size, len(latencies), latencies, wall, peak)
+
+
+def bench_delivery(size, catalog_path, date, recipients, directory, personalize, repeat=3):
+    """Runs the runner's send loop against an in-process `smtp_sink.SMTPSink`.
+
+    Latencies are per message sends, from the runner's own metrics.
+    """
+    recipients_file = os.path.join(directory, "recipients.txt")
+    with open(recipients_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(recipients) + "\n")
+
+    def run(traced):
+        metrics_file = os.path.join(directory, "metrics.jsonl")
+        if os.path.exists(metrics_file):
+            os.remove(metrics_file)
+        with smtp_sink.SMTPSink() as sink:
+            argv = ["--username", "bench@bench.invalid", "--app_password", "unused",
+                    "--smtp_host", sink.host, "--smtp_port", str(sink.port), "--smtp_security", "none",
+                    "--recipients_file", recipients_file, "--catalog", catalog_path, "--program", PROGRAM,
+                    "--date", date.isoformat(), "--max_per_second", "1000000", "--metrics_file", metrics_file]
+            if personalize:
+                argv.append("--personalize")
+            _, wall, peak = measure([lambda: runner.main(argv)], traced)
+            metrics.disable()
+            if len(sink.messages) != len(recipients):
+                raise RuntimeError(f"The sink received {len(sink.messages)} of {len(recipients)} messages")
+        with open(metrics_file, encoding="utf-8") as f:
+            return json.loads(f.readline())["latency_ms"]["smtp_send"], wall, peak
+
+    _, _, peak = run(True)
+    send, wall, _ = min((run(False) for _ in range(repeat)), key=lambda result: result[1])
+    result = record("deliver", size, len(recipients), [0.0], wall, peak)
+    result["p50_us"] = round(send["p50"] * 1000, 2)
+    result["p99_us"] = round(send["p99"] * 1000, 2)
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Prints each result against its baseline.
+
+    Returns:
+        The number of regressions beyond `tolerance`.
+    """
+    previous = {tuple(entry[field] for field in CONFIG_FIELDS): entry for entry in baseline}
+    sizes = {(entry["benchmark"], entry["exercises"]) for entry in baseline}
+    regressions = 0
+    for result in results:
+        base = previous.get(tuple(result[field] for field in CONFIG_FIELDS))
+        if base is None:
+            if (result["benchmark"], result["exercises"]) in sizes:
+                print("    vs baseline: not compared, the baseline was run with a different configuration")
+            continue
+        changes = []
+        # (field, True if higher is better, whether to flag regressions). Tail
+        # latencies of microsecond operations are too noisy to flag.
+        for field, higher_is_better, flagged in (("throughput", True, True), ("p50_us", False, True),
+                                                 ("p99_us", False, False), ("peak_kb", False, True)):
+            if not base[field]:
+                continue
+            change = (result[field] - base[field]) / base[field]
+            worse = -change if higher_is_better else change
+            flag = ""
+            if flagged and worse > tolerance:
+                flag = " REGRESSION"
+                regressions += 1
+            changes.append(f"{field} {change:+.0%}{flag}")
+        print(f"    vs baseline: {', '.join(changes)}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Globo selection, rendering and delivery.")
+    parser.add_argument("--sizes", type=str, default="10,1000,10000",
+                        help="Comma separated numbers of exercises in the synthetic catalogs.")
+    parser.add_argument("--routines", type=int, default=300, help="Routines per synthetic catalog.")
+    parser.add_argument("--recipients", type=int, default=1000, help="Synthetic recipients per benchmark.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark; the fastest is kept.")
+    parser.add_argument("--personalize", action="store_true", help="Personalize emails in the delivery benchmark.")
+    parser.add_argument("--skip_delivery", action="store_true", help="Only benchmark selection and rendering.")
+    parser.add_argument("--baseline", type=str, default=None, help="Compare results with this baseline file.")
+    parser.add_argument("--save_baseline", type=str, default=None, help="Save results as a baseline to this file.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Relative change beyond which a result counts as a regression.")
+    args = parser.parse_args()
+
+    date = datetime.date(2021, 3, 1)
+    recipients = synthetic_recipients(args.recipients)
+    baseline = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    results = []
+    regressions = 0
+    with tempfile.TemporaryDirectory() as directory:
+        for size in (int(size) for size in args.sizes.split(",")):
+            catalog_path = os.path.join(directory, f"bench-{size}.json")
+            with open(catalog_path, "w", encoding="utf-8") as f:
+                json.dump(synthetic_catalog(size, args.routines), f)
+            built = catalog.load(catalog_path)
+            workouts = list(built.workouts.values())
+            workout = built.programs[PROGRAM][date.weekday()]
+
+            runs = [
+                lambda: bench_selection(size, workouts, date, recipients, False, args.repeat),
+                lambda: bench_selection(size, workouts, date, recipients, True, args.repeat),
+                lambda: bench_render(size, workout, date, recipients, args.repeat),
+            ]
+            if not args.skip_delivery:
+                runs.append(lambda: bench_delivery(
+                    size, catalog_path, date, recipients, directory, args.personalize, args.repeat))
+            for run in runs:
+                result = run()
+                if result is None:
+                    continue
+                result.update(recipients=args.recipients, routines=args.routines, repeat=args.repeat,
+                              personalize=args.personalize)
+                results.append(result)
+                print(f"{result['benchmark']} ({size} exercises): {result['throughput']:,.0f}/s, p50 {result['p50_us']} us, "
+                      f"p99 {result['p99_us']} us, peak {result['peak_kb']:,.0f} KiB")
+                regressions += compare([result], baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                       "python": sys.version.split()[0], "results": results}, f, indent=2)
+    if regressions:
+        print(f"{regressions} regressions beyond {args.tolerance:.0%}", file=sys.stderr)
+        sys.exit(1)
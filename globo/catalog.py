@@ -0,0 +1,297 @@
+"""
+Loads exercises, routines, workouts and programs from catalog files.
+
+A catalog is a JSON, TOML or YAML file shaped like:
+
+    {
+        "exercises": {"BenchPress": {"name": "Bench Press", "url": "https://...",
+                                     "equipment": ["barbell", "bench", "rack"], "muscles": ["chest"],
+                                     "difficulty": 2}},
+        "routines": {
+            "MaxEffortExercise": {"name": "...", "instructions": "...", "exercises": ["BenchPress"]},
+            "RearDeltSuperset": {"name": "...", "instructions": "...", "exercise_groups": [["DBRows"], ["FacePulls"]]}
+        },
+        "workouts": {"MaxEffortUpperBody": {"name": "...", "routines": ["MaxEffortExercise"]}},
+        "programs": {"WS4SB": {"MON": "MaxEffortUpperBody"}}
+    }
+
+Exercise `equipment`, `muscles` and `difficulty` (1 to 3) are optional.
+Files are validated when loaded, then compiled into a pickled snapshot named
+after a hash of the source. Later loads of an unchanged file read the
+snapshot through mmap instead of parsing and validating again.
+"""
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import tempfile
+
+import exercise
+import routine
+import workout
+import workout_program
+
+DAYS = {"MON": workout_program.MON, "TUE": workout_program.TUE, "WED": workout_program.WED,
+        "THU": workout_program.THU, "FRI": workout_program.FRI, "SAT": workout_program.SAT,
+        "SUN": workout_program.SUN}
+
+CACHE_DIR_NAME = "__catalogcache__"
+
+# Bump when the snapshot layout changes so stale snapshots are ignored.
+SNAPSHOT_VERSION = 3
+
+
+class CatalogError(ValueError):
+    """Raised when a catalog file is malformed."""
+
+
+class Catalog(object):
+    """Exercises, routines, workouts and programs, each keyed by name."""
+
+    def __init__(self, exercises, routines, workouts, programs):
+        self.exercises = exercises
+        self.routines = routines
+        self.workouts = workouts
+        self.programs = programs
+        self._index = None
+
+    def index(self):
+        """Returns a `catalog_index.CatalogIndex` of this catalog, built on first use."""
+        if self._index is None:
+            import catalog_index
+            self._index = catalog_index.CatalogIndex(self)
+        return self._index
+
+    def __getstate__(self):
+        # Snapshots don't include the index; it is rebuilt when needed.
+        state = dict(self.__dict__)
+        state["_index"] = None
+        return state
+
+
+def _parse(path, data):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        return json.loads(data)
+    if extension == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise CatalogError("TOML catalogs need Python 3.11+ or the tomli package.")
+        return tomllib.loads(data.decode("utf-8"))
+    if extension in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise CatalogError("YAML catalogs need the PyYAML package.")
+        return yaml.safe_load(data)
+    raise CatalogError(f"Unknown catalog format {extension!r}, expected .json, .toml or .yaml.")
+
+
+def _section(data, name):
+    section = data.get(name, {})
+    if not isinstance(section, dict):
+        raise CatalogError(f"{name}: should map keys to entries")
+    return section
+
+
+def _entry(entry, where):
+    if not isinstance(entry, dict):
+        raise CatalogError(f"{where}: should be a mapping")
+    return entry
+
+
+def _field(entry, field, where, kind=str):
+    if not isinstance(entry, dict) or field not in entry:
+        raise CatalogError(f"{where}: missing {field!r}")
+    value = entry[field]
+    if not isinstance(value, kind):
+        raise CatalogError(f"{where}: {field!r} should be a {kind.__name__}")
+    return value
+
+
+def _tags(entry, field, where):
+    tags = entry.get(field, [])
+    if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+        raise CatalogError(f"{where}: {field!r} should be a list of strings")
+    return tags
+
+
+def _lookup(table, key, where):
+    if not isinstance(key, str) or key not in table:
+        raise CatalogError(f"{where}: unknown reference {key!r}")
+    return table[key]
+
+
+def build(data):
+    """Validates parsed catalog data and builds the catalog objects.
+
+    Args:
+        data: `dict` as parsed from a catalog file.
+
+    Returns:
+        A `Catalog`.
+
+    Raises:
+        CatalogError: If the data is malformed or has dangling references.
+    """
+    if not isinstance(data, dict):
+        raise CatalogError("A catalog must be a mapping")
+
+    exercises = {}
+    for key, entry in _section(data, "exercises").items():
+        where = f"exercises.{key}"
+        difficulty = _entry(entry, where).get("difficulty", exercise.BEGINNER)
+        # bool is an int, and True == 1.
+        if (not isinstance(difficulty, int) or isinstance(difficulty, bool)
+                or difficulty not in (exercise.BEGINNER, exercise.INTERMEDIATE, exercise.ADVANCED)):
+            raise CatalogError(f"{where}: 'difficulty' should be 1, 2 or 3")
+        exercises[key] = exercise.Exercise(
+            _field(entry, "name", where), _field(entry, "url", where),
+            _tags(entry, "equipment", where), _tags(entry, "muscles", where), difficulty)
+
+    routines = {}
+    for key, entry in _section(data, "routines").items():
+        where = f"routines.{key}"
+        _entry(entry, where)
+        name, instructions = _field(entry, "name", where), _field(entry, "instructions", where)
+        if "exercise_groups" in entry:
+            groups = _field(entry, "exercise_groups", where, list)
+            if not all(isinstance(group, list) for group in groups):
+                raise CatalogError(f"{where}: 'exercise_groups' should be a list of lists of exercises")
+            groups = [[_lookup(exercises, e, where) for e in group] for group in groups]
+            if not all(groups):
+                raise CatalogError(f"{where}: exercise groups can't be empty")
+            routines[key] = routine.SupersetRoutine(name, instructions, groups)
+        else:
+            options = [_lookup(exercises, e, where) for e in _field(entry, "exercises", where, list)]
+            if not options:
+                raise CatalogError(f"{where}: needs at least one exercise")
+            routines[key] = routine.ExerciseRoutine(name, instructions, options)
+
+    workouts = {}
+    for key, entry in _section(data, "workouts").items():
+        where = f"workouts.{key}"
+        _entry(entry, where)
+        workouts[key] = workout.Workout(
+            _field(entry, "name", where),
+            [_lookup(routines, r, where) for r in _field(entry, "routines", where, list)])
+
+    programs = {}
+    for key, schedule in _section(data, "programs").items():
+        where = f"programs.{key}"
+        if not isinstance(schedule, dict):
+            raise CatalogError(f"{where}: should map days to workouts")
+        programs[key] = {_lookup(DAYS, str(day).upper()[:3], where): _lookup(workouts, w, where)
+                         for day, w in schedule.items()}
+
+    return Catalog(exercises, routines, workouts, programs)
+
+
+def _snapshot_path(path, digest, cache_dir):
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{stem}-{digest[:16]}.v{SNAPSHOT_VERSION}.pickle")
+
+
+def load(path, cache_dir=None):
+    """Loads a catalog file, going through its compiled snapshot when possible.
+
+    Args:
+        path: `string` Path to a .json, .toml or .yaml catalog.
+        cache_dir: `string` Where snapshots are kept. Defaults to a
+            `__catalogcache__` directory next to the catalog.
+
+    Returns:
+        A `Catalog`.
+
+    Raises:
+        CatalogError: If the file is malformed.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    snapshot = _snapshot_path(path, hashlib.sha256(data).hexdigest(), cache_dir)
+
+    try:
+        with open(snapshot, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return pickle.loads(mm)
+    except (OSError, ValueError, pickle.UnpicklingError, EOFError):
+        pass
+
+    result = build(_parse(path, data))
+    try:
+        os.makedirs(os.path.dirname(snapshot), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(snapshot))
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, snapshot)
+    except OSError:
+        # A read-only catalog directory just means no snapshot.
+        pass
+    return result
+
+
+def register(path, cache_dir=None):
+    """Loads a catalog and adds its programs to `workout_program.PROGRAMS`.
+
+    Returns:
+        The loaded `Catalog`.
+    """
+    result = load(path, cache_dir)
+    workout_program.PROGRAMS.update(result.programs)
+    return result
+
+
+def from_modules():
+    """Builds a `Catalog` from the built-in exercise, routine and workout modules."""
+    def named(module, kind):
+        return {key: value for key, value in vars(module).items() if type(value) in kind}
+
+    return Catalog(named(exercise, (exercise.Exercise,)),
+                   named(routine, (routine.ExerciseRoutine, routine.SupersetRoutine)),
+                   named(workout, (workout.Workout,)),
+                   dict(workout_program.PROGRAMS))
+
+
+def _exercise_entry(e):
+    entry = {"name": e.name, "url": e.url}
+    if e.equipment:
+        entry["equipment"] = sorted(e.equipment)
+    if e.muscles:
+        entry["muscles"] = sorted(e.muscles)
+    if e.difficulty != exercise.BEGINNER:
+        entry["difficulty"] = e.difficulty
+    return entry
+
+
+def dump(catalog, path):
+    """Writes a `Catalog` as a JSON catalog file."""
+    keys = {id(value): key
+            for table in (catalog.exercises, catalog.routines, catalog.workouts)
+            for key, value in table.items()}
+    days = {number: name for name, number in DAYS.items()}
+
+    routines = {}
+    for key, r in catalog.routines.items():
+        entry = {"name": r.name, "instructions": r.instructions}
+        if isinstance(r, routine.SupersetRoutine):
+            entry["exercise_groups"] = [[keys[id(e)] for e in group] for group in r.exercise_groups]
+        else:
+            entry["exercises"] = [keys[id(e)] for e in r.exercises]
+        routines[key] = entry
+
+    data = {
+        "exercises": {key: _exercise_entry(e) for key, e in catalog.exercises.items()},
+        "routines": routines,
+        "workouts": {key: {"name": w.name, "routines": [keys[id(r)] for r in w.routines]}
+                     for key, w in catalog.workouts.items()},
+        "programs": {key: {days[day]: keys[id(w)] for day, w in sorted(schedule.items())}
+                     for key, schedule in catalog.programs.items()},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4)
+        f.write("\n")
@@ -0,0 +1,208 @@
+"""
+Reverse indexes over a catalog, answering questions such as "which workouts
+include RomanianDeadlift?" or "which exercises match 'curl'?".
+
+Everything is precomputed when the index is built, so lookups are dictionary
+hits, and searches binary search the sorted tokens for prefixes and then
+merge the matching tokens' sorted postings:
+
+    python globo/catalog_index.py search curl
+    python globo/catalog_index.py where RomanianDeadlift
+    python globo/catalog_index.py program WS4SB
+"""
+import argparse
+import bisect
+import collections
+import heapq
+import re
+
+import catalog
+
+# Splits CamelCase keys such as "DBRows" into "DB" and "Rows".
+_KEY_WORD_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+_NAME_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Where an exercise is used: the routines, workouts and (program, weekday) pairs.
+Usage = collections.namedtuple("Usage", ["routines", "workouts", "schedule"])
+
+
+def tokens(text):
+    """Returns the lowercase search tokens in a name or key."""
+    return set(_NAME_WORD_RE.findall(text.lower())) | {word.lower() for word in _KEY_WORD_RE.findall(text)}
+
+
+class CatalogIndex(object):
+    """Token, usage and schedule indexes over a `catalog.Catalog`.
+
+    Exercises, routines and workouts are referred to by their catalog keys.
+    """
+
+    def __init__(self, source):
+        """Builds the indexes.
+
+        Args:
+            source: `catalog.Catalog` to index.
+        """
+        self.catalog = source
+
+        exercise_keys = {}
+        for key, e in source.exercises.items():
+            exercise_keys.setdefault(e.id, key)
+        routine_keys = {}
+        for key, r in source.routines.items():
+            routine_keys.setdefault(id(r), key)
+        workout_keys = {}
+        for key, w in source.workouts.items():
+            workout_keys.setdefault(id(w), key)
+
+        postings = collections.defaultdict(set)
+        for key, e in source.exercises.items():
+            for token in tokens(key) | tokens(e.name):
+                postings[token].add(key)
+        self._tokens = sorted(postings)
+        # Each token's exercise keys, as a set for membership tests and as a
+        # sorted tuple for merging.
+        self._postings = [frozenset(postings[token]) for token in self._tokens]
+        self._sorted_postings = [tuple(sorted(keys)) for keys in self._postings]
+
+        routines = collections.defaultdict(list)
+        for key, r in source.routines.items():
+            for e in dict.fromkeys(r.exercises):
+                if e.id in exercise_keys:
+                    routines[exercise_keys[e.id]].append(key)
+        workouts = collections.defaultdict(list)
+        for key, w in source.workouts.items():
+            for r in dict.fromkeys(w.routines):
+                if id(r) in routine_keys:
+                    workouts[routine_keys[id(r)]].append(key)
+        schedule = collections.defaultdict(list)
+        self.programs = {}
+        for name, program in source.programs.items():
+            days = {}
+            for day in sorted(program):
+                key = workout_keys.get(id(program[day]))
+                days[day] = key
+                if key is not None:
+                    schedule[key].append((name, day))
+            self.programs[name] = days
+
+        self._routine_workouts = {key: tuple(keys) for key, keys in workouts.items()}
+        self._workout_schedule = {key: tuple(days) for key, days in schedule.items()}
+        self._usage = {}
+        for key in source.exercises:
+            exercise_routines = tuple(routines.get(key, ()))
+            exercise_workouts = tuple(dict.fromkeys(
+                w for r in exercise_routines for w in self._routine_workouts.get(r, ())))
+            exercise_schedule = tuple(sorted(set(
+                entry for w in exercise_workouts for entry in self._workout_schedule.get(w, ()))))
+            self._usage[key] = Usage(exercise_routines, exercise_workouts, exercise_schedule)
+
+    def search(self, query, limit=None):
+        """Finds exercises by name or key.
+
+        Every word in the query has to match the start of a word in the
+        exercise's name or key, so "curl" finds "Hammer curls" and "db row"
+        finds "DB rows".
+
+        Args:
+            query: `string` The words to search for.
+            limit: `int` Optional maximum number of results.
+
+        Returns:
+            A sorted `list` of exercise keys.
+        """
+        ranges = []
+        for word in _NAME_WORD_RE.findall(query.lower()):
+            start = bisect.bisect_left(self._tokens, word)
+            end = bisect.bisect_left(self._tokens, word + "\uffff", start)
+            if start == end:
+                return []
+            ranges.append((sum(len(keys) for keys in self._postings[start:end]), start, end))
+        if not ranges:
+            return []
+        # Start from the most selective word and check the rest against it.
+        ranges.sort()
+        _, start, end = ranges[0]
+        candidates = heapq.merge(*self._sorted_postings[start:end])
+        matches = []
+        for key in candidates:
+            if matches and matches[-1] == key:
+                continue
+            if all(any(key in keys for keys in self._postings[lo:hi]) for _, lo, hi in ranges[1:]):
+                matches.append(key)
+                if limit is not None and len(matches) >= limit:
+                    break
+        return matches
+
+    def usage(self, exercise_key):
+        """Returns the `Usage` of an exercise.
+
+        Raises:
+            KeyError: If there's no such exercise.
+        """
+        return self._usage[exercise_key]
+
+    def routines_with(self, exercise_key):
+        """Returns the keys of the routines that include an exercise."""
+        return self._usage[exercise_key].routines
+
+    def workouts_with(self, exercise_key):
+        """Returns the keys of the workouts that include an exercise."""
+        return self._usage[exercise_key].workouts
+
+    def workouts_with_routine(self, routine_key):
+        """Returns the keys of the workouts that include a routine."""
+        return self._routine_workouts.get(routine_key, ())
+
+    def schedule(self, workout_key):
+        """Returns the `(program name, weekday)` pairs a workout is scheduled on."""
+        return self._workout_schedule.get(workout_key, ())
+
+    def program_days(self, program_name):
+        """Returns a program's `{weekday: workout key}` schedule.
+
+        Raises:
+            KeyError: If there's no such program.
+        """
+        return self.programs[program_name]
+
+
+def _day_name(day):
+    return {number: name for name, number in catalog.DAYS.items()}[day]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the exercises, routines, workouts and programs in a catalog.")
+    parser.add_argument("--catalog", type=str, default=None,
+                        help="A catalog file to query instead of the built-in exercises and programs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    search_parser = commands.add_parser("search", help="Find exercises by name.")
+    search_parser.add_argument("query", nargs="+", help="Words to search for, e.g. curl.")
+    search_parser.add_argument("--limit", type=int, default=None, help="Maximum number of results.")
+    where_parser = commands.add_parser("where", help="Show the routines, workouts and days that include an exercise.")
+    where_parser.add_argument("exercise", help="An exercise key, e.g. RomanianDeadlift, or a search query.")
+    program_parser = commands.add_parser("program", help="Show a program's weekly schedule.")
+    program_parser.add_argument("program", help="A program name, e.g. WS4SB.")
+    args = parser.parse_args()
+
+    index = (catalog.load(args.catalog) if args.catalog else catalog.from_modules()).index()
+    exercises = index.catalog.exercises
+
+    if args.command == "search":
+        for key in index.search(" ".join(args.query), args.limit):
+            print(f"{key}: {exercises[key].name}")
+    elif args.command == "where":
+        keys = [args.exercise] if args.exercise in exercises else index.search(args.exercise)
+        if not keys:
+            parser.exit(1, f"No exercise matches {args.exercise!r}.\n")
+        for key in keys:
+            usage = index.usage(key)
+            print(f"{key}: {exercises[key].name}")
+            print(f"    routines: {', '.join(usage.routines) or '-'}")
+            print(f"    workouts: {', '.join(usage.workouts) or '-'}")
+            print(f"    schedule: {', '.join(f'{name} {_day_name(day)}' for name, day in usage.schedule) or '-'}")
+    elif args.command == "program":
+        if args.program not in index.programs:
+            parser.exit(1, f"Unknown program {args.program!r}.\n")
+        for day, key in index.program_days(args.program).items():
+            print(f"{_day_name(day)}: {key}")
@@ -1,294 +1,672 @@
 """
 All exercise files.
 """
+import array
+import collections
+import collections.abc
+import templates
 
+# Difficulty levels.
+BEGINNER = 1
+INTERMEDIATE = 2
+ADVANCED = 3
 
-class Exercise(object):
-    """Object that defines the exercise interface."""
+# Every distinct exercise, indexed by its `id`.
+EXERCISES = []
 
-    def __init__(self, name, url):
+_interned = {}
+
+# Ids of the exercises with each tag, in order. See `tag_mask`.
+_tagged = collections.defaultdict(list)
+_masks = {}
+
+
+class Frozen(object):
+    """Base class for immutable, slotted catalog objects."""
+
+    __slots__ = ()
+
+    def _set(self, **fields):
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} objects are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} objects are immutable")
+
+
+class Exercise(Frozen):
+    """Object that defines the exercise interface.
+
+    Exercises are immutable and interned: constructing the same exercise
+    twice returns the same object, and every distinct exercise gets a dense
+    integer `id` that indexes `EXERCISES`.
+    """
+
+    __slots__ = ("id", "name", "url", "equipment", "muscles", "difficulty")
+
+    def __new__(cls, name, url, equipment=(), muscles=(), difficulty=BEGINNER):
         """Constructs an Exercise object with a name and url.
 
         Args:
             name: `string` The name of the exercise.
             url: `string` A url to a video of the exercise to depict proper form.
+            equipment: Iterable of `string` equipment that is all needed for
+                the exercise, e.g. `("barbell", "rack")`. Empty for bodyweight.
+            muscles: Iterable of `string` muscle groups the exercise works.
+            difficulty: `int` One of `BEGINNER`, `INTERMEDIATE` or `ADVANCED`.
         """
-        self.name = name
-        self.url = url
+        equipment = frozenset(item.lower() for item in equipment)
+        muscles = frozenset(item.lower() for item in muscles)
+        key = (name, url, equipment, muscles, difficulty)
+        existing = _interned.get(key)
+        if existing is not None:
+            return existing
+        self = super().__new__(cls)
+        self._set(id=len(EXERCISES), name=name, url=url, equipment=equipment, muscles=muscles,
+                  difficulty=difficulty)
+        EXERCISES.append(self)
+        _interned[key] = self
+        for tag in self.tags():
+            _tagged[tag].append(self.id)
+        return self
+
+    def tags(self):
+        """Returns the exercise's index tags, e.g. `equipment:barbell`."""
+        return ([f"equipment:{item}" for item in self.equipment] + [f"muscle:{item}" for item in self.muscles]
+                + [f"difficulty:{self.difficulty}"])
 
     def as_html(self):
         """Formats the exercise as an html link."""
-        return f"{self.name} (<a href=\"{self.url}\">example</a>)"
+        return templates.exercise_html(self)
+
+    def __reduce__(self):
+        return (Exercise, (self.name, self.url, tuple(sorted(self.equipment)), tuple(sorted(self.muscles)),
+                           self.difficulty))
+
+    def __repr__(self):
+        return f"Exercise({self.name!r}, {self.url!r})"
 
     def __str__(self):
         return self.as_html()
 
 
+def _bits(ids):
+    bitmap = bytearray((len(EXERCISES) + 7) // 8)
+    for i in ids:
+        bitmap[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bitmap, "little")
+
+
+def tag_mask(tag):
+    """Returns a bitset (an `int`, bit `id` per exercise) of the exercises with a tag."""
+    # Masks are built on first use and rebuilt only if exercises were added.
+    cached = _masks.get(tag)
+    if cached is None or cached[0] != len(EXERCISES):
+        cached = _masks[tag] = (len(EXERCISES), _bits(_tagged.get(tag, ())))
+    return cached[1]
+
+
+def to_bitmap(mask):
+    """Converts a bitset to `bytes` for O(1) membership tests by id."""
+    return mask.to_bytes((len(EXERCISES) + 7) // 8, "little")
+
+
+def tag_count(tag):
+    """Returns the number of exercises with a tag."""
+    return len(_tagged.get(tag, ()))
+
+
+def all_mask():
+    """Returns a bitset of every exercise."""
+    return (1 << len(EXERCISES)) - 1
+
+
+def equipment():
+    """Returns the `set` of equipment any exercise needs."""
+    return {tag.partition(":")[2] for tag in _tagged if tag.startswith("equipment:")}
+
+
+def matching(available=None, avoid_muscles=(), max_difficulty=None):
+    """Returns a bitset of the exercises that satisfy some constraints.
+
+    Args:
+        available: Optional collection of `string` equipment on hand. Exercises
+            needing anything else are excluded. None means everything.
+        avoid_muscles: Collection of `string` muscle groups to leave out.
+        max_difficulty: Optional `int` hardest difficulty to include.
+
+    Returns:
+        An `int` with bit `id` set for every matching exercise.
+    """
+    mask = all_mask()
+    if available is not None:
+        available = {item.lower() for item in available}
+        for item in equipment() - available:
+            mask &= ~tag_mask(f"equipment:{item}")
+    for muscle in avoid_muscles:
+        mask &= ~tag_mask(f"muscle:{muscle.lower()}")
+    if max_difficulty is not None:
+        for difficulty in range(max_difficulty + 1, ADVANCED + 1):
+            mask &= ~tag_mask(f"difficulty:{difficulty}")
+    return mask
+
+
+class ExerciseIds(collections.abc.Sequence):
+    """An immutable sequence of exercises, stored as an array of their ids.
+
+    Indexing returns the `Exercise` objects, so it can be used wherever a list
+    of exercises is expected.
+    """
+
+    __slots__ = ("ids",)
+
+    def __init__(self, exercises=()):
+        self.ids = array.array("I", (exercise.id for exercise in exercises))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ExerciseIds(EXERCISES[i] for i in self.ids[index])
+        return EXERCISES[self.ids[index]]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def select(self, bitmap):
+        """Returns the exercises whose bit is set in a bitmap, as `ExerciseIds`.
+
+        Args:
+            bitmap: `bytes` from `to_bitmap`.
+
+        Returns:
+            `self` if every exercise is selected.
+        """
+        selected = [i for i in self.ids if bitmap[i >> 3] >> (i & 7) & 1]
+        if len(selected) == len(self.ids):
+            return self
+        return ExerciseIds(EXERCISES[i] for i in selected)
+
+    def __eq__(self, other):
+        return isinstance(other, ExerciseIds) and self.ids == other.ids
+
+    def __hash__(self):
+        return hash(self.ids.tobytes())
+
+    def __reduce__(self):
+        return (ExerciseIds, (list(self),))
+
+    def __repr__(self):
+        return f"ExerciseIds({list(self)!r})"
+
+
 # Exercise Definitions
 BenchPress = Exercise(
     "Bench Press",
-    "https://www.youtube.com/watch?v=UaOwz6DNdjw")
+    "https://www.youtube.com/watch?v=UaOwz6DNdjw",
+    equipment=("barbell", "bench", "rack"),
+    muscles=("chest", "triceps", "shoulders"),
+    difficulty=INTERMEDIATE)
 
 BarbellFloorPress = Exercise(
     "Barbell floor press",
-    "https://www.youtube.com/watch?v=9vYCwtHkWgI")
+    "https://www.youtube.com/watch?v=9vYCwtHkWgI",
+    equipment=("barbell",),
+    muscles=("chest", "triceps"),
+    difficulty=INTERMEDIATE)
 
 InclineBarbellBenchPress = Exercise(
     "Incline barbell bench press (regular grip or close grip)",
-    "https://www.youtube.com/watch?v=11gY7Q5D5wo")
+    "https://www.youtube.com/watch?v=11gY7Q5D5wo",
+    equipment=("barbell", "bench", "rack"),
+    muscles=("chest", "shoulders"),
+    difficulty=INTERMEDIATE)
 
 WeightedChinUps = Exercise(
     "Weighted chin-ups",
-    "https://www.youtube.com/watch?v=7FiR9W_gVF0")
+    "https://www.youtube.com/watch?v=7FiR9W_gVF0",
+    equipment=("pull-up bar", "dip belt"),
+    muscles=("back", "biceps"),
+    difficulty=ADVANCED)
 
 FlatDBBenchPress = Exercise(
     "Flat DB bench press (palms in or out)",
-    "https://www.youtube.com/watch?v=omGiL5h2R_I")
+    "https://www.youtube.com/watch?v=omGiL5h2R_I",
+    equipment=("dumbbell", "bench"),
+    muscles=("chest",),
+    difficulty=BEGINNER)
 
 InclineDBBenchPress = Exercise(
     "Incline DB bench press (palms in or out)",
-    "https://www.youtube.com/watch?v=0G2_XV7slIg")
+    "https://www.youtube.com/watch?v=0G2_XV7slIg",
+    equipment=("dumbbell", "bench"),
+    muscles=("chest", "shoulders"),
+    difficulty=BEGINNER)
 
 DBFloorPress = Exercise(
     "DB floor press (palms in)",
-    "https://www.youtube.com/watch?v=A2dfGvoykPc")
+    "https://www.youtube.com/watch?v=A2dfGvoykPc",
+    equipment=("dumbbell",),
+    muscles=("chest", "triceps"),
+    difficulty=BEGINNER)
 
 DBRows = Exercise(
     "DB rows",
-    "https://www.youtube.com/watch?v=PgpQ4-jHiq4")
+    "https://www.youtube.com/watch?v=PgpQ4-jHiq4",
+    equipment=("dumbbell", "bench"),
+    muscles=("back",),
+    difficulty=BEGINNER)
 
 BarbellRows = Exercise(
     "Barbell rows",
-    "https://www.youtube.com/watch?v=I-qgwlP0J90")
+    "https://www.youtube.com/watch?v=I-qgwlP0J90",
+    equipment=("barbell",),
+    muscles=("back",),
+    difficulty=INTERMEDIATE)
 
 SeatedCableRows = Exercise(
     "Seated cable rows (various bars)",
-    "https://www.youtube.com/watch?v=a8qvJ2VDd9g")
+    "https://www.youtube.com/watch?v=a8qvJ2VDd9g",
+    equipment=("cable",),
+    muscles=("back",),
+    difficulty=BEGINNER)
 
 TBarRows = Exercise(
     "T-bar rows",
-    "https://www.youtube.com/watch?v=KDEl3AmZbVE")
+    "https://www.youtube.com/watch?v=KDEl3AmZbVE",
+    equipment=("t-bar",),
+    muscles=("back",),
+    difficulty=INTERMEDIATE)
 
 ChestSupportedRows = Exercise(
     "Chest supported rows",
-    "https://www.youtube.com/watch?v=H75im9fAUMc")
+    "https://www.youtube.com/watch?v=H75im9fAUMc",
+    equipment=("dumbbell", "bench"),
+    muscles=("back",),
+    difficulty=BEGINNER)
 
 RearDeltFlyes = Exercise(
     "Rear delt flyes",
-    "https://www.youtube.com/watch?v=0GSu6Z-Oj7U")
+    "https://www.youtube.com/watch?v=0GSu6Z-Oj7U",
+    equipment=("dumbbell",),
+    muscles=("shoulders",),
+    difficulty=BEGINNER)
 
 Scarecrows = Exercise(
     "Scarecrows",
-    "https://www.youtube.com/watch?v=YakiNOaMMAA")
+    "https://www.youtube.com/watch?v=YakiNOaMMAA",
+    equipment=("dumbbell",),
+    muscles=("shoulders",),
+    difficulty=BEGINNER)
 
 FacePulls = Exercise(
     "Face pulls",
-    "https://www.youtube.com/watch?v=rep-qVOkqgk")
+    "https://www.youtube.com/watch?v=rep-qVOkqgk",
+    equipment=("cable",),
+    muscles=("shoulders",),
+    difficulty=BEGINNER)
 
 SeatedDBPowerCleans = Exercise(
     "Seated DB 'power cleans'",
-    "https://www.youtube.com/watch?v=kvVEz-tBgvg")
+    "https://www.youtube.com/watch?v=kvVEz-tBgvg",
+    equipment=("dumbbell", "bench"),
+    muscles=("shoulders",),
+    difficulty=INTERMEDIATE)
 
 BandPullAparts = Exercise(
     "Band pull-aparts",
-    "https://www.youtube.com/watch?v=fo3ogdhMFLo")
+    "https://www.youtube.com/watch?v=fo3ogdhMFLo",
+    equipment=("band",),
+    muscles=("shoulders",),
+    difficulty=BEGINNER)
 
 DBShrugs = Exercise(
     "DB shrugs",
-    "https://www.youtube.com/watch?v=g6qbq4Lf1FI")
+    "https://www.youtube.com/watch?v=g6qbq4Lf1FI",
+    equipment=("dumbbell",),
+    muscles=("traps",),
+    difficulty=BEGINNER)
 
 BarbellShrugs = Exercise(
     "Barbell shrugs",
-    "https://www.youtube.com/watch?v=NAqCVe2mwzM")
+    "https://www.youtube.com/watch?v=NAqCVe2mwzM",
+    equipment=("barbell",),
+    muscles=("traps",),
+    difficulty=BEGINNER)
 
 BarbellCurls = Exercise(
     "Barbell curls (regular or thick bar)",
-    "https://www.youtube.com/watch?v=kwG2ipFRgfo")
+    "https://www.youtube.com/watch?v=kwG2ipFRgfo",
+    equipment=("barbell",),
+    muscles=("biceps",),
+    difficulty=BEGINNER)
 
 StandingDBCurls = Exercise(
     "DB curls (standing)",
-    "https://www.youtube.com/watch?v=av7-8igSXTs")
+    "https://www.youtube.com/watch?v=av7-8igSXTs",
+    equipment=("dumbbell",),
+    muscles=("biceps",),
+    difficulty=BEGINNER)
 
 SeatedInclineDBCurls = Exercise(
     "Seated incline DB curls",
-    "https://www.youtube.com/watch?v=soxrZlIl35U")
+    "https://www.youtube.com/watch?v=soxrZlIl35U",
+    equipment=("dumbbell", "bench"),
+    muscles=("biceps",),
+    difficulty=BEGINNER)
 
 HammerCurls = Exercise(
     "Hammer curls",
-    "https://www.youtube.com/watch?v=TwD-YGVP4Bk")
+    "https://www.youtube.com/watch?v=TwD-YGVP4Bk",
+    equipment=("dumbbell",),
+    muscles=("biceps",),
+    difficulty=BEGINNER)
 
 ZottmanCurls = Exercise(
     "Zottmann curls",
-    "https://www.youtube.com/watch?v=FSGDM9-dZ9w")
+    "https://www.youtube.com/watch?v=FSGDM9-dZ9w",
+    equipment=("dumbbell",),
+    muscles=("biceps",),
+    difficulty=BEGINNER)
 
 IsoHoldDBCurls = Exercise(
     "Iso-hold DB curls",
-    "https://www.youtube.com/watch?v=ooXEcYEdyGo")
+    "https://www.youtube.com/watch?v=ooXEcYEdyGo",
+    equipment=("dumbbell",),
+    muscles=("biceps",),
+    difficulty=INTERMEDIATE)
 
 BoxJumps = Exercise(
     "Box jumps",
-    "http://www.youtube.com/watch?v=VK11KovyaP8&mode=related&search=")
+    "http://www.youtube.com/watch?v=VK11KovyaP8&mode=related&search=",
+    equipment=("box",),
+    muscles=("quads", "glutes"),
+    difficulty=INTERMEDIATE)
 
 VerticalJumps = Exercise(
     "Vertical jumps",
-    "https://youtu.be/RgboWFzSUKo?t=46")
+    "https://youtu.be/RgboWFzSUKo?t=46",
+    equipment=(),
+    muscles=("quads", "glutes"),
+    difficulty=BEGINNER)
 
 BroadJumps = Exercise(
     "Broad jumps",
-    "https://youtu.be/P0N68OQDhNs?t=95")
+    "https://youtu.be/P0N68OQDhNs?t=95",
+    equipment=(),
+    muscles=("quads", "glutes", "hamstrings"),
+    difficulty=BEGINNER)
 
 HurdleHops = Exercise(
     "Hurdle hops (jump over hurdle and land on ground)",
-    "https://youtu.be/0H_fXWTUSiY?t=49")
+    "https://youtu.be/0H_fXWTUSiY?t=49",
+    equipment=("hurdle",),
+    muscles=("quads", "glutes"),
+    difficulty=INTERMEDIATE)
 
 BoxSquatIntoBoxJump = Exercise(
     "Box squat into box jump",
-    "http://www.youtube.com/watch?v=9PEdhxELbDQ")
+    "http://www.youtube.com/watch?v=9PEdhxELbDQ",
+    equipment=("box",),
+    muscles=("quads", "glutes"),
+    difficulty=ADVANCED)
 
 DepthJumps = Exercise(
     "Depth jumps (onto box)",
-    "http://www.youtube.com/watch?v=S6664b4UrGs")
+    "http://www.youtube.com/watch?v=S6664b4UrGs",
+    equipment=("box",),
+    muscles=("quads", "glutes"),
+    difficulty=ADVANCED)
 
 BulgarianSplitSquats = Exercise(
     "Bulgarian split squats, front leg elevated (holding DB's or with a barbell)",
-    "http://www.youtube.com/watch?v=RZlodHgCipk")
+    "http://www.youtube.com/watch?v=RZlodHgCipk",
+    equipment=("dumbbell", "bench"),
+    muscles=("quads", "glutes"),
+    difficulty=INTERMEDIATE)
 
 BarbellReverseLunge = Exercise(
     "Barbell reverse lunge, front foot elevated",
-    "https://www.youtube.com/watch?v=zJkMQPZiwAc")
+    "https://www.youtube.com/watch?v=zJkMQPZiwAc",
+    equipment=("barbell", "rack"),
+    muscles=("quads", "glutes"),
+    difficulty=INTERMEDIATE)
 
 BarbellReverseLungeKneeLift = Exercise(
     "Barbell reverse lunge with knee lift (front foot elevated)",
-    "https://www.youtube.com/watch?v=jU9y6hvJ40o")
+    "https://www.youtube.com/watch?v=jU9y6hvJ40o",
+    equipment=("barbell", "rack"),
+    muscles=("quads", "glutes"),
+    difficulty=ADVANCED)
 
 StepUps = Exercise(
     "Step-ups (box height slightly above knee)",
-    "https://www.youtube.com/watch?v=sZsmorjSzBM")
+    "https://www.youtube.com/watch?v=sZsmorjSzBM",
+    equipment=("box",),
+    muscles=("quads", "glutes"),
+    difficulty=BEGINNER)
 
 FortyFiveDegreeHyperextensions = Exercise(
     "45-degree hyperextensions",
-    "https://www.youtube.com/watch?v=ry45nfO-PAU")
+    "https://www.youtube.com/watch?v=ry45nfO-PAU",
+    equipment=("hyperextension bench",),
+    muscles=("lower back", "hamstrings", "glutes"),
+    difficulty=BEGINNER)
 
 ReverseHyperextensions = Exercise(
     "Reverse hyperextensions",
-    "https://www.youtube.com/watch?v=3d9_W--eUcI")
+    "https://www.youtube.com/watch?v=3d9_W--eUcI",
+    equipment=("reverse hyper",),
+    muscles=("lower back", "hamstrings", "glutes"),
+    difficulty=INTERMEDIATE)
 
 PullThroughs = Exercise(
     "Pull-throughs",
-    "https://www.youtube.com/watch?v=DbSF7ipBh5Y")
+    "https://www.youtube.com/watch?v=DbSF7ipBh5Y",
+    equipment=("cable",),
+    muscles=("hamstrings", "glutes"),
+    difficulty=BEGINNER)
 
 SwissBallBackBridgeLegCurl = Exercise(
     "Swiss ball back bridge + leg curl",
-    "https://www.youtube.com/watch?v=65W4XfSzP8U")
+    "https://www.youtube.com/watch?v=65W4XfSzP8U",
+    equipment=("swiss ball",),
+    muscles=("hamstrings", "glutes"),
+    difficulty=BEGINNER)
 
 GluteHamRaise = Exercise(
     "Glute-ham raises",
-    "https://www.youtube.com/watch?v=vSOCqsr1wlg")
+    "https://www.youtube.com/watch?v=vSOCqsr1wlg",
+    equipment=("glute-ham bench",),
+    muscles=("hamstrings", "glutes"),
+    difficulty=ADVANCED)
 
 RomanianDeadlift = Exercise(
     "Romanian deadlift",
-    "https://www.youtube.com/watch?v=2SHsk9AzdjA")
+    "https://www.youtube.com/watch?v=2SHsk9AzdjA",
+    equipment=("barbell",),
+    muscles=("hamstrings", "glutes", "lower back"),
+    difficulty=INTERMEDIATE)
 
 DBSideBends = Exercise(
     "DB side bends",
-    "https://www.youtube.com/watch?v=dL9ZzqtQI5c")
+    "https://www.youtube.com/watch?v=dL9ZzqtQI5c",
+    equipment=("dumbbell",),
+    muscles=("obliques",),
+    difficulty=BEGINNER)
 
 OffsetBarbellSideBends = Exercise(
     "Offset barbell side bends",
-    "https://www.youtube.com/watch?v=1uI-7cwf9Tw")
+    "https://www.youtube.com/watch?v=1uI-7cwf9Tw",
+    equipment=("barbell",),
+    muscles=("obliques",),
+    difficulty=INTERMEDIATE)
 
 BarbellRussianTwists = Exercise(
     "Barbell Russian twists",
-    "https://www.youtube.com/watch?v=TImmxdzX0gk")
+    "https://www.youtube.com/watch?v=TImmxdzX0gk",
+    equipment=("barbell",),
+    muscles=("obliques", "abs"),
+    difficulty=INTERMEDIATE)
 
 LowCablePullIns = Exercise(
     "Low cable or band pull-ins",
-    "https://www.youtube.com/watch?v=sKtxdAgznB4")
+    "https://www.youtube.com/watch?v=sKtxdAgznB4",
+    equipment=("band",),
+    muscles=("abs",),
+    difficulty=BEGINNER)
 
 HangingLegRaises = Exercise(
     "Hanging leg raises",
-    "https://www.youtube.com/watch?v=arWjJtMsqvA")
+    "https://www.youtube.com/watch?v=arWjJtMsqvA",
+    equipment=("pull-up bar",),
+    muscles=("abs",),
+    difficulty=INTERMEDIATE)
 
 WeightedSwissBallCrunches = Exercise(
     "Weighted Swiss ball crunches",
-    "https://www.youtube.com/watch?v=Xdqgs6wK8eY")
+    "https://www.youtube.com/watch?v=Xdqgs6wK8eY",
+    equipment=("swiss ball", "dumbbell"),
+    muscles=("abs",),
+    difficulty=BEGINNER)
 
 SpreadEagleSitUps = Exercise(
     "Spread-eagle sit-ups (holding DB over chest)",
-    "https://www.youtube.com/watch?v=kuMlr3Lkd8A")
+    "https://www.youtube.com/watch?v=kuMlr3Lkd8A",
+    equipment=("dumbbell",),
+    muscles=("abs",),
+    difficulty=BEGINNER)
 
 StandingSitUps = Exercise(
     "Standing sit-ups (using a band or a high pulley)",
-    "https://www.youtube.com/watch?v=ij3lWMnoFzA")
+    "https://www.youtube.com/watch?v=ij3lWMnoFzA",
+    equipment=("band",),
+    muscles=("abs",),
+    difficulty=BEGINNER)
 
 DBBenchPressOnSwissBall = Exercise(
     "DB bench press on Swiss ball (palms in or out)",
-    "https://www.youtube.com/watch?v=uxgA5qEi2mc")
+    "https://www.youtube.com/watch?v=uxgA5qEi2mc",
+    equipment=("dumbbell", "swiss ball"),
+    muscles=("chest",),
+    difficulty=BEGINNER)
 
 PushUpVariations = Exercise(
     "Push-up variations (choose 1 and do it)",
-    "https://www.youtube.com/watch?v=FU_5LPjtjus")
+    "https://www.youtube.com/watch?v=FU_5LPjtjus",
+    equipment=(),
+    muscles=("chest", "triceps"),
+    difficulty=BEGINNER)
 
 ChinUpVariations = Exercise(
     "Chin-up variations (choose 1 and do it)",
-    "https://www.youtube.com/watch?v=zaJQtvKkl6g")
+    "https://www.youtube.com/watch?v=zaJQtvKkl6g",
+    equipment=("pull-up bar",),
+    muscles=("back", "biceps"),
+    difficulty=INTERMEDIATE)
 
 BarbellBenchPress = Exercise(
     "Barbell bench press (55-60% of 1RM)",
-    "http://www.youtube.com/watch?v=E-kNUEv0YgA")
+    "http://www.youtube.com/watch?v=E-kNUEv0YgA",
+    equipment=("barbell", "bench", "rack"),
+    muscles=("chest", "triceps"),
+    difficulty=INTERMEDIATE)
 
 LatPulldowns = Exercise(
     "Lat pulldowns (various bars)",
-    "https://www.youtube.com/watch?v=84oCEetzdS4")
+    "https://www.youtube.com/watch?v=84oCEetzdS4",
+    equipment=("cable",),
+    muscles=("back",),
+    difficulty=BEGINNER)
 
 StraightArmPulldowns = Exercise(
     "Straight arm pulldowns",
-    "https://www.youtube.com/watch?v=n3O1jkQyXC4")
+    "https://www.youtube.com/watch?v=n3O1jkQyXC4",
+    equipment=("cable",),
+    muscles=("back",),
+    difficulty=BEGINNER)
 
 DBLateralRaises = Exercise(
     "DB lateral raises",
-    "https://www.youtube.com/watch?v=geenhiHju-o")
+    "https://www.youtube.com/watch?v=geenhiHju-o",
+    equipment=("dumbbell",),
+    muscles=("shoulders",),
+    difficulty=BEGINNER)
 
 LLateralRaises = Exercise(
     "L-lateral raises",
-    "https://www.youtube.com/watch?v=bXC7eL0H7AA")
+    "https://www.youtube.com/watch?v=bXC7eL0H7AA",
+    equipment=("dumbbell",),
+    muscles=("shoulders",),
+    difficulty=BEGINNER)
 
 CableLateralRaises = Exercise(
     "Cable lateral raises",
-    "https://www.youtube.com/watch?v=IVBacQ0Q3Bw")
+    "https://www.youtube.com/watch?v=IVBacQ0Q3Bw",
+    equipment=("cable",),
+    muscles=("shoulders",),
+    difficulty=BEGINNER)
 
 DBMilitaryPress = Exercise(
     "DB military press",
-    "https://www.youtube.com/watch?v=qEwKCR5JCog")
+    "https://www.youtube.com/watch?v=qEwKCR5JCog",
+    equipment=("dumbbell",),
+    muscles=("shoulders", "triceps"),
+    difficulty=BEGINNER)
 
 DBSidePress = Exercise(
     "DB side press",
-    "https://www.youtube.com/watch?v=Eyd-e7J3zFI")
+    "https://www.youtube.com/watch?v=Eyd-e7J3zFI",
+    equipment=("dumbbell",),
+    muscles=("shoulders",),
+    difficulty=BEGINNER)
 
 BoxSquats = Exercise(
     "Box squats (regular bar, safety squat bar, cambered bar, buffalo bar)",
-    "http://www.youtube.com/watch?v=paAR3wjFFks")
+    "http://www.youtube.com/watch?v=paAR3wjFFks",
+    equipment=("barbell", "rack", "box"),
+    muscles=("quads", "glutes", "hamstrings"),
+    difficulty=ADVANCED)
 
 FreeSquats = Exercise(
     "Free squats (regular bar, safety squat bar, cambered bar, buffalo bar)",
-    "http://www.youtube.com/watch?v=7IkyiekPIrg&NR=1",)
+    "http://www.youtube.com/watch?v=7IkyiekPIrg&NR=1",
+    equipment=("barbell", "rack"),
+    muscles=("quads", "glutes"),
+    difficulty=ADVANCED)
 
 StraightBarDeadlifts = Exercise(
     "Straight bar deadlifts",
-    "https://www.youtube.com/watch?v=L0vuwx9Q9VI")
+    "https://www.youtube.com/watch?v=L0vuwx9Q9VI",
+    equipment=("barbell",),
+    muscles=("hamstrings", "glutes", "lower back"),
+    difficulty=ADVANCED)
 
 RackPulls = Exercise(
     "Rack pulls",
-    "https://www.youtube.com/watch?v=e11lVmLsvFU")
+    "https://www.youtube.com/watch?v=e11lVmLsvFU",
+    equipment=("barbell", "rack"),
+    muscles=("lower back", "glutes", "traps"),
+    difficulty=INTERMEDIATE)
 
 AbdominalCircuit = Exercise(
     "Abdominal circuit",
-    "https://www.youtube.com/watch?v=izDf0MCR2DU")
+    "https://www.youtube.com/watch?v=izDf0MCR2DU",
+    equipment=(),
+    muscles=("abs",),
+    difficulty=BEGINNER)
 
 ReverseLungeVariations = Exercise(
     "Reverse lunge variations",
-    "https://www.youtube.com/watch?v=k_KoxW5Kpus")
+    "https://www.youtube.com/watch?v=k_KoxW5Kpus",
+    equipment=(),
+    muscles=("quads", "glutes"),
+    difficulty=BEGINNER)
 
 StepUpVariations = Exercise(
     "Step up variations",
-    "https://www.youtube.com/watch?v=dQqApCGd5Ss")
+    "https://www.youtube.com/watch?v=dQqApCGd5Ss",
+    equipment=("box",),
+    muscles=("quads", "glutes"),
+    difficulty=BEGINNER)
@@ -0,0 +1,254 @@
+"""
+Exports a program laid out over a date range, as an ICS calendar, static html
+pages or JSON lines.
+
+Workout days are rendered across a process pool in chunks and written as they
+come back, in date order, so memory stays flat however long the range is.
+Exercises are picked with `selection.HashPicker`, so exporting a range again
+gives the same workouts, and with `--recipient` they are the ones that
+recipient is sent:
+
+    python globo/export.py ics --program WS4SB --start 2021-03-01 --end 2021-12-31 --output ws4sb.ics
+    python globo/export.py html --program WS4SB --days 365 --output ws4sb/
+    python globo/export.py jsonl --program WS4SB --days 90 --recipient someone@email.com
+"""
+import argparse
+import contextlib
+import datetime
+import hashlib
+import html
+import json
+import os
+import sys
+
+import catalog
+import personalize
+import recipients as recipient_list
+import selection
+import templates
+import workout_program
+
+# Longest ICS content line, in octets, before it's folded.
+ICS_LINE_OCTETS = 75
+
+
+def workout_days(program_name, start, end):
+    """Yields the workout days of a program from `start` to `end`, inclusive, lazily."""
+    program = workout_program.PROGRAMS[program_name]
+    date = start
+    while date <= end:
+        if date.weekday() in program:
+            yield date
+        date += datetime.timedelta(days=1)
+
+
+def _render_days(dates, program_name, recipient, profile, formats):
+    program = workout_program.PROGRAMS[program_name]
+    return [(program[date.weekday()].name,
+             personalize.render_keyed(program_name, date, recipient, profile=profile, formats=formats)[1])
+            for date in dates]
+
+
+def render_days(program_name, dates, recipient="", profile=None, formats=(templates.HTML,), workers=None,
+                chunk_size=64, catalog_path=None, executor=None):
+    """Renders a program's workouts for many days in parallel.
+
+    Dates are consumed lazily and sent to worker processes in chunks, and
+    only a few chunks per worker are in flight at a time.
+
+    Args:
+        program_name: `string` A key of `workout_program.PROGRAMS`.
+        dates: An iterable of workout days, e.g. from `workout_days`.
+        recipient: `string` The recipient whose workouts to render. The
+            default, empty recipient gives a stable layout for anyone.
+        profile: `selection.Profile` Optional constraints on the exercises.
+        formats: Names of formats in `templates.WRITERS` to render.
+        workers: `int` Number of worker processes. Defaults to the CPU count.
+        chunk_size: `int` Days rendered per task.
+        catalog_path: `string` Optional catalog file that defines the program.
+        executor: An executor from `personalize.worker_pool` to reuse.
+
+    Yields:
+        `(date, workout name, bodies)` tuples in date order, where `bodies`
+        has a `string` per format.
+    """
+    for chunk, rendered in personalize.map_chunks(
+            _render_days, dates, program_name, recipient, profile, formats,
+            workers=workers, chunk_size=chunk_size, catalog_path=catalog_path, executor=executor):
+        for date, (name, bodies) in zip(chunk, rendered):
+            yield date, name, bodies
+
+
+def _ics_text(value):
+    return (value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _ics_fold(line):
+    # Content lines are folded at 75 octets, never inside a UTF-8 sequence.
+    if len(line.encode("utf-8")) <= ICS_LINE_OCTETS:
+        return line + "\r\n"
+    lines, current, octets = [], [], 0
+    for char in line:
+        size = len(char.encode("utf-8"))
+        # Continuation lines start with a space, which counts.
+        if octets + size > ICS_LINE_OCTETS - (1 if lines else 0):
+            lines.append("".join(current))
+            current, octets = [], 0
+        current.append(char)
+        octets += size
+    lines.append("".join(current))
+    return "\r\n ".join(lines) + "\r\n"
+
+
+class IcsExport(object):
+    """Writes each workout as an all day event of one iCalendar file."""
+
+    formats = (templates.TEXT,)
+
+    def __init__(self, out, program_name, recipient=""):
+        """Constructs an IcsExport.
+
+        Args:
+            out: A text file to write to, opened with `newline=""`.
+            program_name: `string` The program being exported.
+            recipient: `string` The recipient the workouts are for, if any.
+        """
+        self.out = out
+        self.program_name = program_name
+        # Event UIDs must be unique across calendars, so each recipient gets
+        # their own.
+        self.uid_suffix = hashlib.blake2b(f"{program_name}|{recipient}".encode("utf-8"), digest_size=6).hexdigest()
+        self.stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        self._write("BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//Globo//Workout export//EN",
+                    "CALSCALE:GREGORIAN", f"X-WR-CALNAME:{_ics_text(program_name)}")
+
+    def _write(self, *lines):
+        self.out.write("".join(_ics_fold(line) for line in lines))
+
+    def add(self, date, workout_name, bodies):
+        self._write("BEGIN:VEVENT",
+                    f"UID:{date:%Y%m%d}-{self.uid_suffix}@globo",
+                    f"DTSTAMP:{self.stamp}",
+                    f"DTSTART;VALUE=DATE:{date:%Y%m%d}",
+                    f"DTEND;VALUE=DATE:{date + datetime.timedelta(days=1):%Y%m%d}",
+                    f"SUMMARY:{_ics_text(workout_name)}",
+                    f"DESCRIPTION:{_ics_text(bodies[0].rstrip())}",
+                    "END:VEVENT")
+
+    def close(self):
+        self._write("END:VCALENDAR")
+
+
+class HtmlExport(object):
+    """Writes a page per workout and an index page linking to them, to a directory."""
+
+    formats = (templates.HTML,)
+
+    def __init__(self, directory, program_name):
+        """Constructs an HtmlExport.
+
+        Args:
+            directory: `string` The directory to write to. Created if missing.
+            program_name: `string` The program being exported.
+        """
+        self.directory = directory
+        self.program_name = html.escape(program_name)
+        os.makedirs(directory, exist_ok=True)
+        self.index = open(os.path.join(directory, "index.html"), "w", encoding="utf-8")
+        self.index.write(f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{self.program_name}</title>"
+                         f"</head><body><h1>{self.program_name}</h1><ul>")
+
+    def add(self, date, workout_name, bodies):
+        page = f"{date.isoformat()}.html"
+        day = f"{date:%a} {date.isoformat()}"
+        name = html.escape(workout_name)
+        with open(os.path.join(self.directory, page), "w", encoding="utf-8") as f:
+            f.write(f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{day}: {name}</title></head>"
+                    f"<body><p><a href=\"index.html\">{self.program_name}</a>, {day}</p>{bodies[0]}</body></html>")
+        self.index.write(f"<li><a href=\"{page}\">{day}</a>: {name}</li>")
+
+    def close(self):
+        self.index.write("</ul></body></html>")
+        self.index.close()
+
+
+class JsonlExport(object):
+    """Writes a JSON line per workout with its html, plain text and Markdown."""
+
+    formats = (templates.HTML, templates.TEXT, templates.MARKDOWN)
+
+    def __init__(self, out, program_name, recipient=""):
+        """Constructs a JsonlExport.
+
+        Args:
+            out: A text file to write to.
+            program_name: `string` The program being exported.
+            recipient: `string` The recipient the workouts are for, if any.
+        """
+        self.out = out
+        self.program_name = program_name
+        self.recipient = recipient
+
+    def add(self, date, workout_name, bodies):
+        record = {"date": date.isoformat(), "program": self.program_name, "workout": workout_name}
+        if self.recipient:
+            record["recipient"] = self.recipient
+        record.update(zip(self.formats, bodies))
+        self.out.write(json.dumps(record) + "\n")
+
+    def close(self):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a workout program over a date range.")
+    parser.add_argument("format", choices=["ics", "html", "jsonl"],
+                        help="An iCalendar file, a directory of html pages, or JSON lines.")
+    parser.add_argument("--catalog", type=str, default=None, help="A catalog file defining additional programs.")
+    parser.add_argument("--program", type=str, default="WS4SB", help="The workout program name.")
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=None,
+                        help="The first day to export (YYYY-MM-DD). Defaults to today.")
+    range_group = parser.add_mutually_exclusive_group(required=True)
+    range_group.add_argument("--end", type=datetime.date.fromisoformat, help="The last day to export (YYYY-MM-DD).")
+    range_group.add_argument("--days", type=int, help="The number of days to export.")
+    parser.add_argument("--output", type=str, default="-",
+                        help="The file to write, or - for stdout. The directory to write to for html.")
+    parser.add_argument("--recipient", type=recipient_list.normalize, default="",
+                        help="Export the workouts this recipient gets with --personalize.")
+    parser.add_argument("--equipment", type=str, default=None, help="The recipient's comma separated equipment.")
+    parser.add_argument("--avoid_muscles", type=str, default=None, help="Muscle groups the recipient avoids.")
+    parser.add_argument("--max_difficulty", type=str, default=None, help="The recipient's maximum difficulty.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes to render with. Defaults to the number of CPUs.")
+    parser.add_argument("--chunk_size", type=int, default=64, help="Days rendered per task.")
+    args = parser.parse_args()
+    if args.catalog:
+        catalog.register(args.catalog)
+    if args.program not in workout_program.PROGRAMS:
+        parser.error(f"Unknown program {args.program!r}.")
+    if args.format == "html" and args.output == "-":
+        parser.error("html exports need an --output directory.")
+    start = args.start or datetime.date.today()
+    end = args.end if args.end is not None else start + datetime.timedelta(days=args.days - 1)
+    if end < start:
+        parser.error("The range ends before it starts.")
+
+    profile = selection.Profile.parse(args.equipment, args.avoid_muscles, args.max_difficulty)
+    with contextlib.ExitStack() as stack:
+        if args.format == "html":
+            exporter = HtmlExport(args.output, args.program)
+        else:
+            if args.output == "-":
+                out = sys.stdout
+            else:
+                out = stack.enter_context(open(args.output, "w", encoding="utf-8", newline=""))
+            exporter = (IcsExport if args.format == "ics" else JsonlExport)(out, args.program, args.recipient)
+        count = 0
+        for date, name, bodies in render_days(
+                args.program, workout_days(args.program, start, end), args.recipient, profile, exporter.formats,
+                args.workers, args.chunk_size, args.catalog):
+            exporter.add(date, name, bodies)
+            count += 1
+        exporter.close()
+    print(f"Exported {count} {args.program} workouts from {start} to {end}", file=sys.stderr)
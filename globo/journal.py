@@ -0,0 +1,84 @@
+"""
+Append-only record of completed deliveries, so an interrupted run can resume.
+"""
+import datetime
+import sqlite3
+
+
+class DeliveryJournal(object):
+    """A SQLite journal of (day, workout, recipient) deliveries.
+
+    The journal uses write-ahead logging and commits after every record, so a
+    delivery that has been recorded survives the process being killed.
+    """
+
+    def __init__(self, path):
+        """Opens (or creates) a journal.
+
+        Args:
+            path: `string` Path to the SQLite database file.
+        """
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS deliveries ("
+            " day TEXT NOT NULL,"
+            " workout TEXT NOT NULL,"
+            " recipient TEXT NOT NULL,"
+            " sent_at TEXT NOT NULL,"
+            " PRIMARY KEY (day, workout, recipient)"
+            ") WITHOUT ROWID")
+        self.db.commit()
+
+    def delivered(self, day, workout):
+        """Returns the `set` of recipients already sent `workout` on `day`.
+
+        Args:
+            day: `date` The delivery day.
+            workout: `string` The workout name.
+        """
+        rows = self.db.execute(
+            "SELECT recipient FROM deliveries WHERE day = ? AND workout = ?",
+            (day.isoformat(), workout))
+        return {recipient for recipient, in rows}
+
+    def pending(self, day, workout, recipients):
+        """Filters out recipients that have already been sent `workout` on `day`.
+
+        Args:
+            day: `date` The delivery day.
+            workout: `string` The workout name.
+            recipients: An iterable of recipient addresses, consumed lazily.
+
+        Yields:
+            Recipient addresses that still need the email.
+        """
+        done = self.delivered(day, workout)
+        for recipient in recipients:
+            if recipient not in done:
+                yield recipient
+
+    def record(self, day, workout, recipients):
+        """Marks recipients as delivered.
+
+        Args:
+            day: `date` The delivery day.
+            workout: `string` The workout name.
+            recipients: An iterable of recipient addresses.
+        """
+        sent_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self.db.executemany(
+            "INSERT OR IGNORE INTO deliveries VALUES (?, ?, ?, ?)",
+            ((day.isoformat(), workout, recipient, sent_at) for recipient in recipients))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
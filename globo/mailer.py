@@ -0,0 +1,523 @@
+"""
+Pooled, concurrent SMTP delivery.
+"""
+import collections
+import concurrent.futures
+import contextlib
+import itertools
+import queue
+import smtplib
+import ssl
+import threading
+import time
+from email import policy
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+
+import metrics
+import ratelimit
+
+GMAIL_HOST = "smtp.gmail.com"
+GMAIL_PORT = 465
+
+SECURITY_SSL = "ssl"
+SECURITY_STARTTLS = "starttls"
+SECURITY_NONE = "none"
+
+# Errors that mean the connection itself is no longer usable.
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+# Consecutive failed connects after which the server is considered
+# unreachable. At most `DeliveryEngine` retries + 1, so a dead server trips the
+# pool before any message gives up on it.
+MAX_CONNECT_FAILURES = 3
+
+# To header for messages whose recipients are only in the envelope.
+UNDISCLOSED_RECIPIENTS = "undisclosed-recipients:;"
+
+# `recipients` were sent the message, or all failed with `error`. `refused`
+# maps any recipients the server refused while accepting the others to their
+# `(code, message)`.
+DeliveryResult = collections.namedtuple("DeliveryResult", ["recipients", "error", "refused"], defaults=((),))
+
+
+class ConnectFailed(ConnectionError):
+    """Raised when a new connection can't be opened. Sends retry it like a dropped connection."""
+
+
+class SMTPUnavailable(Exception):
+    """Raised when the login is rejected or the server stays unreachable, so nothing can be sent."""
+
+
+def _set_body(message, html, text=None):
+    if text is None:
+        message.set_content(html, subtype="html")
+    else:
+        # Clients show the last alternative they support, so html goes last.
+        message.set_content(text)
+        message.add_alternative(html, subtype="html")
+
+
+def build_message(sender, recipient, subject, html, text=None):
+    """Builds an html email message.
+
+    Args:
+        sender: `string` The From address.
+        recipient: `string` The To address.
+        subject: `string` The subject line.
+        html: `string` The html body.
+        text: `string` Optional plain text version of the body. If given,
+            the message is multipart/alternative.
+
+    Returns:
+        An `EmailMessage`.
+    """
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = recipient
+    message["Subject"] = subject
+    message["Date"] = formatdate(localtime=True)
+    message["Message-ID"] = make_msgid()
+    _set_body(message, html, text)
+    return message
+
+
+def encode_body(html, text=None):
+    """Encodes a body once so it can be shared by many messages.
+
+    Args:
+        html: `string` The html body.
+        text: `string` Optional plain text version of the body. If given,
+            the body is multipart/alternative.
+
+    Returns:
+        `bytes` holding the MIME content headers, a blank line and the
+        encoded body.
+    """
+    with metrics.timer("encode_body"):
+        message = EmailMessage(policy=policy.SMTP)
+        _set_body(message, html, text)
+        return message.as_bytes()
+
+
+def build_payload(sender, recipient, subject, body):
+    """Builds a ready to send message around a body from `encode_body`.
+
+    Only the per-recipient headers are serialized, the body is reused as is.
+
+    Args:
+        sender: `string` The From address.
+        recipient: `string` The To address.
+        subject: `string` The subject line.
+        body: `bytes` An encoded body from `encode_body`.
+
+    Returns:
+        The message as `bytes`.
+    """
+    with metrics.timer("mime_build"):
+        headers = EmailMessage(policy=policy.SMTP)
+        headers["From"] = sender
+        headers["To"] = recipient
+        headers["Subject"] = subject
+        headers["Date"] = formatdate(localtime=True)
+        headers["Message-ID"] = make_msgid()
+        # Drop the blank line that ends the (empty) header-only message.
+        return headers.as_bytes()[:-2] + body
+
+
+def encode_message(message):
+    """Serializes a message once so it can be sent many times without re-encoding.
+
+    Args:
+        message: `EmailMessage` The message to encode.
+
+    Returns:
+        The message as `bytes` with CRLF line endings, ready for DATA.
+    """
+    with metrics.timer("mime_build"):
+        return message.as_bytes(policy=policy.SMTP)
+
+
+def chunked(iterable, size):
+    """Splits an iterable into lists of at most `size` items.
+
+    Args:
+        iterable: Any iterable, consumed lazily.
+        size: `int` The maximum chunk size.
+
+    Yields:
+        A `list` per chunk.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def batch_jobs(payload, recipients, chunk_size):
+    """Sends one pre-encoded payload to many recipients, `chunk_size` per envelope.
+
+    The payload should be addressed to `UNDISCLOSED_RECIPIENTS` so recipients
+    stay hidden from each other; they only appear as RCPT TO in the envelope.
+
+    Args:
+        payload: `bytes` A message from `encode_message`.
+        recipients: An iterable of recipient addresses.
+        chunk_size: `int` Maximum recipients per envelope.
+
+    Yields:
+        `(payload, recipients)` jobs for `DeliveryEngine.deliver`.
+    """
+    for chunk in chunked(recipients, chunk_size):
+        yield payload, chunk
+
+
+class SMTPConnection(object):
+    """A single authenticated connection to an SMTP server."""
+
+    def __init__(self, host, port, username=None, password=None,
+                 security=SECURITY_SSL, timeout=30):
+        """Constructs an SMTPConnection. The connection is opened lazily.
+
+        Args:
+            host: `string` The SMTP server host.
+            port: `int` The SMTP server port.
+            username: `string` The login user, also used as the envelope sender.
+            password: `string` The login password. No login is done if omitted.
+            security: `string` One of `ssl`, `starttls` or `none`.
+            timeout: `int` Socket timeout in seconds.
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.security = security
+        self.timeout = timeout
+
+        self.smtp = None
+        self.sent = 0
+
+    def open(self):
+        """Connects and logs in to the server."""
+        with metrics.timer("smtp_connect"):
+            if self.security == SECURITY_SSL:
+                smtp = smtplib.SMTP_SSL(
+                    self.host, self.port, timeout=self.timeout,
+                    context=ssl.create_default_context())
+            else:
+                smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                if self.security == SECURITY_STARTTLS:
+                    smtp.starttls(context=ssl.create_default_context())
+                if self.password is not None:
+                    smtp.login(self.username, self.password)
+            except BaseException:
+                smtp.close()
+                raise
+        self.smtp = smtp
+        self.sent = 0
+
+    def send(self, message, recipients):
+        """Sends a message to the given envelope recipients.
+
+        Args:
+            message: `EmailMessage` The message to send, or `bytes` from
+                `encode_message`.
+            recipients: `list` Envelope recipient addresses.
+
+        Returns:
+            A `dict` of the recipients the server refused, if it accepted
+            others, to their `(code, message)`.
+        """
+        if self.smtp is None:
+            self.open()
+        with metrics.timer("smtp_send"):
+            if isinstance(message, bytes):
+                refused = self.smtp.sendmail(self.username, recipients, message)
+            else:
+                refused = self.smtp.send_message(message, from_addr=self.username, to_addrs=recipients)
+        self.sent += 1
+        return refused
+
+    def close(self):
+        """Closes the connection, ignoring errors from an already dead socket."""
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+        self.smtp = None
+
+
+class ConnectionPool(object):
+    """A bounded pool of reusable `SMTPConnection` objects."""
+
+    def __init__(self, factory, size=4, max_messages_per_connection=100, idle_timeout=120,
+                 max_connect_failures=MAX_CONNECT_FAILURES):
+        """Constructs a ConnectionPool.
+
+        A rejected login, or `max_connect_failures` failed connects in a row,
+        trips the pool: `acquire` then raises `SMTPUnavailable` without
+        connecting again until `reset`.
+
+        Args:
+            factory: A callable returning a new, unopened `SMTPConnection`.
+            size: `int` The maximum number of open connections.
+            max_messages_per_connection: `int` Connections are recycled after
+                sending this many messages.
+            idle_timeout: `float` Idle connections older than this many seconds
+                are closed instead of reused, since servers drop them anyway.
+            max_connect_failures: `int` Failed connects in a row that trip
+                the pool.
+        """
+        self.factory = factory
+        self.size = size
+        self.max_messages_per_connection = max_messages_per_connection
+        self.idle_timeout = idle_timeout
+        self.max_connect_failures = max_connect_failures
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._connect_failures = 0
+        self._unavailable = None
+        self._logged_in = False
+        self._first_login = threading.Lock()
+
+    def _connect_failed(self, error):
+        with self._lock:
+            self._connect_failures += 1
+            if self._unavailable is None and (isinstance(error, smtplib.SMTPAuthenticationError)
+                                              or self._connect_failures >= self.max_connect_failures):
+                self._unavailable = SMTPUnavailable(
+                    f"Login rejected: {error}" if isinstance(error, smtplib.SMTPAuthenticationError)
+                    else f"{self._connect_failures} connects failed in a row, the last with: {error}")
+                self._unavailable.__cause__ = error
+            return self._unavailable
+
+    def reset(self):
+        """Lets a tripped pool try connecting again."""
+        with self._lock:
+            self._connect_failures = 0
+            self._unavailable = None
+
+    def acquire(self):
+        """Returns an open connection, blocking while all of them are in use.
+
+        Raises:
+            SMTPUnavailable: If the pool is tripped.
+            ConnectFailed: If a new connection can't be opened.
+        """
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    connection, released_at = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if time.monotonic() - released_at <= self.idle_timeout:
+                    return connection
+                connection.close()
+            if self._logged_in:
+                return self._open()
+            # Until a login has worked, connect one at a time so bad
+            # credentials are only tried once.
+            with self._first_login:
+                return self._open()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _open(self):
+        if self._unavailable is not None:
+            raise self._unavailable
+        try:
+            connection = self.factory()
+            connection.open()
+        except (smtplib.SMTPException, OSError) as e:
+            unavailable = self._connect_failed(e)
+            if unavailable is not None:
+                raise unavailable
+            raise ConnectFailed(f"Can't connect: {e}") from e
+        with self._lock:
+            self._connect_failures = 0
+            self._logged_in = True
+        return connection
+
+    def release(self, connection, discard=False):
+        """Returns a connection to the pool.
+
+        Args:
+            connection: `SMTPConnection` The connection from `acquire`.
+            discard: `bool` Close the connection instead of reusing it.
+        """
+        if discard or connection.sent >= self.max_messages_per_connection:
+            connection.close()
+        else:
+            self._idle.put((connection, time.monotonic()))
+        self._slots.release()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Context manager around `acquire` and `release`.
+
+        Connections that raise a connection error are discarded.
+        """
+        connection = self.acquire()
+        try:
+            yield connection
+        except CONNECTION_ERRORS:
+            self.release(connection, discard=True)
+            raise
+        except smtplib.SMTPResponseException as e:
+            # 421 means the server is closing the connection.
+            self.release(connection, discard=e.smtp_code == 421)
+            raise
+        except BaseException:
+            self.release(connection)
+            raise
+        else:
+            self.release(connection)
+
+    def close(self):
+        """Closes all idle connections."""
+        while True:
+            try:
+                self._idle.get_nowait()[0].close()
+            except queue.Empty:
+                return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class DeliveryEngine(object):
+    """Sends messages in parallel over a `ConnectionPool`."""
+
+    def __init__(self, pool, workers=None, retries=3, limiter=None):
+        """Constructs a DeliveryEngine.
+
+        Args:
+            pool: `ConnectionPool` The pool to send through.
+            workers: `int` Number of sending threads. Defaults to the pool size.
+            retries: `int` How many times a message is retried when the
+                connection drops or the server replies with a transient error.
+            limiter: `ratelimit.AdaptiveRateLimiter` Optional limiter that paces
+                sends and backs off when the server throttles.
+        """
+        self.pool = pool
+        self.workers = workers or pool.size
+        self.retries = retries
+        self.limiter = limiter
+
+    def send(self, message, recipients):
+        """Sends a single message, reconnecting if the connection drops.
+
+        The recipients are reserved from the limiter's daily budget, and
+        given back if the message fails or the server refuses some of them.
+
+        Args:
+            message: `EmailMessage` The message to send.
+            recipients: `list` Envelope recipient addresses.
+
+        Returns:
+            A `dict` of refused recipients, as from `SMTPConnection.send`.
+
+        Raises:
+            ratelimit.BudgetExhausted: If the daily budget is used up.
+            SMTPUnavailable: If the pool is tripped.
+        """
+        if self.limiter is None:
+            return self._attempt(message, recipients)
+        self.limiter.reserve(len(recipients))
+        try:
+            refused = self._attempt(message, recipients)
+        except BaseException:
+            # Nothing was sent, as far as we know.
+            self.limiter.release(len(recipients))
+            raise
+        if refused:
+            self.limiter.release(len(refused))
+        return refused
+
+    def _attempt(self, message, recipients):
+        for attempt in range(self.retries + 1):
+            if self.limiter is not None:
+                self.limiter.wait()
+            try:
+                with self.pool.connection() as connection:
+                    refused = connection.send(message, recipients)
+            except CONNECTION_ERRORS:
+                if attempt == self.retries:
+                    raise
+                metrics.count("send_retries", reason="connection")
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused) as e:
+                if attempt == self.retries or ratelimit.transient_code(e) is None:
+                    raise
+                metrics.count("send_retries", reason="throttled")
+                if self.limiter is not None:
+                    self.limiter.throttled()
+            else:
+                if self.limiter is not None:
+                    self.limiter.success()
+                return refused
+
+    def _send(self, message, recipients):
+        try:
+            refused = self.send(message, recipients)
+        except (smtplib.SMTPException, OSError, ratelimit.BudgetExhausted) as e:
+            metrics.count("send_failures", error=type(e).__name__)
+            return DeliveryResult(recipients, e)
+        if refused:
+            metrics.count("send_failures", len(refused), error="SMTPRecipientsRefused")
+            recipients = [recipient for recipient in recipients if recipient not in refused]
+        metrics.count("messages_sent")
+        metrics.count("recipients_sent", len(recipients))
+        return DeliveryResult(recipients, None, refused or {})
+
+    def deliver(self, jobs):
+        """Sends messages concurrently.
+
+        Jobs are consumed lazily so at most a few messages per worker are
+        held in memory at any time.
+
+        Args:
+            jobs: An iterable of `(message, recipients)` tuples.
+
+        Yields:
+            A `DeliveryResult` for each job, in completion order. Refused
+            recipients are left out of its `recipients`.
+
+        Raises:
+            SMTPUnavailable: If the pool trips. No more jobs are started, and
+                the results of those already sent are yielded first.
+        """
+        max_in_flight = self.workers * 2
+        jobs = iter(jobs)
+        unavailable = None
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            in_flight = set()
+            while True:
+                if unavailable is None and len(in_flight) < max_in_flight:
+                    job = next(jobs, None)
+                    if job is not None:
+                        in_flight.add(executor.submit(self._send, *job))
+                        continue
+                if not in_flight:
+                    break
+                done, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result = future.result()
+                    except SMTPUnavailable as e:
+                        unavailable = unavailable or e
+                    else:
+                        yield result
+        if unavailable is not None:
+            raise unavailable
@@ -0,0 +1,291 @@
+"""
+Timers, counters and latency histograms for the runner's hot paths.
+
+Instrumentation is off by default: the module level `timer`, `count` and
+`observe` functions then go to a registry that records nothing, so a call
+site only costs a function call. `enable` installs a recording `Metrics`
+registry, and `write` exports it as a Prometheus textfile (for node_exporter's
+textfile collector) or appends it to a JSON lines file:
+
+    with metrics.timer("render"):
+        html = workout.as_html()
+    metrics.count("messages_sent")
+"""
+import bisect
+import datetime
+import os
+import threading
+import time
+
+PREFIX = "globo_"
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram(object):
+    """Counts of observations per bucket of `BUCKETS`, plus their sum and maximum."""
+
+    __slots__ = ("counts", "sum", "max")
+
+    def __init__(self, counts=None, total=0.0, maximum=0.0):
+        self.counts = list(counts) if counts is not None else [0] * (len(BUCKETS) + 1)
+        self.sum = total
+        self.max = maximum
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """Estimates a quantile by interpolating within its bucket."""
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= target:
+                if i == len(BUCKETS):
+                    return self.max
+                lower = BUCKETS[i - 1] if i else 0.0
+                return min(lower + (BUCKETS[i] - lower) * (target - seen) / count, self.max)
+            seen += count
+        return 0.0
+
+
+class _Timer(object):
+    """Times a block into a histogram, counting the errors it raises."""
+
+    __slots__ = ("registry", "name", "labels", "start")
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None:
+            self.registry.count("errors", stage=self.name, error=exc_type.__name__)
+
+
+class _NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class NullMetrics(object):
+    """A registry that records nothing. Used while metrics are disabled."""
+
+    enabled = False
+
+    def count(self, name, value=1, **labels):
+        pass
+
+    def observe(self, name, seconds, **labels):
+        pass
+
+    def timer(self, name, **labels):
+        return _NULL_TIMER
+
+    def snapshot(self):
+        return None
+
+    def merge(self, snapshot):
+        pass
+
+
+class Metrics(object):
+    """A thread safe registry of counters and latency histograms.
+
+    Metrics are keyed by name and labels. Timers and `observe` record
+    seconds into `globo_<name>_seconds` histograms, and counters are exported
+    as `globo_<name>_total`. Timed blocks that raise also count
+    `globo_errors_total{stage=<name>, error=<exception class>}`.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def timer(self, name, **labels):
+        """Returns a context manager that times its block."""
+        return _Timer(self, name, labels)
+
+    def snapshot(self):
+        """Returns the metrics as plain, picklable data for `merge`."""
+        with self._lock:
+            return (dict(self.counters),
+                    {key: (h.counts[:], h.sum, h.max) for key, h in self.histograms.items()})
+
+    def merge(self, snapshot):
+        """Adds a `snapshot` from another registry, e.g. a worker process's."""
+        if snapshot is None:
+            return
+        counters, histograms = snapshot
+        with self._lock:
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, (counts, total, maximum) in histograms.items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram()
+                histogram.merge(Histogram(counts, total, maximum))
+
+    def prometheus(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                metric = f"{PREFIX}{name}_total"
+                if metric not in typed:
+                    lines.append(f"# TYPE {metric} counter")
+                    typed.add(metric)
+                lines.append(f"{metric}{_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                metric = f"{PREFIX}{name}_seconds"
+                if metric not in typed:
+                    lines.append(f"# TYPE {metric} histogram")
+                    typed.add(metric)
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{metric}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{metric}_sum{_labels(labels)} {histogram.sum}")
+                lines.append(f"{metric}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Returns the metrics as a `dict` of counters and latency percentiles (in ms)."""
+        with self._lock:
+            return {
+                "counters": {_key(name, labels): value for (name, labels), value in sorted(self.counters.items())},
+                "latency_ms": {_key(name, labels): {
+                    "count": histogram.count,
+                    "mean": round(histogram.sum / histogram.count * 1000, 3) if histogram.count else 0,
+                    "p50": round(histogram.quantile(0.5) * 1000, 3),
+                    "p99": round(histogram.quantile(0.99) * 1000, 3),
+                    "max": round(histogram.max * 1000, 3),
+                } for (name, labels), histogram in sorted(self.histograms.items())},
+            }
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f"{name}=\"{value}\"" for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def _key(name, labels):
+    return name + _labels(labels)
+
+
+_registry = NullMetrics()
+
+
+def enable():
+    """Starts recording into a new `Metrics` registry and returns it."""
+    global _registry
+    _registry = Metrics()
+    return _registry
+
+
+def disable():
+    """Stops recording. Already recorded metrics are discarded."""
+    global _registry
+    _registry = NullMetrics()
+
+
+def registry():
+    """Returns the current registry, a `NullMetrics` unless `enable`d."""
+    return _registry
+
+
+def enabled():
+    return _registry.enabled
+
+
+def timer(name, **labels):
+    """Returns a context manager timing a block into the `name` histogram."""
+    return _registry.timer(name, **labels)
+
+
+def count(name, value=1, **labels):
+    """Adds `value` to the `name` counter."""
+    _registry.count(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    """Records a latency, in seconds, into the `name` histogram."""
+    _registry.observe(name, seconds, **labels)
+
+
+def write(path, metrics=None):
+    """Exports metrics, cumulative since they were enabled.
+
+    Paths ending in `.prom` are replaced atomically with a Prometheus
+    textfile. Any other path has a JSON line (see `Metrics.summary`)
+    appended to it.
+
+    Args:
+        path: `string` The file to write.
+        metrics: `Metrics` to export. Defaults to the current registry.
+    """
+    import json
+    import tempfile
+
+    metrics = metrics or _registry
+    if not metrics.enabled:
+        return
+    if path.endswith(".prom"):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(metrics.prometheus())
+        os.replace(tmp, path)
+    else:
+        record = {"time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                  "uptime_s": round(time.time() - metrics.started, 3)}
+        record.update(metrics.summary())
+        with open(path, "a") as f:
+            f.write(json.dumps(record) + "\n")
@@ -0,0 +1,169 @@
+"""
+An on-disk outbox of pre-rendered emails.
+
+Rendering is CPU bound and sending is I/O bound. Pre-generating the coming
+days' emails into an outbox ahead of time means the send window only has to
+read and send. Encoded bodies are stored once per unique content and shared
+by every recipient that gets the same workout.
+"""
+import collections
+import datetime
+import hashlib
+import itertools
+import sqlite3
+
+# An email waiting in the outbox. `body_key` identifies its encoded body.
+OutboxMessage = collections.namedtuple("OutboxMessage", ["recipient", "program", "workout", "subject", "body_key"])
+
+
+def body_key(body):
+    """Returns the content hash an encoded body is stored under."""
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+
+class Outbox(object):
+    """A SQLite store of rendered emails, keyed by (day, program, recipient).
+
+    A recipient can have an email from each of several programs on the same
+    day.
+    """
+
+    def __init__(self, path, batch_size=1000):
+        """Opens (or creates) an outbox.
+
+        Args:
+            path: `string` Path to the SQLite database file.
+            batch_size: `int` Messages written per transaction by `put`
+                and read per query by `pending`.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS bodies ("
+            " key BLOB PRIMARY KEY,"
+            " body BLOB NOT NULL"
+            ") WITHOUT ROWID")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " day TEXT NOT NULL,"
+            " program TEXT NOT NULL,"
+            " recipient TEXT NOT NULL,"
+            " workout TEXT NOT NULL,"
+            " subject TEXT NOT NULL,"
+            " body_key BLOB NOT NULL REFERENCES bodies (key),"
+            " sent_at TEXT,"
+            " PRIMARY KEY (day, program, recipient)"
+            ") WITHOUT ROWID")
+        self.db.commit()
+
+    def put(self, day, program, workout, subject, messages):
+        """Adds rendered emails, replacing any unsent ones for the same day, program and recipient.
+
+        Emails that were already sent are left alone.
+
+        Args:
+            day: `date` The delivery day.
+            program: `string` The program the workout is from.
+            workout: `string` The workout name.
+            subject: `string` The email subject.
+            messages: An iterable of `(recipient, encoded body)` pairs,
+                consumed lazily and written in batches.
+
+        Returns:
+            The number of emails added.
+        """
+        added = 0
+        stored = set()
+        messages = iter(messages)
+        while True:
+            batch = list(itertools.islice(messages, self.batch_size))
+            if not batch:
+                return added
+            rows = []
+            with self.db:
+                for recipient, body in batch:
+                    key = body_key(body)
+                    if key not in stored:
+                        self.db.execute("INSERT OR IGNORE INTO bodies VALUES (?, ?)", (key, body))
+                        stored.add(key)
+                    rows.append((day.isoformat(), program, recipient, workout, subject, key))
+                cursor = self.db.executemany(
+                    "INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, NULL)"
+                    " ON CONFLICT (day, program, recipient) DO UPDATE SET"
+                    " workout = excluded.workout, subject = excluded.subject, body_key = excluded.body_key"
+                    " WHERE sent_at IS NULL", rows)
+                added += cursor.rowcount
+
+    def programs(self, day):
+        """Returns the programs with unsent emails for `day`, sorted."""
+        rows = self.db.execute(
+            "SELECT DISTINCT program FROM messages WHERE day = ? AND sent_at IS NULL ORDER BY program",
+            (day.isoformat(),))
+        return [program for program, in rows]
+
+    def pending(self, day, program, recipients=None):
+        """Yields unsent `OutboxMessage`s for `day` from one program.
+
+        Args:
+            day: `date` The delivery day.
+            program: `string` The program whose emails to yield.
+            recipients: Optional collection of addresses to limit to.
+        """
+        # Read a page at a time rather than holding a cursor open while the
+        # caller marks messages as sent.
+        last = ""
+        while True:
+            rows = self.db.execute(
+                "SELECT recipient, program, workout, subject, body_key FROM messages"
+                " WHERE day = ? AND program = ? AND recipient > ? AND sent_at IS NULL ORDER BY recipient LIMIT ?",
+                (day.isoformat(), program, last, self.batch_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                if recipients is None or row[0] in recipients:
+                    yield OutboxMessage(*row)
+            last = rows[-1][0]
+
+    def body(self, key):
+        """Returns the encoded body stored under `key`."""
+        row = self.db.execute("SELECT body FROM bodies WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def mark_sent(self, day, program, recipients):
+        """Marks emails as sent.
+
+        Args:
+            day: `date` The delivery day.
+            program: `string` The program the emails are from.
+            recipients: An iterable of recipient addresses.
+        """
+        sent_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        with self.db:
+            self.db.executemany(
+                "UPDATE messages SET sent_at = ? WHERE day = ? AND program = ? AND recipient = ?",
+                ((sent_at, day.isoformat(), program, recipient) for recipient in recipients))
+
+    def purge(self, before):
+        """Deletes emails for days before `before` and bodies no longer used.
+
+        Returns:
+            The number of emails deleted.
+        """
+        with self.db:
+            deleted = self.db.execute("DELETE FROM messages WHERE day < ?", (before.isoformat(),)).rowcount
+            self.db.execute("DELETE FROM bodies WHERE key NOT IN (SELECT body_key FROM messages)")
+        return deleted
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
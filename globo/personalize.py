@@ -0,0 +1,304 @@
+"""
+Renders a personalized workout for every recipient across a process pool.
+
+Selections are a pure function of (program, date, recipient), so any past
+email can be regenerated on demand:
+
+    python globo/personalize.py --program WS4SB --date 2021-03-01 --recipient someone@email.com
+"""
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import datetime
+import gc
+import itertools
+import os
+
+import catalog
+import metrics
+import recipients as recipient_list
+import render_cache
+import rotation
+import selection
+import templates
+import workout_program
+
+# Rotation stores opened by this process, by path.
+_rotation_stores = {}
+
+# Training logs opened by this process, by path.
+_training_logs = {}
+
+# Bodies rendered by this process, by selection key and formats.
+_render_cache = render_cache.RenderCache()
+
+# Whether `worker_pool` has frozen the objects alive at the time.
+_frozen = False
+
+
+def _rotation_store(path):
+    if path not in _rotation_stores:
+        _rotation_stores[path] = rotation.RotationStore(path)
+    return _rotation_stores[path]
+
+
+def _training_log(path):
+    # Imported here so rendering without a training log doesn't load NumPy.
+    import training_log
+
+    if path not in _training_logs:
+        _training_logs[path] = training_log.TrainingLog(path)
+    return _training_logs[path]
+
+
+def workout_history(program_name, date, recipients, training_log_path):
+    """Summarizes many recipients' training logs for a day's workout in one query.
+
+    Args:
+        program_name: `string` A key of `workout_program.PROGRAMS`.
+        date: `date` The workout date.
+        recipients: A collection of recipient addresses.
+        training_log_path: `string` Path to a `training_log.TrainingLog`.
+
+    Returns:
+        A `dict` of recipient to `{exercise name: training_log.Summary}`,
+        for `render_keyed`'s `history`.
+    """
+    workout = workout_program.PROGRAMS[program_name].get(date.weekday())
+    if workout is None:
+        return {}
+    names = {e.name for routine in workout.routines for e in routine.exercises}
+    history = collections.defaultdict(dict)
+    for (recipient, name), summary in _training_log(training_log_path).summaries(recipients, names, date).items():
+        history[recipient][name] = summary
+    return history
+
+
+def render_keyed(program_name, date, recipient, rotation_db=None, profile=None, history=None,
+                 formats=(templates.HTML,)):
+    """Renders the workout a recipient gets on a date, with its selection key.
+
+    Recipients whose selections match share one render via a per-process
+    `render_cache.RenderCache`.
+
+    Args:
+        program_name: `string` A key of `workout_program.PROGRAMS`.
+        date: `date` The workout date.
+        recipient: `string` The recipient's email address.
+        rotation_db: `string` Optional path to a `rotation.RotationStore`. If
+            given, exercises rotate without repeats instead of being picked
+            statelessly, and the recipient's history is updated.
+        profile: `selection.Profile` Optional constraints on the exercises
+            the recipient can be given.
+        history: Optional mapping of exercise name to
+            `training_log.Summary` for the recipient, e.g. from
+            `workout_history`, noted under each exercise.
+        formats: Names of formats in `templates.WRITERS` to render, all in
+            one pass.
+
+    Returns:
+        A `(key, bodies)` tuple, where `key` is from
+        `render_cache.selection_key` (and `render_cache.history_key` with
+        history) and `bodies` has a `string` per format, or None if `date` is
+        a rest day.
+    """
+    workout = workout_program.PROGRAMS[program_name].get(date.weekday())
+    if workout is None:
+        return None
+    template = templates.compile_workout(workout)
+    if rotation_db is None:
+        picker = selection.HashPicker(program_name, date, recipient)
+    else:
+        store = _rotation_store(rotation_db)
+        picker = store.picker(recipient, date)
+    with metrics.timer("select"):
+        if profile is not None and not profile.unconstrained:
+            chosen = template.select(selection.ConstrainedPicker(profile, picker))
+        else:
+            chosen = template.select(picker)
+    if rotation_db is not None:
+        store.save(picker)
+
+    key = render_cache.selection_key(workout, chosen)
+    if history:
+        history = {e.name: history[e.name] for exercises in chosen for e in exercises if e.name in history}
+        key = render_cache.history_key(key, history)
+
+    def render_selection():
+        with metrics.timer("render"):
+            return template.render_formats(chosen, formats, history)
+
+    return key, _render_cache.get((key, formats), render_selection)
+
+
+def render(program_name, date, recipient, rotation_db=None, profile=None, history=None,
+           output_format=templates.HTML):
+    """Renders the workout a recipient gets on a date.
+
+    See `render_keyed` for the arguments.
+
+    Returns:
+        The workout in `output_format`, or None if `date` is a rest day.
+    """
+    rendered = render_keyed(program_name, date, recipient, rotation_db, profile, history, (output_format,))
+    return None if rendered is None else rendered[1][0]
+
+
+def _render_chunk(chunk, program_name, date, rotation_db, training_log_path=None, collect_metrics=False,
+                  formats=(templates.HTML,)):
+    # `chunk` holds (recipient, profile) pairs. Metrics recorded in this
+    # worker are sent back with it.
+    recipients = [recipient for recipient, _ in chunk]
+    if collect_metrics:
+        metrics.enable()
+    # One training log query per chunk rather than per recipient.
+    history = {}
+    if training_log_path:
+        with metrics.timer("training_log_query"):
+            history = workout_history(program_name, date, recipients, training_log_path)
+    rendered = [render_keyed(program_name, date, recipient, rotation_db, profile, history.get(recipient), formats)
+                for recipient, profile in chunk]
+    return rendered, metrics.registry().snapshot() if collect_metrics else None
+
+
+def worker_pool(workers=None, catalog_path=None):
+    """Creates a process pool for `render_all`.
+
+    Args:
+        workers: `int` Number of worker processes. Defaults to the CPU count.
+        catalog_path: `string` Optional catalog file that workers register
+            before rendering.
+
+    Returns:
+        A `concurrent.futures.ProcessPoolExecutor`.
+    """
+    global _frozen
+    if not _frozen:
+        # Keep the collector from touching (and so copying) the catalog's
+        # pages in forked workers. Only once: the catalog is loaded before the
+        # first pool, and freezing again in a long running process would keep
+        # everything allocated since out of collection for good.
+        gc.freeze()
+        _frozen = True
+    initializer, initargs = (catalog.register, (catalog_path,)) if catalog_path else (None, ())
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count() or 1, initializer=initializer, initargs=initargs)
+
+
+def map_chunks(function, items, *args, workers=None, chunk_size=256, catalog_path=None, executor=None):
+    """Calls `function(chunk, *args)` on chunks of `items` across worker processes.
+
+    Items are consumed lazily and only a few chunks per worker are in flight
+    at a time, so memory stays flat however many items there are.
+
+    Args:
+        function: A picklable function taking a `list` of items and `args`.
+        items: An iterable of picklable items.
+        workers: `int` Number of worker processes. Defaults to the CPU count.
+        chunk_size: `int` Items per call.
+        catalog_path: `string` Optional catalog file that workers register.
+        executor: An executor from `worker_pool` to reuse. One is created
+            (and shut down afterwards) if omitted.
+
+    Yields:
+        `(chunk, result)` pairs in input order.
+    """
+    items = iter(items)
+    workers = workers or os.cpu_count() or 1
+    if executor is None:
+        owned = worker_pool(workers, catalog_path)
+    else:
+        owned = contextlib.nullcontext(executor)
+    with owned as executor:
+        max_in_flight = workers * 2
+        in_flight = collections.deque()
+
+        def submit():
+            chunk = list(itertools.islice(items, chunk_size))
+            if chunk:
+                in_flight.append((chunk, executor.submit(function, chunk, *args)))
+            return bool(chunk)
+
+        while len(in_flight) < max_in_flight and submit():
+            pass
+        while in_flight:
+            chunk, future = in_flight.popleft()
+            yield chunk, future.result()
+            submit()
+
+
+def render_all(program_name, date, recipients, workers=None, chunk_size=256, rotation_db=None,
+               catalog_path=None, executor=None, profile=None, profiles=None, training_log_path=None,
+               formats=(templates.HTML,)):
+    """Renders personalized workouts in parallel.
+
+    Recipients are consumed lazily and sent to worker processes in chunks, so
+    rendering starts before the recipient list has been fully read and only a
+    few chunks per worker are held in memory.
+
+    Args:
+        program_name: `string` A key of `workout_program.PROGRAMS`.
+        date: `date` The workout date.
+        recipients: An iterable of recipient addresses.
+        workers: `int` Number of worker processes. Defaults to the CPU count.
+        chunk_size: `int` Recipients rendered per task.
+        rotation_db: `string` Optional path to a `rotation.RotationStore`.
+        catalog_path: `string` Optional catalog file that defines the program.
+            Worker processes register it before rendering.
+        executor: An executor from `worker_pool` to reuse. One is created
+            (and shut down afterwards) if omitted.
+        profile: `selection.Profile` Optional constraints for everyone.
+        profiles: Optional mapping of recipient to `selection.Profile`, for
+            recipients whose constraints differ from `profile`.
+        training_log_path: `string` Optional path to a
+            `training_log.TrainingLog` whose summaries are noted in each
+            recipient's email. It is queried once per chunk.
+        formats: Names of formats in `templates.WRITERS` to render.
+
+    Yields:
+        `(recipient, key, bodies)` tuples in input order, where `key`
+        identifies the selection and `bodies` has a `string` per format (see
+        `render_keyed`).
+    """
+    if profiles:
+        items = ((recipient, profiles.get(recipient, profile)) for recipient in recipients)
+    else:
+        items = ((recipient, profile) for recipient in recipients)
+    for chunk, (rendered, snapshot) in map_chunks(
+            _render_chunk, items, program_name, date, rotation_db, training_log_path, metrics.enabled(), formats,
+            workers=workers, chunk_size=chunk_size, catalog_path=catalog_path, executor=executor):
+        metrics.registry().merge(snapshot)
+        for (recipient, _), (key, bodies) in zip(chunk, rendered):
+            yield recipient, key, bodies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regenerate the workout email a recipient got on a given date.")
+    parser.add_argument("--catalog", type=str, default=None, help="A catalog file defining additional programs.")
+    parser.add_argument("--program", type=str, default="WS4SB", help="The workout program name.")
+    parser.add_argument("--date", type=datetime.date.fromisoformat, required=True, help="The workout date (YYYY-MM-DD).")
+    parser.add_argument("--recipient", type=recipient_list.normalize, required=True,
+                        help="The recipient's email address.")
+    parser.add_argument("--equipment", type=str, default=None, help="The recipient's comma separated equipment.")
+    parser.add_argument("--avoid_muscles", type=str, default=None, help="Muscle groups the recipient avoids.")
+    parser.add_argument("--max_difficulty", type=str, default=None, help="The recipient's maximum difficulty.")
+    parser.add_argument("--training_log", type=str, default=None,
+                        help="A training log directory to note the recipient's history from.")
+    parser.add_argument("--format", type=str, default=templates.HTML, choices=sorted(templates.WRITERS),
+                        help="The format to print the workout in.")
+    args = parser.parse_args()
+    if args.catalog:
+        catalog.register(args.catalog)
+    if args.program not in workout_program.PROGRAMS:
+        parser.error(f"Unknown program {args.program!r}.")
+
+    profile = selection.Profile.parse(args.equipment, args.avoid_muscles, args.max_difficulty)
+    history = None
+    if args.training_log:
+        history = workout_history(args.program, args.date, [args.recipient], args.training_log).get(args.recipient)
+    body = render(args.program, args.date, args.recipient, profile=profile, history=history,
+                  output_format=args.format)
+    if body is None:
+        parser.exit(1, f"{args.date} is a rest day in {args.program}.\n")
+    print(body)
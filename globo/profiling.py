@@ -0,0 +1,153 @@
+"""
+Profiles a whole run without code changes.
+
+`Profiler` wraps a block in cProfile and tracemalloc and samples every
+thread's stack from a background thread. On exit it writes to a directory:
+
+    profile.pstats   cProfile stats of the profiled thread and the threads it
+                     starts, such as the SMTP senders, for `pstats` or snakeviz
+    allocations.txt  the top allocation sites, at peak memory and at exit
+    stacks.folded    sampled stacks of all threads in the collapsed format
+                     read by flamegraph.pl, speedscope and inferno
+
+Threads started before the block, and render worker processes, are not
+profiled.
+"""
+import collections
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+
+# Traced memory has to grow this much past the last peak snapshot before
+# another one is taken, since snapshots are slow.
+PEAK_GROWTH = 1.25
+MIN_PEAK_BYTES = 1 << 20
+
+# From 3.12 cProfile is built on sys.monitoring, which sees every thread, and
+# only one profiler can be enabled at a time.
+PROFILES_ALL_THREADS = sys.version_info >= (3, 12)
+
+_HERE = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+def _frame_name(code):
+    # Flamegraph tools split frames on ";".
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+class Profiler(object):
+    """A context manager that profiles its block into a directory."""
+
+    def __init__(self, directory, top=25, interval=0.005, frames=10):
+        """Constructs a Profiler.
+
+        Args:
+            directory: `string` Where the reports are written. Created if
+                missing.
+            top: `int` Number of allocation sites to report.
+            interval: `float` Seconds between stack samples.
+            frames: `int` Stack frames stored per allocation.
+        """
+        self.directory = directory
+        self.top = top
+        self.interval = interval
+        self.frames = frames
+
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._profile = cProfile.Profile()
+        self._thread_profiles = []
+        self._peak_snapshot = None
+        self._peak_size = 0
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+
+    def _sample(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+            size = tracemalloc.get_traced_memory()[0]
+            if size >= MIN_PEAK_BYTES and size > self._peak_size * PEAK_GROWTH:
+                self._peak_snapshot = tracemalloc.take_snapshot()
+                self._peak_size = size
+
+    def _profile_thread(self, frame, event, arg):
+        # Installed by threading.setprofile, so this runs on the first event
+        # of each new thread. Enabling a profile replaces it for the thread.
+        profile = cProfile.Profile()
+        self._thread_profiles.append(profile)
+        profile.enable()
+
+    def __enter__(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tracemalloc.start(self.frames)
+        # Started first so the sampler itself isn't profiled.
+        self._sampler.start()
+        if not PROFILES_ALL_THREADS:
+            threading.setprofile(self._profile_thread)
+        self._profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._profile.disable()
+        if not PROFILES_ALL_THREADS:
+            threading.setprofile(None)
+        self._stop.set()
+        self._sampler.join()
+        final = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stats = pstats.Stats(self._profile)
+        for profile in self._thread_profiles:
+            stats.add(profile)
+        stats.dump_stats(os.path.join(self.directory, "profile.pstats"))
+        with open(os.path.join(self.directory, "stacks.folded"), "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(self.directory, "allocations.txt"), "w", encoding="utf-8") as f:
+            f.write(f"Traced memory: {current / 2**20:.1f} MiB at exit, {peak / 2**20:.1f} MiB peak\n")
+            if self._peak_snapshot is not None:
+                f.write(f"\nTop {self.top} allocation sites at {self._peak_size / 2**20:.1f} MiB "
+                        f"(the largest sampled size):\n")
+                self._write_top(f, self._peak_snapshot)
+            f.write(f"\nTop {self.top} allocation sites at exit:\n")
+            self._write_top(f, final)
+
+        print(f"Wrote profile.pstats, allocations.txt and stacks.folded ({self.samples} samples) to "
+              f"{self.directory}", file=sys.stderr)
+
+    def _write_top(self, f, snapshot):
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+        statistics = snapshot.statistics("traceback")
+        for i, statistic in enumerate(statistics[:self.top], 1):
+            # Name each site after the most recent frame in our own code, or
+            # else outside the import machinery.
+            frames = list(reversed(statistic.traceback))
+            site = next((frame for frame in frames if frame.filename.startswith(_HERE)),
+                        next((frame for frame in frames if not frame.filename.startswith("<frozen")), frames[0]))
+            f.write(f"{i:3}. {statistic.size / 1024:10.1f} KiB {statistic.count:9} blocks  "
+                    f"{os.path.relpath(site.filename, _HERE) if site.filename.startswith(_HERE) else site.filename}"
+                    f":{site.lineno}\n")
+            for line in statistic.traceback.format(most_recent_first=True):
+                f.write(f"        {line}\n")
+        rest = statistics[self.top:]
+        if rest:
+            f.write(f"     {sum(s.size for s in rest) / 1024:10.1f} KiB in {len(rest)} other sites\n")
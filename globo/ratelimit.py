@@ -0,0 +1,238 @@
+"""
+Adaptive rate limiting for outbound mail.
+"""
+import datetime
+import smtplib
+import sqlite3
+import threading
+import time
+
+# SMTP replies that mean "slow down and try again later".
+TRANSIENT_CODES = frozenset([421, 450, 451, 452, 454])
+
+
+class BudgetExhausted(Exception):
+    """Raised when the daily sending budget has been used up."""
+
+
+def transient_code(error):
+    """Returns the SMTP code of a transient (retryable) error, or None.
+
+    Args:
+        error: The exception raised while sending.
+    """
+    if isinstance(error, smtplib.SMTPResponseException):
+        code = error.smtp_code
+    elif isinstance(error, smtplib.SMTPRecipientsRefused) and error.recipients:
+        codes = {code for code, _ in error.recipients.values()}
+        # Only retry when every recipient was refused for a transient reason.
+        code = codes.pop() if len(codes) == 1 else None
+    else:
+        return None
+    return code if code in TRANSIENT_CODES else None
+
+
+class TokenBucket(object):
+    """A thread safe token bucket."""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        """Constructs a TokenBucket.
+
+        Args:
+            rate: `float` Tokens added per second.
+            capacity: `float` Maximum burst size. Defaults to one second of tokens.
+            clock: A monotonic clock, for testing.
+            sleep: A sleep function, for testing.
+        """
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.clock = clock
+        self.sleep = sleep
+
+        self._tokens = self.capacity
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self):
+        """Takes one token, blocking until one is available."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self.sleep(wait)
+
+    def set_rate(self, rate):
+        """Changes the refill rate. The burst capacity is left unchanged."""
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+    def drain(self):
+        """Empties the bucket so the next acquire waits a full interval."""
+        with self._lock:
+            self._refill()
+            self._tokens = 0
+
+
+class DailyBudget(object):
+    """Counts recipients sent per calendar day against a fixed limit.
+
+    With a `path`, usage is kept in a SQLite database instead of in memory,
+    so restarted runs, later runs and other processes sending through the
+    same relay on the same day share one budget.
+    """
+
+    def __init__(self, limit, today=datetime.date.today, path=None):
+        """Constructs a DailyBudget.
+
+        Args:
+            limit: `int` Maximum recipients per day.
+            today: A callable returning the current `date`, for testing.
+            path: `string` Optional path to a SQLite database to keep usage in.
+        """
+        self.limit = limit
+        self.today = today
+        self.path = path
+
+        self._day = None
+        self._used = 0
+        self._lock = threading.Lock()
+        self.db = None
+        if path is not None:
+            # Sending threads share the connection, under the lock.
+            self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS budget ("
+                " day TEXT PRIMARY KEY,"
+                " used INTEGER NOT NULL"
+                ") WITHOUT ROWID")
+            self.db.commit()
+
+    def take(self, count=1):
+        """Reserves `count` recipients from today's budget.
+
+        Raises:
+            BudgetExhausted: If the reservation would go over the limit.
+        """
+        with self._lock:
+            day = self.today()
+            if self.db is not None:
+                # One statement, so concurrent processes can't both take the
+                # last of the budget.
+                taken = count <= self.limit and self.db.execute(
+                    "INSERT INTO budget VALUES (?, ?) ON CONFLICT (day) DO UPDATE"
+                    " SET used = used + excluded.used WHERE used + excluded.used <= ?",
+                    (day.isoformat(), count, self.limit)).rowcount == 1
+                self.db.commit()
+                if not taken:
+                    raise BudgetExhausted(f"Daily budget of {self.limit} recipients used up.")
+                return
+            if day != self._day:
+                self._day, self._used = day, 0
+            if self._used + count > self.limit:
+                raise BudgetExhausted(f"Daily budget of {self.limit} recipients used up.")
+            self._used += count
+
+    def give_back(self, count=1):
+        """Returns `count` recipients taken today that were not sent to."""
+        with self._lock:
+            day = self.today()
+            if self.db is not None:
+                self.db.execute("UPDATE budget SET used = max(used - ?, 0) WHERE day = ?", (count, day.isoformat()))
+                self.db.commit()
+            elif day == self._day:
+                self._used = max(self._used - count, 0)
+
+    @property
+    def remaining(self):
+        with self._lock:
+            if self.db is not None:
+                row = self.db.execute("SELECT used FROM budget WHERE day = ?",
+                                      (self.today().isoformat(),)).fetchone()
+                return self.limit - (row[0] if row else 0)
+            if self.today() != self._day:
+                return self.limit
+            return self.limit - self._used
+
+
+class AdaptiveRateLimiter(object):
+    """Paces sends and backs off when the relay starts throttling.
+
+    The send rate is cut multiplicatively on every transient SMTP error and
+    recovers additively after a run of successful sends (AIMD), so it settles
+    just under the highest rate the relay accepts.
+    """
+
+    def __init__(self, max_rate, per_day=None, min_rate=0.1, decrease=0.5,
+                 recover_after=20, clock=time.monotonic, sleep=time.sleep, budget_path=None):
+        """Constructs an AdaptiveRateLimiter.
+
+        Args:
+            max_rate: `float` Maximum messages per second.
+            per_day: `int` Maximum recipients per day, or None for no limit.
+            min_rate: `float` The rate never drops below this.
+            decrease: `float` Factor the rate is multiplied by when throttled.
+            recover_after: `int` Successful sends needed before stepping the
+                rate back up.
+            clock: A monotonic clock, for testing.
+            sleep: A sleep function, for testing.
+            budget_path: `string` Optional SQLite database the daily budget
+                is kept in (see `DailyBudget`).
+        """
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.decrease = decrease
+        self.recover_after = recover_after
+
+        self.bucket = TokenBucket(max_rate, clock=clock, sleep=sleep)
+        self.budget = DailyBudget(per_day, path=budget_path) if per_day else None
+
+        self._successes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def reserve(self, recipients=1):
+        """Reserves `recipients` addresses from the daily budget.
+
+        Raises:
+            BudgetExhausted: If the daily budget is used up.
+        """
+        if self.budget is not None:
+            self.budget.take(recipients)
+
+    def release(self, recipients=1):
+        """Gives back reserved addresses that were not sent to."""
+        if self.budget is not None:
+            self.budget.give_back(recipients)
+
+    def wait(self):
+        """Blocks until the next send attempt may be made."""
+        self.bucket.acquire()
+
+    def success(self):
+        """Records a successful send, stepping the rate up after a streak."""
+        with self._lock:
+            self._successes += 1
+            if self._successes < self.recover_after or self.rate >= self.max_rate:
+                return
+            self._successes = 0
+            step = max(self.min_rate, self.max_rate / 10)
+            self.bucket.set_rate(min(self.max_rate, self.rate + step))
+
+    def throttled(self):
+        """Records a transient rejection and slows down."""
+        with self._lock:
+            self._successes = 0
+            self.bucket.set_rate(max(self.min_rate, self.rate * self.decrease))
+            self.bucket.drain()
@@ -0,0 +1,172 @@
+"""
+Streaming recipient ingestion.
+
+Recipients are read lazily from comma separated strings, CSV or newline
+separated files, or stdin, then normalized, validated and deduplicated in a
+generator pipeline so delivery can start before the whole list is read.
+"""
+import contextlib
+import csv
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+# Deliberately loose: one @, no whitespace, a dot in the domain.
+EMAIL_RE = re.compile(r"^[^@\s,;<>]+@[^@\s,;<>]+\.[^@\s,;<>]+$")
+
+
+def normalize(address):
+    """Strips whitespace and lower cases the domain of an address.
+
+    The local part is left alone since it is case sensitive per RFC 5321.
+    """
+    local, at, domain = address.strip().rpartition("@")
+    if not at:
+        return address.strip()
+    return f"{local}@{domain.lower()}"
+
+
+def is_valid(address):
+    return EMAIL_RE.match(address) is not None
+
+
+def from_string(recipients):
+    """Yields addresses from a comma separated string."""
+    for address in recipients.split(","):
+        if address.strip():
+            yield address
+
+
+def from_csv(lines):
+    """Yields addresses from CSV or newline separated lines.
+
+    If the first row looks like a header (it has no `@`), the column named
+    `email` is used, otherwise the first column.
+
+    Args:
+        lines: An iterable of text lines, e.g. an open file.
+    """
+    column = 0
+    for i, row in enumerate(csv.reader(lines)):
+        if not row:
+            continue
+        if i == 0 and "@" not in "".join(row):
+            headers = [header.strip().lower() for header in row]
+            column = headers.index("email") if "email" in headers else 0
+            continue
+        if column < len(row) and row[column].strip():
+            yield row[column]
+
+
+@contextlib.contextmanager
+def open_source(path):
+    """Opens a recipients file, or stdin for `-`."""
+    if path == "-":
+        yield sys.stdin
+    else:
+        with open(path, newline="", encoding="utf-8") as f:
+            yield f
+
+
+class Deduplicator(object):
+    """Remembers seen addresses in bounded memory.
+
+    Once more than `max_in_memory` addresses are held they are spilled to a
+    temporary SQLite file, so memory stays flat. Addresses are stored as
+    they are rather than hashed, so the result is exact: two different
+    addresses can never be taken for one and a recipient dropped.
+    """
+
+    def __init__(self, max_in_memory=1000000, spill_dir=None):
+        """Constructs a Deduplicator.
+
+        Args:
+            max_in_memory: `int` Addresses held in memory before spilling to disk.
+            spill_dir: `string` Directory for the spill file. Defaults to the
+                system temp dir.
+        """
+        self.max_in_memory = max_in_memory
+        self.spill_dir = spill_dir
+
+        self._seen = set()
+        self._spill = None
+        self._spill_path = None
+
+    def _flush(self):
+        if self._spill is None:
+            fd, self._spill_path = tempfile.mkstemp(suffix=".db", dir=self.spill_dir)
+            os.close(fd)
+            self._spill = sqlite3.connect(self._spill_path)
+            self._spill.execute("PRAGMA journal_mode=OFF")
+            self._spill.execute("PRAGMA synchronous=OFF")
+            self._spill.execute("CREATE TABLE seen (address TEXT PRIMARY KEY) WITHOUT ROWID")
+        self._spill.executemany("INSERT OR IGNORE INTO seen VALUES (?)", ((a,) for a in self._seen))
+        self._spill.commit()
+        self._seen.clear()
+
+    def add(self, address):
+        """Records an address.
+
+        Returns:
+            `True` if the address had not been seen before.
+        """
+        if address in self._seen:
+            return False
+        if self._spill is not None and self._spill.execute(
+                "SELECT 1 FROM seen WHERE address = ?", (address,)).fetchone():
+            return False
+        self._seen.add(address)
+        if len(self._seen) > self.max_in_memory:
+            self._flush()
+        return True
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            os.remove(self._spill_path)
+            self._spill = None
+
+
+def clean(addresses, deduplicator=None, on_invalid=None):
+    """Normalizes, validates and deduplicates a stream of addresses.
+
+    Args:
+        addresses: An iterable of raw addresses.
+        deduplicator: `Deduplicator` to use. A new one is created by default.
+        on_invalid: Optional callable invoked with each invalid address.
+
+    Yields:
+        Unique, normalized, valid addresses in input order.
+    """
+    deduplicator = deduplicator or Deduplicator()
+    try:
+        for address in addresses:
+            address = normalize(address)
+            if not is_valid(address):
+                if on_invalid is not None:
+                    on_invalid(address)
+                continue
+            if deduplicator.add(address):
+                yield address
+    finally:
+        deduplicator.close()
+
+
+def read_recipients(recipients=None, path=None, on_invalid=None):
+    """Streams clean recipients from a comma separated string or a file.
+
+    Args:
+        recipients: `string` Comma separated addresses.
+        path: `string` A CSV or newline separated file, or `-` for stdin.
+        on_invalid: Optional callable invoked with each invalid address.
+
+    Yields:
+        Unique, normalized, valid addresses.
+    """
+    if path is None:
+        yield from clean(from_string(recipients), on_invalid=on_invalid)
+        return
+    with open_source(path) as f:
+        yield from clean(from_csv(f), on_invalid=on_invalid)
@@ -0,0 +1,89 @@
+"""
+Content-addressed cache for rendered workouts.
+
+Routines only have a handful of options each, so many recipients end up with
+the same selection of exercises. Keying rendered (and encoded) bodies by a
+hash of the selection means render and encode work scales with the number of
+unique selections rather than the number of recipients.
+"""
+import array
+import collections
+import hashlib
+import threading
+
+
+def selection_key(workout, selection):
+    """Returns a content hash for a workout's selected exercises.
+
+    The hash is over exercise ids, which are only stable within one run of
+    the program, so keys should not be persisted.
+
+    Args:
+        workout: `Workout` The workout the selection was made for.
+        selection: A sequence (one per routine) of sequences of `Exercise`.
+
+    Returns:
+        A 16 byte digest.
+    """
+    h = hashlib.blake2b(workout.name.encode("utf-8"), digest_size=16)
+    for exercises in selection:
+        h.update(array.array("I", [len(exercises)] + [exercise.id for exercise in exercises]).tobytes())
+    return h.digest()
+
+
+def history_key(key, history):
+    """Extends a selection key with the training history noted in the email.
+
+    Args:
+        key: `bytes` A key from `selection_key`.
+        history: Mapping of exercise name to `training_log.Summary`.
+
+    Returns:
+        A 16 byte digest, or `key` itself if there's no history.
+    """
+    if not history:
+        return key
+    h = hashlib.blake2b(key, digest_size=16)
+    h.update(repr(sorted(history.items())).encode("utf-8"))
+    return h.digest()
+
+
+class RenderCache(object):
+    """A thread safe LRU cache with hit and miss counters."""
+
+    def __init__(self, max_entries=1024):
+        """Constructs a RenderCache.
+
+        Args:
+            max_entries: `int` Entries kept before the least recently used is
+                evicted.
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, factory):
+        """Returns the cached value for `key`, creating it with `factory()` on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        value = factory()
+        with self._lock:
+            self._entries[key] = value
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0
+        return f"{len(self)} entries, {self.hits} hits, {self.misses} misses ({rate:.0%} hit rate)"
@@ -0,0 +1,162 @@
+"""
+No-repeat exercise rotation with a small, fixed-size state per user.
+
+Each (user, routine, slot) works through its pool of options like a shuffle
+bag: an exercise is not picked again until every other option has been
+picked, and the first pick of a new round never repeats the last pick of the
+previous one. The current round is a bitmask of the options used so far, so
+state per user is a few bytes per routine (one bit per option) no matter how
+long they have been subscribed, and every option is used once per round
+however large the pool is.
+"""
+import hashlib
+import sqlite3
+import struct
+
+_HEADER = struct.Struct("<IIi")
+
+# Set bits per byte value.
+_POPCOUNT = bytes(bin(byte).count("1") for byte in range(256))
+
+
+def _nth_unset(mask, n, count):
+    """Returns the `n`th (from 0) index in `range(count)` whose bit isn't set in `mask`."""
+    free = ~mask & ((1 << count) - 1)
+    index = 0
+    # Skip whole bytes by their popcount, then scan the bits of one byte.
+    for byte in free.to_bytes((count + 7) // 8, "little"):
+        if n < _POPCOUNT[byte]:
+            while True:
+                if byte & 1:
+                    if not n:
+                        return index
+                    n -= 1
+                byte >>= 1
+                index += 1
+        n -= _POPCOUNT[byte]
+        index += 8
+    raise ValueError("Fewer unset bits than requested.")
+
+
+class RotationState(object):
+    """The current round of one (user, routine, slot)."""
+
+    __slots__ = ("count", "day", "last", "used")
+
+    def __init__(self):
+        self.count = 0  # Picks made so far.
+        self.day = 0  # Ordinal of the day of the last pick.
+        self.last = -1  # Option index of the last pick, or -1.
+        self.used = 0  # Bitmask of the options picked in the current round.
+
+    def push(self, index, day):
+        self.used |= 1 << index
+        self.last = index
+        self.count += 1
+        self.day = day
+
+    def to_bytes(self):
+        return _HEADER.pack(self.count, self.day, self.last) + self.used.to_bytes(
+            (self.used.bit_length() + 7) // 8, "little")
+
+    @classmethod
+    def from_bytes(cls, data):
+        state = cls()
+        state.count, state.day, state.last = _HEADER.unpack_from(data)
+        state.used = int.from_bytes(data[_HEADER.size:], "little")
+        return state
+
+
+class RotationPicker(object):
+    """Picks without repeats using per-routine `RotationState`.
+
+    Picks are deterministic given the history, and picking the same routine
+    again on the same day returns the same exercise, so re-rendering a day
+    (e.g. after a crash) does not advance the rotation.
+    """
+
+    def __init__(self, user, date, states=None):
+        """Constructs a RotationPicker.
+
+        Args:
+            user: `string` The recipient's email address.
+            date: `date` The date of the workout.
+            states: `dict` of `(routine_name, slot)` to `RotationState`, as
+                returned by `RotationStore.load`.
+        """
+        self.user = user
+        self.day = date.toordinal()
+        self.states = states if states is not None else {}
+        self.changed = set()
+
+    def _hash(self, routine_name, slot, count):
+        key = f"{self.user}|{routine_name}|{slot}|{count}".encode("utf-8")
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big")
+
+    def pick(self, routine, slot, options):
+        key = (routine.name, slot)
+        state = self.states.get(key)
+        if state is None:
+            state = self.states[key] = RotationState()
+
+        count = len(options)
+        last = state.last if 0 <= state.last < count else None
+        if state.day == self.day and last is not None:
+            return options[last]
+
+        # Options beyond the pool (if it shrank) don't count.
+        state.used &= (1 << count) - 1
+        excluded = state.used
+        if excluded == (1 << count) - 1:
+            # Round over: start a new one, but don't repeat the last pick.
+            state.used = 0
+            excluded = 1 << last if last is not None and count > 1 else 0
+
+        free = count - bin(excluded).count("1")
+        index = _nth_unset(excluded, self._hash(routine.name, slot, state.count) % free, count)
+        state.push(index, self.day)
+        self.changed.add(key)
+        return options[index]
+
+
+class RotationStore(object):
+    """Persists `RotationState` per user in SQLite."""
+
+    def __init__(self, path):
+        """Opens (or creates) a rotation store.
+
+        Args:
+            path: `string` Path to the SQLite database file.
+        """
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS rotation ("
+            " user TEXT NOT NULL,"
+            " routine TEXT NOT NULL,"
+            " slot INTEGER NOT NULL,"
+            " state BLOB NOT NULL,"
+            " PRIMARY KEY (user, routine, slot)"
+            ") WITHOUT ROWID")
+        self.db.commit()
+
+    def load(self, user):
+        """Returns a user's states keyed by `(routine_name, slot)`."""
+        rows = self.db.execute("SELECT routine, slot, state FROM rotation WHERE user = ?", (user,))
+        return {(routine, slot): RotationState.from_bytes(state) for routine, slot, state in rows}
+
+    def picker(self, user, date):
+        """Returns a `RotationPicker` loaded with the user's history."""
+        return RotationPicker(user, date, self.load(user))
+
+    def save(self, picker):
+        """Writes back the states a picker changed."""
+        self.db.executemany(
+            "INSERT OR REPLACE INTO rotation VALUES (?, ?, ?, ?)",
+            ((picker.user, routine, slot, picker.states[(routine, slot)].to_bytes())
+             for routine, slot in picker.changed))
+        self.db.commit()
+        picker.changed.clear()
+
+    def close(self):
+        self.db.close()
@@ -1,15 +1,24 @@
-import random
 import exercise
 import itertools
+import selection
+import templates
 
+# Used when get_exercises is called without a picker.
+_default_picker = selection.RandomPicker()
 
-class ExerciseRoutine(object):
+
+class ExerciseRoutine(exercise.Frozen):
     """Interface to define an exercise routine.
 
     Routines are instructionss / notes combined with a set of exercises. Typically,
     they will represent one group, or part, of a full workout.
+
+    Routines are immutable. Exercises are stored as `exercise.ExerciseIds`, one
+    per group; a plain routine has a single group.
     """
 
+    __slots__ = ("name", "instructions", "exercise_groups")
+
     def __init__(self, name, instructions, exercises):
         """Constructor for the ExerciseRoutine object.
 
@@ -18,39 +27,46 @@ class ExerciseRoutine(object):
             instructions: `string` Instructions for the routine.
             exercises: `list` A list of `Exercise` objects that make up the routine.
         """
-        self.name = name
-        self.instructions = instructions
-        self.exercises = exercises
+        self._set(name=name, instructions=instructions,
+                  exercise_groups=(exercise.ExerciseIds(exercises),))
 
-        self.exercises_for_routine = [] 
-    
-    def get_exercises(self):
-        """Randomly chooses and returns exercises for the routine.
+    @property
+    def exercises(self):
+        """All of the routine's exercises as `exercise.ExerciseIds`."""
+        if len(self.exercise_groups) == 1:
+            return self.exercise_groups[0]
+        return exercise.ExerciseIds(itertools.chain.from_iterable(self.exercise_groups))
 
-        Exercises will not repeat.
+    def get_exercises(self, picker=None):
+        """Randomly chooses and returns exercises for the routine, one per group.
+
+        Use a `rotation.RotationPicker` to keep exercises from repeating across
+        workouts.
+
+        Args:
+            picker: Optional picker (see `selection`) that chooses exercises for
+                a single recipient. Defaults to a random choice.
 
         Returns:
             A `list` of `Exercise` objects.
         """
-        if not self.exercises_for_routine:
-            self.exercises_for_routine.append(random.choice(self.exercises))
+        picker = picker or _default_picker
+        return [picker.pick(self, slot, exercise_group)
+                for slot, exercise_group in enumerate(self.exercise_groups)]
 
-        return self.exercises_for_routine
-    
-    def as_html(self):
+    def as_html(self, picker=None):
         """Formats the routine as a list element with a nested list of exercises.
 
+        Args:
+            picker: Optional picker passed to `get_exercises`.
+
         Returns:
             A `string` formatted as an html list.
         """
-        exercises_formatted = ''.join(
-            [f"<li>{exercise}</li>" for exercise in self.get_exercises()])
-        return f"""
-            <li><b>{self.name}</b> {self.instructions.rstrip(".")}:
-                <ul>
-                    {exercises_formatted}
-                </ul>
-            </li>"""
+        return templates.compile_routine(self).render(picker)
+
+    def __reduce__(self):
+        return (ExerciseRoutine, (self.name, self.instructions, list(self.exercises)))
 
     def __str__(self):
         return self.as_html()
@@ -59,23 +75,18 @@ class ExerciseRoutine(object):
 class SupersetRoutine(ExerciseRoutine):
     """Interface for a superset routine.
 
-    This is a slight derivation from a normal exercise routine.
+    This is a slight derivation from a normal exercise routine: one exercise
+    is chosen from each of several groups.
     """
 
+    __slots__ = ()
+
     def __init__(self, name, instructions, exercise_groups):
-        # Reformat exercise_groups to be a single list so we can use the
-        # parent constructor.
-        _unused_exercises = itertools.chain.from_iterable(exercise_groups)
-        super().__init__(name, instructions, _unused_exercises)
-        self.exercise_groups = exercise_groups
-
-    def get_exercises(self):
-        """Overwrites the get_exercises method to work with an exercise list of lists."""
-        if not self.exercises_for_routine:
-            for exercise_group in self.exercise_groups:
-                self.exercises_for_routine.append(random.choice(exercise_group))
-
-        return self.exercises_for_routine
+        self._set(name=name, instructions=instructions,
+                  exercise_groups=tuple(exercise.ExerciseIds(group) for group in exercise_groups))
+
+    def __reduce__(self):
+        return (SupersetRoutine, (self.name, self.instructions, [list(group) for group in self.exercise_groups]))
 
 
 # Monday routines
@@ -1,29 +1,598 @@
 import argparse
 import datetime
-import yagmail
+import sys
 import workout_program
 
+# Only the modules needed to decide whether today is a workout day are imported
+# up front. The mail stack, rendering and catalogs are imported in `send`, so
+# rest days exit quickly.
+
 parser = argparse.ArgumentParser(description="CLI for the Globo workout application.")
 parser.add_argument("--username", type=str, help="The gmail address from which the emails will be sent (xxx@gmail.com)", required=True)
 parser.add_argument("--app_password", type=str, help="Your gmail app password to sign into the sender account.", required=True)
-parser.add_argument("--recipients", type=str, help="A comma separated list of one or more recipient email addresses.", required=True)
+recipients_group = parser.add_mutually_exclusive_group()
+recipients_group.add_argument("--recipients", type=str, help="A comma separated list of one or more recipient email addresses.")
+recipients_group.add_argument("--recipients_file", type=str,
+                              help="A CSV (with an 'email' column or addresses in the first column) or newline separated file of recipients. Use - for stdin.")
+recipients_group.add_argument("--subscribers_file", type=str,
+                              help=("With --daemon, a CSV of subscribers with 'email', 'program', 'timezone' and "
+                                    "'send_time' (HH:MM local) columns. Each is sent their own program at their own time."))
+parser.add_argument("--smtp_host", type=str, default="smtp.gmail.com", help="The SMTP server to send through.")
+parser.add_argument("--smtp_port", type=int, default=465, help="The SMTP server port.")
+parser.add_argument("--smtp_security", type=str, default="ssl", choices=["ssl", "starttls", "none"],
+                    help="How to secure the SMTP connection.")
+parser.add_argument("--pool_size", type=int, default=4, help="Number of SMTP connections to send over in parallel.")
+parser.add_argument("--max_messages_per_connection", type=int, default=100,
+                    help="Reconnect after sending this many messages on one connection.")
+parser.add_argument("--max_per_second", type=float, default=5,
+                    help="Maximum messages per second. Sending slows down automatically when the server throttles.")
+parser.add_argument("--max_per_day", type=int, default=None,
+                    help="Maximum recipients per day (Gmail allows 500, Google Workspace 2000).")
+parser.add_argument("--budget_db", type=str, default=None,
+                    help=("With --max_per_day, a SQLite file counting the day's recipients across runs and instances. "
+                          "Defaults to the --journal or --outbox file, if any; otherwise only this run is counted."))
+parser.add_argument("--chunk_size", type=int, default=1,
+                    help=("Recipients per message. Above 1, the email is encoded once and sent with many hidden "
+                          "recipients per envelope instead of one message per recipient."))
+parser.add_argument("--journal", type=str, default=None,
+                    help=("Path to a delivery journal (SQLite). Recipients already sent today's workout are "
+                          "skipped, so an interrupted run can simply be restarted."))
+parser.add_argument("--date", type=datetime.date.fromisoformat, default=None,
+                    help="Send the workout for this date (YYYY-MM-DD) instead of today, e.g. to resume a run after midnight.")
+parser.add_argument("--personalize", action="store_true",
+                    help="Give each recipient their own selection of exercises (the same one every time for a given date).")
+parser.add_argument("--render_workers", type=int, default=None,
+                    help="Processes used to render personalized workouts. Defaults to the number of CPUs.")
+parser.add_argument("--rotation_db", type=str, default=None,
+                    help=("Path to a rotation history (SQLite). With --personalize, exercises rotate so none repeats "
+                          "until the rest of its routine's options have come up."))
+parser.add_argument("--equipment", type=str, default=None,
+                    help=("With --personalize, only pick exercises needing this comma separated equipment "
+                          "(e.g. dumbbell,bench,band), or 'none' for bodyweight exercises."))
+parser.add_argument("--avoid_muscles", type=str, default=None,
+                    help="With --personalize, leave out exercises working these comma separated muscle groups.")
+parser.add_argument("--max_difficulty", type=str, default=None,
+                    help="With --personalize, leave out exercises harder than beginner, intermediate or advanced.")
+parser.add_argument("--training_log", type=str, default=None,
+                    help=("A training log directory (see training_log.py). With --personalize, each exercise notes "
+                          "the recipient's last best set, estimated 1RM trend and weekly volume."))
+parser.add_argument("--html_only", action="store_true",
+                    help="Send html emails instead of multipart emails with a plain text alternative.")
+parser.add_argument("--catalog", type=str, default=None,
+                    help="A JSON, TOML or YAML catalog file defining exercises, routines, workouts and programs.")
+parser.add_argument("--program", type=str, default=None, help="The workout program to send. Defaults to WS4SB.")
+parser.add_argument("--outbox", type=str, default=None,
+                    help=("Path to an outbox (SQLite) of pre-rendered emails. With --pregenerate emails are rendered "
+                          "into it; otherwise emails are sent from it instead of being rendered."))
+parser.add_argument("--pregenerate", type=int, default=None, metavar="DAYS",
+                    help="Render the next DAYS days of workouts (from today or --date) into --outbox and exit without sending.")
+parser.add_argument("--shard", type=str, default=None, metavar="I/N",
+                    help="Only send to shard I (counting from 0) of N, to split recipients between N runner instances.")
+parser.add_argument("--lease_db", type=str, default=None,
+                    help=("With --shard, a lease store (SQLite) shared by all instances. Instances lease their shard "
+                          "while sending, and take over the shards of instances that died or never started."))
+parser.add_argument("--lease_ttl", type=float, default=60,
+                    help="Seconds before the lease of an unresponsive instance can be taken over.")
+parser.add_argument("--metrics_file", type=str, default=None,
+                    help=("Record timings (catalog load, selection, render, MIME build, connect, send) and counters, "
+                          "and write them here at the end of the run or after each daemon send: a Prometheus "
+                          "textfile if the path ends in .prom, otherwise appended JSON lines."))
+parser.add_argument("--profile", type=str, default=None, metavar="DIR",
+                    help=("Profile the run and write a cProfile pstats file, the top allocation sites and sampled "
+                          "stacks for flamegraphs to DIR. Slows the run down."))
+parser.add_argument("--profile_top", type=int, default=25, help="Number of allocation sites --profile reports.")
+parser.add_argument("--daemon", action="store_true",
+                    help="Keep running and send every day at the --schedule times instead of once.")
+parser.add_argument("--schedule", type=str, action="append", default=None,
+                    help=("With --daemon, a PROGRAM@HH:MM (local time) to send. Repeat for several programs. "
+                          "Defaults to the --program at 06:00."))
 
-CURRENT_WORKOUT = workout_program.WS4SB
+CURRENT_PROGRAM = "WS4SB"
 
-if __name__ == "__main__":
+
+def delivery(args):
+    """Returns the `(ConnectionPool, AdaptiveRateLimiter)` to send with."""
+    import functools
+    import mailer
+    import ratelimit
+
+    factory = functools.partial(
+        mailer.SMTPConnection, args.smtp_host, args.smtp_port,
+        username=args.username, password=args.app_password, security=args.smtp_security)
+    pool = mailer.ConnectionPool(factory, args.pool_size, args.max_messages_per_connection)
+    limiter = ratelimit.AdaptiveRateLimiter(args.max_per_second, per_day=args.max_per_day,
+                                            budget_path=args.budget_db or args.journal or args.outbox)
+    return pool, limiter
+
+
+def read_recipients(args):
+    """Returns the --recipients or --recipients_file addresses, read lazily."""
+    import recipients as recipient_list
+
+    return recipient_list.read_recipients(
+        args.recipients, args.recipients_file,
+        on_invalid=lambda address: print(f"Skipping invalid address: {address!r}", file=sys.stderr))
+
+
+def body_formats(args):
+    """Returns the `templates` formats each email is sent in, html first."""
+    import templates
+
+    return (templates.HTML,) if args.html_only else (templates.HTML, templates.TEXT)
+
+
+def encoded_bodies(args, program_name, workout, date, recipients, render_pool=None, profiles=None):
+    """Renders and encodes the email body for each recipient.
+
+    `profiles` optionally maps recipients to their `selection.Profile`.
+
+    Yields:
+        `(recipient, encoded body)` pairs, in recipient order.
+    """
+    import mailer
+    import metrics
+    import personalize
+    import render_cache
+    import selection
+
+    formats = body_formats(args)
+    if args.personalize:
+        profile = selection.Profile.parse(args.equipment, args.avoid_muscles, args.max_difficulty)
+        # Recipients with the same selection share one encoded body.
+        bodies = render_cache.RenderCache()
+        for recipient, key, parts in personalize.render_all(
+                program_name, date, recipients, workers=args.render_workers,
+                rotation_db=args.rotation_db, catalog_path=args.catalog, executor=render_pool,
+                profile=profile, profiles=profiles, training_log_path=args.training_log, formats=formats):
+            yield recipient, bodies.get(key, lambda: mailer.encode_body(*parts))
+    else:
+        with metrics.timer("render"):
+            parts = workout.render(formats)
+        body = mailer.encode_body(*parts)
+        for recipient in recipients:
+            yield recipient, body
+
+
+def report_failures(result):
+    """Prints the recipients a `mailer.DeliveryResult` failed for and returns how many there are."""
+    if result.error is not None:
+        print(f"Failed to send to {', '.join(result.recipients)}: {result.error}", file=sys.stderr)
+        return len(result.recipients)
+    for recipient, (code, message) in result.refused.items():
+        print(f"Failed to send to {recipient}: {code} {message.decode('utf-8', 'replace')}", file=sys.stderr)
+    return len(result.refused)
+
+
+def send(args, program_name, workout, date, pool, limiter, render_pool=None, recipients=None, profiles=None):
+    """Sends a workout to every recipient.
+
+    Args:
+        args: The parsed command line arguments.
+        program_name: `string` The program the workout is from.
+        workout: `Workout` The workout to send.
+        date: `date` The workout date.
+        pool: `mailer.ConnectionPool` to send through.
+        limiter: `ratelimit.AdaptiveRateLimiter` to pace sending.
+        render_pool: Optional `personalize.worker_pool` to render with.
+        recipients: Optional iterable of addresses. Defaults to the
+            --recipients or --recipients_file addresses.
+        profiles: Optional mapping of recipient to `selection.Profile`.
+
+    Returns:
+        The number of recipients that could not be sent to.
+
+    Raises:
+        mailer.SMTPUnavailable: If the login is rejected or the server can't
+            be reached.
+    """
+    import contextlib
+    import journal
+    import mailer
+    import metrics
+
+    subject = f"WORKOUT: {workout.name}"
+
+    if recipients is None:
+        recipients = read_recipients(args)
+    delivery_journal = journal.DeliveryJournal(args.journal) if args.journal else None
+    if delivery_journal is not None:
+        recipients = delivery_journal.pending(date, workout.name, recipients)
+    if args.chunk_size > 1:
+        with metrics.timer("render"):
+            parts = workout.render(body_formats(args))
+        payload = mailer.encode_message(
+            mailer.build_message(args.username, mailer.UNDISCLOSED_RECIPIENTS, subject, *parts))
+        jobs = mailer.batch_jobs(payload, recipients, args.chunk_size)
+    else:
+        jobs = ((mailer.build_payload(args.username, recipient, subject, body), [recipient])
+                for recipient, body in encoded_bodies(
+                    args, program_name, workout, date, recipients, render_pool, profiles))
+
+    failed = 0
+    with contextlib.ExitStack() as stack:
+        if delivery_journal is not None:
+            stack.enter_context(delivery_journal)
+        for result in mailer.DeliveryEngine(pool, limiter=limiter).deliver(jobs):
+            failed += report_failures(result)
+            if result.error is None and delivery_journal is not None:
+                delivery_journal.record(date, workout.name, result.recipients)
+    return failed
+
+
+def audiences(args):
+    """Returns `(program name, recipient list, profiles)` for everyone to render for.
+
+    `profiles` maps recipients to their `selection.Profile`, if they have one.
+    """
+    import collections
+    import subscribers
+
+    shard = this_shard(args)
+    if args.subscribers_file:
+        groups = collections.defaultdict(list)
+        profiles = {}
+        for subscriber in subscribers.read_subscribers(args.subscribers_file, on_invalid=lambda row, reason: print(
+                f"Skipping subscriber {row.get('email')!r}: {reason}", file=sys.stderr)):
+            if shard is None or subscriber.email in shard:
+                groups[subscriber.program].append(subscriber.email)
+                if subscriber.profile is not None:
+                    profiles[subscriber.email] = subscriber.profile
+        return [(program_name, emails, profiles) for program_name, emails in groups.items()]
+    recipients = read_recipients(args)
+    if shard is not None:
+        recipients = shard.filter(recipients)
+    return [(args.program or CURRENT_PROGRAM, list(recipients), None)]
+
+
+def pregenerate(args, start, days):
+    """Renders the coming days' emails into the outbox without sending them.
+
+    Args:
+        args: The parsed command line arguments.
+        start: `date` The first day to render.
+        days: `int` The number of days to render.
+
+    Returns:
+        The number of emails added to the outbox.
+    """
+    import contextlib
+    import outbox
+    import personalize
+
+    added = 0
+    groups = audiences(args)
+    with contextlib.ExitStack() as stack:
+        box = stack.enter_context(outbox.Outbox(args.outbox))
+        render_pool = None
+        if args.personalize:
+            render_pool = stack.enter_context(personalize.worker_pool(args.render_workers, args.catalog))
+        for offset in range(days):
+            date = start + datetime.timedelta(days=offset)
+            for program_name, recipients, profiles in groups:
+                program = workout_program.PROGRAMS[program_name]
+                if date.weekday() not in program:
+                    continue
+                workout = program[date.weekday()]
+                count = box.put(date, program_name, workout.name, f"WORKOUT: {workout.name}",
+                                encoded_bodies(args, program_name, workout, date, recipients, render_pool, profiles))
+                print(f"Pregenerated {count} {program_name} emails for {date}")
+                added += count
+    return added
+
+
+def deliver(args, date, pool, limiter, program_name=None, recipients=None, guard=iter):
+    """Sends the emails waiting in the outbox for a day.
+
+    Args:
+        args: The parsed command line arguments.
+        date: `date` The delivery day.
+        pool: `mailer.ConnectionPool` to send through.
+        limiter: `ratelimit.AdaptiveRateLimiter` to pace sending.
+        program_name: `string` The program whose emails to send. Defaults to
+            every program's, one program after another.
+        recipients: Optional collection of addresses to limit to.
+        guard: Wraps the outbox messages, e.g. to stop when a lease is lost.
+
+    Returns:
+        The number of recipients that could not be sent to.
+
+    Raises:
+        mailer.SMTPUnavailable: If the login is rejected or the server can't
+            be reached.
+    """
+    import mailer
+    import outbox
+    import render_cache
+
+    failed = 0
+    with outbox.Outbox(args.outbox) as box:
+        bodies = render_cache.RenderCache()
+        for program in [program_name] if program_name is not None else box.programs(date):
+            jobs = ((mailer.build_payload(args.username, message.recipient, message.subject,
+                                          bodies.get(message.body_key, lambda: box.body(message.body_key))),
+                     [message.recipient])
+                    for message in guard(box.pending(date, program, recipients)))
+            for result in mailer.DeliveryEngine(pool, limiter=limiter).deliver(jobs):
+                failed += report_failures(result)
+                if result.error is None:
+                    box.mark_sent(date, program, result.recipients)
+    return failed
+
+
+def write_metrics(args):
+    """Writes the metrics recorded so far to --metrics_file, if given."""
+    if args.metrics_file:
+        import metrics
+        metrics.write(args.metrics_file)
+
+
+def this_shard(args):
+    """Returns the `sharding.Shard` from --shard, or None."""
+    if args.shard is None:
+        return None
+    import sharding
+    return sharding.Shard(*args.shard)
+
+
+def sharded(args, date, job, send_shard):
+    """Sends to this instance's shard and, with --lease_db, any it takes over.
+
+    Without --lease_db only this instance's shard is sent. With it, the shard
+    is leased first, then the instance keeps taking over shards whose lease
+    expired, or that are still unclaimed after --lease_ttl, until every shard
+    is done.
+
+    Args:
+        args: The parsed command line arguments.
+        date: `date` The delivery day.
+        job: `string` Names what is being sent, to key the leases.
+        send_shard: Callable taking `(shard, guard)` that sends to the
+            recipients in a `sharding.Shard` and returns the number of
+            failures. `guard` wraps an iterable and stops it if the lease is
+            lost.
+
+    Returns:
+        The number of recipients that could not be sent to.
+    """
+    import time
+    import sharding
+
+    index, count = args.shard or (0, 1)
+    if not args.lease_db:
+        return send_shard(sharding.Shard(index, count), iter)
+
+    owner = sharding.default_owner()
+    started = time.time()
+    order = [index] + [i for i in range(count) if i != index]
+    failed = 0
+    with sharding.LeaseStore(args.lease_db) as leases:
+        while True:
+            states = leases.status(date, job, count)
+            if all(state == leases.DONE for state in states):
+                return failed
+            waited = time.time() - started >= args.lease_ttl
+            claimable = [i for i in order if states[i] == leases.EXPIRED
+                         or (states[i] == leases.UNCLAIMED and (i == index or waited))]
+            if not claimable or not leases.acquire(date, job, claimable[0], owner, args.lease_ttl):
+                time.sleep(args.lease_ttl / 3)
+                continue
+            shard = sharding.Shard(claimable[0], count)
+            if shard.index != index:
+                print(f"Taking over shard {shard} of {job} for {date}")
+            with sharding.Lease(args.lease_db, date, job, shard.index, owner, args.lease_ttl) as lease:
+                failed += send_shard(shard, lease.guard)
+            if lease.lost.is_set():
+                print(f"Lost the lease on shard {shard} of {job} for {date}", file=sys.stderr)
+            else:
+                leases.complete(date, job, shard.index, owner)
+
+
+def daemon(args):
+    """Stays running and sends each scheduled program at its time of day.
+
+    With --subscribers_file, each subscriber is instead sent their own
+    program at their own local time, and with --outbox emails are sent from
+    the outbox rather than rendered. The catalog, compiled templates, SMTP
+    pool and render processes are kept warm between sends.
+    """
+    import asyncio
+    import contextlib
+    import signal
+    import personalize
+    import scheduler
+    import subscribers
+    import templates
+
+    pool, limiter = delivery(args)
+    render_pool = personalize.worker_pool(args.render_workers, args.catalog) if args.personalize else None
+    daily = scheduler.Scheduler()
+
+    if args.subscribers_file:
+        for program in workout_program.PROGRAMS.values():
+            for workout in program.values():
+                templates.compile_workout(workout)
+
+        def fire_subscribers(program_name, date, due):
+            # Give a pool tripped by an earlier send another chance.
+            pool.reset()
+            shard = this_shard(args)
+            emails = [subscriber.email for subscriber in due]
+            if shard is not None:
+                emails = list(shard.filter(emails))
+            if args.outbox:
+                failed = deliver(args, date, pool, limiter, program_name, recipients=set(emails))
+            else:
+                workout = workout_program.PROGRAMS[program_name][date.weekday()]
+                profiles = {subscriber.email: subscriber.profile for subscriber in due if subscriber.profile}
+                failed = send(args, program_name, workout, date, pool, limiter, render_pool,
+                              recipients=emails, profiles=profiles)
+            daily.log(f"Sent {program_name} for {date} to {len(emails)} subscribers, {failed} failed")
+            write_metrics(args)
+
+        job = subscribers.SubscriberJob(args.subscribers_file, fire_subscribers, clock=daily.clock)
+        daily.add(job)
+        daily.log(f"Scheduled {len(job.index)} subscribers")
+
+    for entry in args.schedule or ():
+        program_name, _, time_of_day = entry.partition("@")
+        if program_name not in workout_program.PROGRAMS:
+            parser.error(f"Unknown program {program_name!r} in --schedule {entry}.")
+        program = workout_program.PROGRAMS[program_name]
+        for workout in program.values():
+            templates.compile_workout(workout)
+
+        def fire(date, program_name=program_name, program=program):
+            if date.weekday() not in program:
+                return
+            pool.reset()
+            if args.outbox:
+                failed = sharded(args, date, program_name, lambda shard, guard: deliver(
+                    args, date, pool, limiter, program_name, recipients=shard, guard=guard))
+            else:
+                failed = sharded(args, date, program_name, lambda shard, guard: send(
+                    args, program_name, program[date.weekday()], date, pool, limiter, render_pool,
+                    recipients=guard(shard.filter(read_recipients(args)))))
+            daily.log(f"Sent {program_name} for {date}, {failed} failed")
+            write_metrics(args)
+
+        daily.add(scheduler.DailyJob(program_name, scheduler.parse_time_of_day(time_of_day or "06:00"), fire))
+
+    async def run():
+        task = asyncio.ensure_future(daily.run())
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, task.cancel)
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(pool)
+        if render_pool is not None:
+            stack.enter_context(render_pool)
+        asyncio.run(run())
+    return 0
+
+
+def main(argv=None):
     # Parse the command line arguments
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.rotation_db and not args.personalize:
+        parser.error("--rotation_db requires --personalize.")
+    if args.training_log and not args.personalize:
+        parser.error("--training_log requires --personalize.")
+    if args.equipment or args.avoid_muscles or args.max_difficulty:
+        if not args.personalize:
+            parser.error("--equipment, --avoid_muscles and --max_difficulty require --personalize.")
+        import selection
+        try:
+            selection.Profile.parse(args.equipment, args.avoid_muscles, args.max_difficulty)
+        except ValueError as e:
+            parser.error(f"--max_difficulty: {e}")
+    if args.personalize and args.chunk_size > 1:
+        parser.error("--personalize sends a different email to each recipient and can't be used with --chunk_size.")
+
+    from_outbox = args.outbox and args.pregenerate is None
+    if not (from_outbox or args.recipients or args.recipients_file or args.subscribers_file):
+        parser.error("one of the arguments --recipients --recipients_file --subscribers_file is required")
+    if args.subscribers_file and not (args.daemon or args.pregenerate):
+        parser.error("--subscribers_file requires --daemon or --pregenerate.")
+    if args.subscribers_file and args.schedule:
+        parser.error("--schedule can't be used with --subscribers_file, the schedule comes from the subscribers.")
+    if args.shard:
+        import sharding
+        try:
+            args.shard = sharding.parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(f"--shard: {e}")
+    if args.lease_db and not args.shard:
+        parser.error("--lease_db requires --shard.")
+    if args.lease_db and not (args.journal or args.outbox):
+        parser.error("--lease_db needs a --journal or --outbox shared by all instances, so taken over shards "
+                     "skip recipients that were already sent.")
+    if args.recipients_file == "-" and (args.lease_db or args.daemon):
+        parser.error("--recipients_file - can't be used with --lease_db or --daemon, which read the recipients "
+                     "again for each shard taken over or each day; stdin can only be read once.")
+    if args.lease_db and args.subscribers_file:
+        parser.error("--lease_db can't be used with --subscribers_file; subscribers are only split by --shard.")
+    if args.pregenerate is not None and not args.outbox:
+        parser.error("--pregenerate requires --outbox.")
+    if args.pregenerate is not None and args.daemon:
+        parser.error("--pregenerate can't be used with --daemon.")
+    if args.outbox and args.chunk_size > 1:
+        parser.error("The outbox holds an email per recipient and can't be used with --chunk_size.")
+    if from_outbox and args.personalize:
+        parser.error("Emails in the outbox are already rendered; use --personalize with --pregenerate.")
+
+    if args.metrics_file:
+        import metrics
+        metrics.enable()
+    try:
+        if args.profile:
+            import profiling
+            with profiling.Profiler(args.profile, top=args.profile_top):
+                return run(args)
+        return run(args)
+    finally:
+        write_metrics(args)
+
+
+def run(args):
+    """Sends, pregenerates or starts the daemon, after `main` validated `args`.
+
+    Returns:
+        The process exit code.
+    """
+    from_outbox = args.outbox and args.pregenerate is None
+    if args.catalog:
+        import catalog
+        import metrics
+        with metrics.timer("catalog_load"):
+            catalog.register(args.catalog)
+    if args.pregenerate is not None:
+        added = pregenerate(args, args.date or datetime.date.today(), args.pregenerate)
+        print(f"Added {added} emails to {args.outbox}")
+        return 0
+    if args.daemon:
+        if args.date:
+            parser.error("--date can't be used with --daemon.")
+        if not args.subscribers_file:
+            args.schedule = args.schedule or [f"{args.program or CURRENT_PROGRAM}@06:00"]
+        return daemon(args)
+
+    program_name = args.program or CURRENT_PROGRAM
+    if program_name not in workout_program.PROGRAMS:
+        parser.error(f"Unknown program {program_name!r}.")
+    program = workout_program.PROGRAMS[program_name]
 
     # Get today as a weekday integer
-    today = datetime.datetime.today().weekday()
-
-    # See if today is a workout day
-    if today in CURRENT_WORKOUT.keys():
-        workout = CURRENT_WORKOUT.get(today)
-        subject = f"WORKOUT: {workout.name}"
-        # Handle newlines in html (yagmail v0.14.245 see https://github.com/kootenpv/yagmail/issues/116)
-        contents = [workout.as_html().replace("\n","")]
-
-        with yagmail.SMTP(user=args.username, password=args.app_password) as yag:
-            for recipient in args.recipients.split(","):
-                yag.send(to=recipient, subject=subject, contents=contents)
+    date = args.date or datetime.date.today()
+    today = date.weekday()
+
+    if from_outbox:
+        pool, limiter = delivery(args)
+        job, send_shard = "outbox", lambda shard, guard: deliver(
+            args, date, pool, limiter, recipients=shard, guard=guard)
+    else:
+        # See if today is a workout day
+        if today not in program.keys():
+            return 0
+        import metrics
+        with metrics.timer("catalog_load"):
+            workout = program[today]
+        pool, limiter = delivery(args)
+        job, send_shard = program_name, lambda shard, guard: send(
+            args, program_name, workout, date, pool, limiter,
+            recipients=guard(shard.filter(read_recipients(args))))
+
+    import mailer
+    try:
+        with pool:
+            failed = sharded(args, date, job, send_shard)
+    except mailer.SMTPUnavailable as e:
+        print(f"Stopped sending: {e}", file=sys.stderr)
+        return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+An asyncio scheduler for long running (daemon) mode.
+
+Jobs sit in a heap ordered by their next fire time. The loop never sleeps for
+longer than `check_interval`, so if the wall clock jumps (NTP corrections,
+suspend and resume, manual changes) the schedule is re-checked against the
+new time promptly. Fires that were missed by less than `grace` seconds run
+late; older ones are skipped and reported.
+"""
+import asyncio
+import datetime
+import heapq
+import itertools
+import sys
+import time
+
+
+def parse_time_of_day(value):
+    """Parses `HH:MM` into a `datetime.time`."""
+    hours, _, minutes = value.partition(":")
+    return datetime.time(int(hours), int(minutes or 0))
+
+
+class DailyJob(object):
+    """Calls a function once a day at a local time of day."""
+
+    def __init__(self, name, time_of_day, function):
+        """Constructs a DailyJob.
+
+        Args:
+            name: `string` A name for log messages.
+            time_of_day: `datetime.time` When to fire, in local time.
+            function: A blocking callable taking the local `date` of the fire.
+                It runs on a worker thread.
+        """
+        self.name = name
+        self.time_of_day = time_of_day
+        self.function = function
+
+    def next_fire(self, after):
+        """Returns the first fire time (a POSIX timestamp) strictly after `after`."""
+        day = datetime.datetime.fromtimestamp(after).date()
+        while True:
+            # Naive local datetimes go through mktime, which accounts for DST.
+            fire = datetime.datetime.combine(day, self.time_of_day).timestamp()
+            if fire > after:
+                return fire
+            day += datetime.timedelta(days=1)
+
+    def __call__(self, fire_time):
+        return self.function(datetime.datetime.fromtimestamp(fire_time).date())
+
+
+class Scheduler(object):
+    """Runs jobs at their fire times until cancelled."""
+
+    def __init__(self, grace=3600, check_interval=30, clock=time.time):
+        """Constructs a Scheduler.
+
+        Args:
+            grace: `float` Seconds a fire may be late and still run.
+            check_interval: `float` Longest sleep between wall clock checks.
+            clock: A wall clock returning POSIX timestamps, for testing.
+        """
+        self.grace = grace
+        self.check_interval = check_interval
+        self.clock = clock
+
+        self._heap = []
+        self._sequence = itertools.count()
+        self._running = set()
+
+    def add(self, job):
+        """Schedules a job with `next_fire(after)` and `__call__(fire_time)` methods."""
+        heapq.heappush(self._heap, (job.next_fire(self.clock()), next(self._sequence), job))
+
+    def log(self, message):
+        print(f"{datetime.datetime.now().isoformat(timespec='seconds')} {message}", flush=True)
+
+    async def _fire(self, job, fire_time):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, job, fire_time)
+        except Exception as e:
+            print(f"Job {job.name} failed: {e!r}", file=sys.stderr, flush=True)
+
+    async def run(self):
+        """Fires jobs forever. Cancel the task to stop."""
+        try:
+            while self._heap:
+                fire_time, _, job = self._heap[0]
+                now = self.clock()
+                if fire_time > now:
+                    await asyncio.sleep(min(fire_time - now, self.check_interval))
+                    continue
+
+                heapq.heappop(self._heap)
+                if now - fire_time <= self.grace:
+                    # Jobs that tick often can opt out of the log line.
+                    if not getattr(job, "quiet", False):
+                        self.log(f"Running {job.name}")
+                    task = asyncio.ensure_future(self._fire(job, fire_time))
+                    self._running.add(task)
+                    task.add_done_callback(self._running.discard)
+                else:
+                    self.log(f"Skipping {job.name}: missed its fire time by {now - fire_time:.0f}s")
+                # Schedule from now, so fires passed over by a clock jump
+                # forwards are skipped rather than replayed.
+                heapq.heappush(self._heap, (job.next_fire(now), next(self._sequence), job))
+        finally:
+            if self._running:
+                await asyncio.gather(*self._running, return_exceptions=True)
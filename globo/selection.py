@@ -0,0 +1,192 @@
+"""
+Pickers choose exercises for a single recipient.
+
+A picker is any object with a `pick(routine, slot, options)` method that
+returns one `Exercise` from `options`. `slot` is the index of the exercise
+group within the routine (always 0 for a plain `ExerciseRoutine`).
+"""
+import hashlib
+import random
+import threading
+
+import exercise
+
+
+class RandomPicker(object):
+    """Picks uniformly at random from a `random.Random` generator."""
+
+    def __init__(self, rng=None):
+        """Constructs a RandomPicker.
+
+        Args:
+            rng: `random.Random` The generator to draw from. Defaults to a
+                new, randomly seeded generator.
+        """
+        self.rng = rng or random.Random()
+
+    def pick(self, routine, slot, options):
+        return self.rng.choice(options)
+
+
+class HashPicker(object):
+    """Picks by hashing (program, date, recipient, routine, slot).
+
+    There is no RNG state at all: every pick is a pure function of its key, so
+    any email ever sent can be regenerated exactly, on any machine, by
+    rendering it again with the same arguments.
+    """
+
+    def __init__(self, program_name, date, recipient):
+        """Constructs a HashPicker.
+
+        Args:
+            program_name: `string` The workout program name.
+            date: `date` The date of the workout.
+            recipient: `string` The recipient's email address.
+        """
+        self.prefix = f"{program_name}|{date.isoformat()}|{recipient}|"
+
+    def index(self, routine_name, slot, count):
+        """Returns the index, in `range(count)`, picked for a routine slot."""
+        key = f"{self.prefix}{routine_name}|{slot}".encode("utf-8")
+        digest = hashlib.blake2b(key, digest_size=8).digest()
+        return int.from_bytes(digest, "big") % count
+
+    def pick(self, routine, slot, options):
+        return options[self.index(routine.name, slot, len(options))]
+
+
+class Profile(object):
+    """A user's constraints: equipment on hand, muscles to avoid and a difficulty cap.
+
+    Profiles are interned, so users with the same constraints share one
+    profile and its cache of filtered exercise groups.
+    """
+
+    __slots__ = ("equipment", "avoid_muscles", "max_difficulty", "_bitmap", "_allowed", "_lock")
+
+    _interned = {}
+
+    def __new__(cls, equipment=None, avoid_muscles=(), max_difficulty=None):
+        """Constructs a Profile.
+
+        Args:
+            equipment: Optional iterable of `string` equipment on hand. None
+                means a fully equipped gym.
+            avoid_muscles: Iterable of `string` muscle groups to leave out.
+            max_difficulty: Optional `int` hardest `exercise` difficulty.
+        """
+        equipment = None if equipment is None else frozenset(item.lower() for item in equipment)
+        avoid_muscles = frozenset(muscle.lower() for muscle in avoid_muscles)
+        key = (equipment, avoid_muscles, max_difficulty)
+        self = cls._interned.get(key)
+        if self is None:
+            self = super().__new__(cls)
+            self.equipment, self.avoid_muscles, self.max_difficulty = key
+            self._bitmap = None
+            self._allowed = {}
+            self._lock = threading.Lock()
+            self = cls._interned.setdefault(key, self)
+        return self
+
+    @classmethod
+    def parse(cls, equipment=None, avoid_muscles=None, max_difficulty=None):
+        """Builds a Profile from text, e.g. the columns of a subscribers file.
+
+        Args:
+            equipment: `string` Equipment separated by `;` or `,`, `none` for
+                bodyweight only, or empty for a fully equipped gym.
+            avoid_muscles: `string` Muscle groups separated by `;` or `,`.
+            max_difficulty: `string` `beginner`, `intermediate`, `advanced`
+                or a number.
+
+        Returns:
+            A `Profile`, or None if there are no constraints.
+
+        Raises:
+            ValueError: If `max_difficulty` isn't recognized.
+        """
+        def items(value):
+            return [item.strip() for item in (value or "").replace(";", ",").split(",") if item.strip()]
+
+        equipment_items = items(equipment)
+        if equipment_items == ["none"]:
+            equipment_items = []
+        difficulty = None
+        if max_difficulty:
+            levels = {"beginner": exercise.BEGINNER, "intermediate": exercise.INTERMEDIATE,
+                      "advanced": exercise.ADVANCED}
+            difficulty = levels.get(max_difficulty.strip().lower())
+            if difficulty is None:
+                if not max_difficulty.strip().isdigit():
+                    raise ValueError(f"unknown difficulty {max_difficulty!r}")
+                difficulty = int(max_difficulty)
+        profile = cls(equipment_items if (equipment or "").strip() else None, items(avoid_muscles), difficulty)
+        return None if profile.unconstrained else profile
+
+    @property
+    def unconstrained(self):
+        return self.equipment is None and not self.avoid_muscles and self.max_difficulty is None
+
+    def bitmap(self):
+        """Returns the exercises this profile allows, from `exercise.matching`, as a bitmap."""
+        bitmap = self._bitmap
+        if bitmap is None or bitmap[0] != len(exercise.EXERCISES):
+            mask = exercise.matching(self.equipment, self.avoid_muscles, self.max_difficulty)
+            bitmap = self._bitmap = (len(exercise.EXERCISES), exercise.to_bitmap(mask))
+        return bitmap[1]
+
+    def _fallback(self, options):
+        # Nothing in the group is allowed: keep the options whose missing
+        # equipment is the most common, rather than specialty machines.
+        def cost(e):
+            missing = e.equipment - self.equipment if self.equipment is not None else ()
+            return sum(1 / exercise.tag_count(f"equipment:{item}") for item in missing)
+
+        lowest = min(cost(e) for e in options)
+        return exercise.ExerciseIds(e for e in options if cost(e) == lowest)
+
+    def allowed(self, options):
+        """Returns the exercises of a group to pick from, as `exercise.ExerciseIds`.
+
+        Each group is filtered once per profile by intersecting bitsets; after
+        that it is a dictionary lookup. If the profile rules out every option,
+        the options needing the most common missing equipment are returned.
+        """
+        allowed = self._allowed.get(options)
+        if allowed is None:
+            allowed = options.select(self.bitmap()) or self._fallback(options)
+            with self._lock:
+                self._allowed[options] = allowed
+        return allowed
+
+    def __reduce__(self):
+        equipment = None if self.equipment is None else sorted(self.equipment)
+        return (Profile, (equipment, sorted(self.avoid_muscles), self.max_difficulty))
+
+    def __repr__(self):
+        return f"Profile({self.equipment!r}, {self.avoid_muscles!r}, {self.max_difficulty!r})"
+
+
+class ConstrainedPicker(object):
+    """Wraps another picker to pick only exercises a `Profile` allows.
+
+    If a profile rules out every option in a group, the closest options are
+    used rather than leaving the routine without an exercise (see
+    `Profile.allowed`).
+    """
+
+    def __init__(self, profile, picker):
+        """Constructs a ConstrainedPicker.
+
+        Args:
+            profile: `Profile` The user's constraints.
+            picker: The picker that chooses among the allowed exercises.
+        """
+        self.profile = profile
+        self.picker = picker
+
+    def pick(self, routine, slot, options):
+        if isinstance(options, exercise.ExerciseIds):
+            options = self.profile.allowed(options)
+        return self.picker.pick(routine, slot, options)
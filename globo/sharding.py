@@ -0,0 +1,237 @@
+"""
+Splits recipients between several runner instances.
+
+Recipients are assigned to shards on a consistent hash ring, so every
+instance agrees on the split without talking to the others, and changing the
+number of shards only moves about 1/N of the recipients.
+
+Instances can also coordinate through a `LeaseStore`: each one leases its
+shard for the day and keeps the lease alive while it sends. When an instance
+finishes it takes over shards whose leases expired (their instance died) or
+were never claimed. Any store with the same methods, such as a service
+backed one, can stand in for the SQLite implementation.
+"""
+import bisect
+import hashlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+# Points per shard on the ring. More points even out shard sizes.
+REPLICAS = 128
+
+
+def parse_shard(value):
+    """Parses `i/N` (0 <= i < N) into an `(index, count)` tuple."""
+    index, _, count = value.partition("/")
+    index, count = int(index), int(count)
+    if not 0 <= index < count:
+        raise ValueError(f"shard {value!r} should be i/N with 0 <= i < N")
+    return index, count
+
+
+def _point(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing(object):
+    """A consistent hash ring of shard numbers."""
+
+    def __init__(self, count, replicas=REPLICAS):
+        """Constructs a HashRing.
+
+        Args:
+            count: `int` The number of shards.
+            replicas: `int` Points per shard on the ring.
+        """
+        self.count = count
+        ring = sorted((_point(f"shard-{shard}-{replica}"), shard)
+                      for shard in range(count) for replica in range(replicas))
+        self._points = [point for point, _ in ring]
+        self._shards = [shard for _, shard in ring]
+
+    def shard_for(self, key):
+        """Returns the shard number that owns `key`."""
+        position = bisect.bisect(self._points, _point(key)) % len(self._points)
+        return self._shards[position]
+
+
+class Shard(object):
+    """The recipients that belong to one shard.
+
+    Supports `in`, so it can be passed wherever a collection of recipients is
+    used to filter.
+    """
+
+    _rings = {}
+
+    def __init__(self, index, count):
+        self.index = index
+        self.count = count
+        if count > 1 and count not in Shard._rings:
+            Shard._rings[count] = HashRing(count)
+        self._ring = Shard._rings.get(count)
+
+    def __contains__(self, recipient):
+        return self._ring is None or self._ring.shard_for(recipient) == self.index
+
+    def filter(self, recipients):
+        """Returns an iterator over the recipients that belong to this shard."""
+        if self._ring is None:
+            return iter(recipients)
+        return (recipient for recipient in recipients if recipient in self)
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+
+def default_owner():
+    """Returns a name for this process that is unique across hosts."""
+    return f"{socket.gethostname()}:{os.getpid()}:{os.urandom(4).hex()}"
+
+
+class LeaseStore(object):
+    """Time limited leases on (day, job, shard), kept in SQLite.
+
+    Every instance must use the same database file, e.g. on a shared disk.
+    """
+
+    # Lease states returned by `status`.
+    UNCLAIMED = "unclaimed"
+    HELD = "held"
+    EXPIRED = "expired"
+    DONE = "done"
+
+    def __init__(self, path, clock=time.time):
+        """Opens (or creates) a lease store.
+
+        Args:
+            path: `string` Path to the SQLite database file.
+            clock: A wall clock returning POSIX timestamps. Instances on
+                different hosts need reasonably synchronized clocks.
+        """
+        self.path = path
+        self.clock = clock
+        # Autocommit, so transactions can be started with BEGIN IMMEDIATE.
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            " day TEXT NOT NULL,"
+            " job TEXT NOT NULL,"
+            " shard INTEGER NOT NULL,"
+            " owner TEXT NOT NULL,"
+            " expires REAL NOT NULL,"
+            " done INTEGER NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (day, job, shard)"
+            ") WITHOUT ROWID")
+
+    def acquire(self, day, job, shard, owner, ttl):
+        """Takes the lease if it is unclaimed, expired or already ours.
+
+        Args:
+            day: `date` The delivery day.
+            job: `string` What is being sent, e.g. the program name.
+            shard: `int` The shard number.
+            owner: `string` Who is taking the lease.
+            ttl: `float` Seconds until the lease expires unless renewed.
+
+        Returns:
+            True if the lease is now held by `owner`.
+        """
+        now = self.clock()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute(
+                "SELECT owner, expires, done FROM leases WHERE day = ? AND job = ? AND shard = ?",
+                (day.isoformat(), job, shard)).fetchone()
+            if row is not None and (row[2] or (row[0] != owner and row[1] > now)):
+                return False
+            self.db.execute(
+                "INSERT OR REPLACE INTO leases VALUES (?, ?, ?, ?, ?, 0)",
+                (day.isoformat(), job, shard, owner, now + ttl))
+            return True
+        finally:
+            self.db.execute("COMMIT")
+
+    def renew(self, day, job, shard, owner, ttl):
+        """Extends a lease held by `owner`.
+
+        Returns:
+            False if the lease was lost, e.g. taken over after expiring.
+        """
+        cursor = self.db.execute(
+            "UPDATE leases SET expires = ? WHERE day = ? AND job = ? AND shard = ? AND owner = ? AND NOT done",
+            (self.clock() + ttl, day.isoformat(), job, shard, owner))
+        return cursor.rowcount == 1
+
+    def complete(self, day, job, shard, owner):
+        """Marks a shard as finished so it is never taken over."""
+        self.db.execute(
+            "UPDATE leases SET done = 1 WHERE day = ? AND job = ? AND shard = ? AND owner = ?",
+            (day.isoformat(), job, shard, owner))
+
+    def status(self, day, job, count):
+        """Returns the state of each of `count` shards as a `list`."""
+        now = self.clock()
+        states = [self.UNCLAIMED] * count
+        rows = self.db.execute(
+            "SELECT shard, expires, done FROM leases WHERE day = ? AND job = ? AND shard < ?",
+            (day.isoformat(), job, count))
+        for shard, expires, done in rows:
+            states[shard] = self.DONE if done else self.HELD if expires > now else self.EXPIRED
+        return states
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Lease(object):
+    """Keeps a lease alive from a background thread while work is done.
+
+    Use as a context manager after a successful `LeaseStore.acquire`. If a
+    renewal fails, `lost` is set and the work should stop.
+    """
+
+    def __init__(self, path, day, job, shard, owner, ttl):
+        self.path = path
+        self.day = day
+        self.job = job
+        self.shard = shard
+        self.owner = owner
+        self.ttl = ttl
+        self.lost = threading.Event()
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, daemon=True)
+
+    def _heartbeat(self):
+        # SQLite connections belong to the thread that opened them.
+        with LeaseStore(self.path) as store:
+            while not self._stop.wait(self.ttl / 3):
+                if not store.renew(self.day, self.job, self.shard, self.owner, self.ttl):
+                    self.lost.set()
+                    return
+
+    def guard(self, recipients):
+        """Yields recipients until the lease is lost."""
+        for recipient in recipients:
+            if self.lost.is_set():
+                return
+            yield recipient
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
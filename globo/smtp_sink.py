@@ -0,0 +1,151 @@
+"""
+A local, in-process SMTP server that accepts and stores every message.
+
+Useful as a stand-in for a real relay when trying out the delivery engine:
+
+    with SMTPSink() as sink:
+        ...  # send to sink.host, sink.port with security "none"
+        print(len(sink.messages))
+"""
+import collections
+import socketserver
+import threading
+
+ReceivedMessage = collections.namedtuple("ReceivedMessage", ["sender", "recipients", "data"])
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for `smtplib` to deliver messages."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        sink = self.server.sink
+        sender, recipients = None, []
+        messages_on_connection = 0
+
+        self.reply("220 globo sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("ascii", "replace").strip()
+            verb = command[:4].upper()
+
+            if verb == "EHLO":
+                self.reply("250-globo sink")
+                self.reply("250-AUTH PLAIN LOGIN")
+                self.reply("250 8BITMIME")
+            elif verb == "HELO":
+                self.reply("250 globo sink")
+            elif verb == "AUTH":
+                with sink._lock:
+                    sink.logins += 1
+                if sink.reject_login:
+                    self.reply("535 Authentication credentials invalid")
+                else:
+                    self.reply("235 Authentication successful")
+            elif verb == "MAIL":
+                if sink.drop_after and messages_on_connection >= sink.drop_after:
+                    # Simulate a relay that hangs up partway through a session.
+                    return
+                sender, recipients = command[10:].strip("<> "), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipient = command[8:].strip("<> ")
+                if recipient in sink.refuse:
+                    self.reply("550 No such user")
+                    continue
+                recipients.append(recipient)
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                for data_line in self.rfile:
+                    if data_line in (b".\r\n", b".\n"):
+                        break
+                    if data_line.startswith(b".."):
+                        data_line = data_line[1:]
+                    data.append(data_line)
+                if sink.should_throttle():
+                    self.reply(f"{sink.throttle_code} Try again later")
+                    continue
+                sink.store(ReceivedMessage(sender, recipients, b"".join(data)))
+                messages_on_connection += 1
+                self.reply("250 OK queued")
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class _SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink(object):
+    """Runs an SMTP server on a background thread and records what it receives."""
+
+    def __init__(self, host="127.0.0.1", port=0, drop_after=None, throttle_every=None,
+                 throttle_code=451, refuse=(), reject_login=False):
+        """Constructs an SMTPSink.
+
+        Args:
+            host: `string` The interface to listen on.
+            port: `int` The port to listen on. 0 picks a free port.
+            drop_after: `int` If set, drop each connection after this many
+                messages to exercise reconnect logic.
+            throttle_every: `int` If set, reject every nth message with
+                `throttle_code` to exercise rate limiting.
+            throttle_code: `int` The transient SMTP code to reject with.
+            refuse: Recipient addresses to refuse with a 550 at RCPT TO.
+            reject_login: `bool` Reject every login with a 535.
+        """
+        self.drop_after = drop_after
+        self.throttle_every = throttle_every
+        self.throttle_code = throttle_code
+        self.refuse = frozenset(refuse)
+        self.reject_login = reject_login
+        self.logins = 0
+        self._received = 0
+        self.messages = []
+
+        self._lock = threading.Lock()
+        self._server = _SMTPServer((host, port), _SMTPHandler)
+        self._server.sink = self
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = None
+
+    def should_throttle(self):
+        if not self.throttle_every:
+            return False
+        with self._lock:
+            self._received += 1
+            return self._received % self.throttle_every == 0
+
+    def store(self, message):
+        with self._lock:
+            self.messages.append(message)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,148 @@
+"""
+Measures cold start latency of the runner, the way cron invokes it.
+
+Each scenario runs in a fresh interpreter with `-X importtime`. Wall time
+percentiles and the slowest top-level imports are printed, and with
+`--output` appended as JSON lines so startup can be tracked over time:
+
+    python globo/startup_bench.py --runs 20 --output startup.jsonl
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+import catalog
+import workout_program
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RUNNER = os.path.join(HERE, "runner.py")
+
+# "import time: self [us] | cumulative | imported package", nesting shown by indent.
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def next_rest_day(program, start=None):
+    """Returns the first date on or after `start` with no workout."""
+    date = start or datetime.date.today()
+    while date.weekday() in program:
+        date += datetime.timedelta(days=1)
+    return date
+
+
+def scenarios(program_name, catalog_path=None):
+    """Returns the interpreter arguments of each scenario, by name.
+
+    Args:
+        program_name: `string` A key of `workout_program.PROGRAMS`, after
+            registering `catalog_path`.
+        catalog_path: `string` Optional absolute path to a catalog file that
+            defines the program.
+    """
+    program = workout_program.PROGRAMS[program_name]
+    runner_args = [RUNNER, "--username", "bench@localhost", "--app_password", "unused",
+                   "--recipients", "bench@localhost", "--program", program_name]
+    register = ""
+    if catalog_path:
+        runner_args += ["--catalog", catalog_path]
+        register = f"import catalog; catalog.register({catalog_path!r}); "
+    result = {}
+    if len(program) < 7:
+        # A cron invocation on a day without a workout.
+        result["rest_day"] = runner_args + ["--date", next_rest_day(program).isoformat()]
+    if program:
+        # Everything a workout day imports before it starts sending.
+        result["workout_day_imports"] = [
+            "-c", f"{register}import runner, journal, mailer, personalize, ratelimit, recipients, render_cache, "
+                  f"workout_program; workout_program.PROGRAMS[{program_name!r}][{min(program)}]"]
+    return result
+
+
+def top_imports(stderr, count):
+    """Returns the `count` slowest top-level imports as `(module, ms)` pairs."""
+    imports = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match and len(match.group(3)) == 1:
+            imports.append((match.group(4), int(match.group(2)) / 1000))
+    return sorted(imports, key=lambda item: -item[1])[:count]
+
+
+def run(args, runs):
+    """Runs a scenario `runs` times.
+
+    Returns:
+        A `(wall times in ms, importtime stderr of the median run)` tuple.
+    """
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, "-X", "importtime"] + args, cwd=HERE,
+                                 capture_output=True, text=True)
+        elapsed = (time.perf_counter() - start) * 1000
+        if process.returncode != 0:
+            raise RuntimeError(f"{' '.join(args)} exited with {process.returncode}:\n{process.stderr}")
+        results.append((elapsed, process.stderr))
+    results.sort(key=lambda result: result[0])
+    return [elapsed for elapsed, _ in results], results[len(results) // 2][1]
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def previous_records(path):
+    records = {}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                records[record["scenario"]] = record
+    return records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark cold start latency of the Globo runner.")
+    parser.add_argument("--runs", type=int, default=10, help="Interpreter launches per scenario.")
+    parser.add_argument("--program", type=str, default="WS4SB", help="The workout program to start up with.")
+    parser.add_argument("--catalog", type=str, default=None, help="A catalog file defining the program.")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest imports to report.")
+    parser.add_argument("--output", type=str, default=None, help="Append results to this JSON lines file.")
+    args = parser.parse_args()
+    catalog_path = None
+    if args.catalog:
+        # Scenarios run from this directory.
+        catalog_path = os.path.abspath(args.catalog)
+        catalog.register(catalog_path)
+    if args.program not in workout_program.PROGRAMS:
+        parser.error(f"Unknown program {args.program!r}.")
+
+    previous = previous_records(args.output)
+    for name, scenario_args in scenarios(args.program, catalog_path).items():
+        times, stderr = run(scenario_args, args.runs)
+        record = {
+            "scenario": name,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "runs": args.runs,
+            "p50_ms": round(statistics.median(times), 2),
+            "p90_ms": round(percentile(times, 0.9), 2),
+            "max_ms": round(times[-1], 2),
+            "top_imports": top_imports(stderr, args.top),
+        }
+
+        change = ""
+        if name in previous:
+            change = f" ({record['p50_ms'] - previous[name]['p50_ms']:+.1f} ms vs last run)"
+        print(f"{name}: p50 {record['p50_ms']} ms, p90 {record['p90_ms']} ms, max {record['max_ms']} ms{change}")
+        for module, ms in record["top_imports"]:
+            print(f"    {module:<30} {ms:8.2f} ms")
+
+        if args.output:
+            with open(args.output, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
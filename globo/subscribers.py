@@ -0,0 +1,225 @@
+"""
+Subscribers with their own program, timezone and send time.
+
+Subscribers are kept in a `ScheduleIndex` keyed by (UTC fire time bucket,
+program). Each tick looks up only the buckets that have come due instead of
+scanning every subscriber, and each subscriber is re-indexed at its next fire
+time after being sent.
+"""
+import collections
+import csv
+import datetime
+import os
+import sys
+import threading
+import zoneinfo
+
+import recipients as recipient_list
+import scheduler
+import selection
+import workout_program
+
+# `profile` is a `selection.Profile`, or None for no constraints.
+Subscriber = collections.namedtuple("Subscriber", ["email", "program", "timezone", "send_time", "profile"])
+
+# A subscriber whose workout is due: `date` is their local date at `fire_time`.
+Due = collections.namedtuple("Due", ["subscriber", "date", "fire_time"])
+
+DEFAULT_PROGRAM = "WS4SB"
+DEFAULT_TIMEZONE = "UTC"
+DEFAULT_SEND_TIME = "06:00"
+
+
+def read_subscribers(path, on_invalid=None):
+    """Reads subscribers from a CSV file.
+
+    The file needs an `email` column and may have `program`, `timezone` (an
+    IANA name such as `America/New_York`) and `send_time` (`HH:MM`, local)
+    columns. Missing values default to WS4SB at 06:00 UTC. Optional
+    `equipment`, `avoid_muscles` and `max_difficulty` columns set a
+    constraint profile (see `selection.Profile.parse`).
+
+    Args:
+        path: `string` Path to the CSV file.
+        on_invalid: Optional callable invoked with `(row, reason)` for rows
+            that are skipped.
+
+    Yields:
+        `Subscriber` tuples.
+    """
+    seen = recipient_list.Deduplicator()
+    try:
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                row = {key.strip().lower(): (value or "").strip() for key, value in row.items() if key}
+                email = recipient_list.normalize(row.get("email", ""))
+                try:
+                    if not recipient_list.is_valid(email):
+                        raise ValueError("invalid email")
+                    subscriber = Subscriber(
+                        email,
+                        row.get("program") or DEFAULT_PROGRAM,
+                        zoneinfo.ZoneInfo(row.get("timezone") or DEFAULT_TIMEZONE),
+                        scheduler.parse_time_of_day(row.get("send_time") or DEFAULT_SEND_TIME),
+                        selection.Profile.parse(row.get("equipment"), row.get("avoid_muscles"),
+                                                row.get("max_difficulty")))
+                    if subscriber.program not in workout_program.PROGRAMS:
+                        raise ValueError(f"unknown program {subscriber.program!r}")
+                except (ValueError, zoneinfo.ZoneInfoNotFoundError) as e:
+                    if on_invalid is not None:
+                        on_invalid(row, str(e))
+                    continue
+                if seen.add(email):
+                    yield subscriber
+    finally:
+        seen.close()
+
+
+def next_fire(subscriber, after):
+    """Returns the next workout fire time for a subscriber.
+
+    Args:
+        subscriber: `Subscriber`
+        after: `float` A POSIX timestamp; the result is strictly later.
+
+    Returns:
+        A `(timestamp, local date)` tuple, or None if the program has no
+        workout days.
+    """
+    program = workout_program.PROGRAMS[subscriber.program]
+    day = datetime.datetime.fromtimestamp(after, subscriber.timezone).date()
+    for _ in range(8):
+        if day.weekday() in program:
+            fire = datetime.datetime.combine(day, subscriber.send_time, subscriber.timezone).timestamp()
+            if fire > after:
+                return fire, day
+        day += datetime.timedelta(days=1)
+    return None
+
+
+class ScheduleIndex(object):
+    """Subscribers bucketed by (UTC fire time bucket, program)."""
+
+    def __init__(self, bucket_seconds=60):
+        """Constructs a ScheduleIndex.
+
+        Args:
+            bucket_seconds: `int` Width of a fire time bucket. Send times are
+                rounded down to it.
+        """
+        self.bucket_seconds = bucket_seconds
+        # The last bucket handed out by `due`.
+        self.cursor = None
+
+        self._buckets = collections.defaultdict(list)
+        self._programs = set()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _add(self, subscriber, after):
+        fire = next_fire(subscriber, after)
+        if fire is None:
+            return
+        self._buckets[(int(fire[0] // self.bucket_seconds), subscriber.program)].append(subscriber)
+        self._programs.add(subscriber.program)
+        self._size += 1
+
+    def add(self, subscriber, after):
+        """Indexes a subscriber at their first fire time after `after`."""
+        with self._lock:
+            self._add(subscriber, after)
+
+    def due(self, now, grace=None):
+        """Removes and returns everyone due up to `now`.
+
+        Every bucket since the previous call is covered, so ticks that run
+        late don't lose anyone. Subscribers are re-indexed at their next fire.
+
+        Args:
+            now: `float` The current POSIX timestamp.
+            grace: `float` Optional seconds a fire may be late. Subscribers
+                missed by longer are re-indexed without being returned.
+
+        Returns:
+            A `list` of `Due` tuples.
+        """
+        with self._lock:
+            current = int(now // self.bucket_seconds)
+            first = current if self.cursor is None else self.cursor + 1
+            fired = []
+            for bucket in range(first, current + 1):
+                fire_time = bucket * self.bucket_seconds
+                for program in self._programs:
+                    for subscriber in self._buckets.pop((bucket, program), ()):
+                        self._size -= 1
+                        fired.append((subscriber, fire_time))
+            self.cursor = current
+
+            due = []
+            for subscriber, fire_time in fired:
+                if grace is None or now - fire_time <= grace:
+                    local = datetime.datetime.fromtimestamp(fire_time, subscriber.timezone)
+                    due.append(Due(subscriber, local.date(), fire_time))
+                self._add(subscriber, fire_time + self.bucket_seconds - 1)
+            return due
+
+    def __len__(self):
+        return self._size
+
+
+class SubscriberJob(object):
+    """A `scheduler` job that ticks every bucket and sends to due subscribers.
+
+    The subscribers file is re-read whenever it changes.
+    """
+
+    name = "subscribers"
+    quiet = True
+
+    def __init__(self, path, send, bucket_seconds=60, grace=3600, clock=None):
+        """Constructs a SubscriberJob.
+
+        Args:
+            path: `string` The subscribers CSV file.
+            send: Callable taking `(program_name, date, subscribers)`, invoked
+                once per program and local date that has subscribers due.
+            bucket_seconds: `int` Tick interval and index bucket width.
+            grace: `float` Seconds a send may be late and still go out.
+            clock: Optional wall clock for the initial index build.
+        """
+        self.path = path
+        self.send = send
+        self.bucket_seconds = bucket_seconds
+        self.grace = grace
+        self.index = None
+        self._mtime = None
+        self._clock = clock or (lambda: datetime.datetime.now().timestamp())
+
+    def reload(self, now):
+        """Rebuilds the index if the subscribers file changed."""
+        mtime = os.stat(self.path).st_mtime
+        if mtime == self._mtime:
+            return
+        index = ScheduleIndex(self.bucket_seconds)
+        if self.index is not None and self.index.cursor is not None:
+            # Index from the end of the last bucket sent, so nothing is
+            # repeated and nothing due since is lost.
+            index.cursor = self.index.cursor
+            now = (index.cursor + 1) * self.bucket_seconds - 1
+        for subscriber in read_subscribers(self.path, on_invalid=lambda row, reason: print(
+                f"Skipping subscriber {row.get('email')!r}: {reason}", file=sys.stderr, flush=True)):
+            index.add(subscriber, now)
+        self.index, self._mtime = index, mtime
+
+    def next_fire(self, after):
+        if self.index is None:
+            self.reload(self._clock())
+        return (int(after // self.bucket_seconds) + 1) * self.bucket_seconds
+
+    def __call__(self, fire_time):
+        self.reload(fire_time)
+        groups = collections.defaultdict(list)
+        for item in self.index.due(fire_time, self.grace):
+            groups[(item.subscriber.program, item.date)].append(item.subscriber)
+        for (program_name, date), due in groups.items():
+            self.send(program_name, date, due)
@@ -0,0 +1,358 @@
+"""
+Compiled templates that render workouts as html, plain text and Markdown.
+
+Everything static about a workout (its header, the warm up link, each
+routine's name and instructions, each exercise's link) is formatted once per
+output format into fragments and cached. Rendering a workout then traverses
+the chosen exercises once, and each format's `Writer` streams its fragments to
+a `write` callable, such as a list's `append` or a file's `write`.
+"""
+import html
+
+WARM_UP_URL = "https://www.youtube.com/watch?v=qQ96oXp5RTU"
+
+HTML = "html"
+TEXT = "text"
+MARKDOWN = "markdown"
+
+# Compiled templates and fragments, keyed by the object they were compiled from.
+_exercise_fragments = {}
+_routine_templates = {}
+_workout_templates = {}
+
+
+def exercise_html(exercise):
+    """Returns the cached html link for an exercise."""
+    fragment = _exercise_fragments.get(exercise)
+    if fragment is None:
+        fragment = _exercise_fragments[exercise] = (
+            f"{html.escape(exercise.name)} (<a href=\"{html.escape(exercise.url)}\">example</a>)")
+    return fragment
+
+
+def summary_text(summary):
+    """Returns the plain text note for a `training_log.Summary`."""
+    # Imported here so rendering without a training log doesn't load NumPy.
+    import training_log
+
+    unit = training_log.LOAD_UNIT
+    trend = "" if summary.trend is None else f" ({summary.trend:+.1f}/wk)"
+    return (f"Last time: {summary.last_sets}x{summary.last_reps} @ {summary.last_load:g}{unit}"
+            f", est. 1RM {summary.best_e1rm:.0f}{unit}{trend}"
+            f", {training_log.VOLUME_DAYS}-day volume {summary.weekly_volume:,.0f}{unit}")
+
+
+class Writer(object):
+    """Writes a workout in one format to a `write` callable.
+
+    Subclasses define a `_format_<part>` method for each static part
+    (`workout_head`, `workout_tail`, `routine_head`, `routine_tail`,
+    `exercise_head` and `exercise_tail`) and `_format_summary`. Static parts
+    are formatted once per object and cached per subclass, so rendering only
+    looks them up.
+    """
+
+    format = None
+
+    def __init__(self, write):
+        """Constructs a Writer.
+
+        Args:
+            write: Callable taking each `string` fragment, in order.
+        """
+        self.write = write
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._workouts = {}
+        cls._routines = {}
+        # Whole exercises, for the common case without a summary, and
+        # (head, tail) pairs to write a summary between.
+        cls.exercises = {}
+        cls._exercise_parts = {}
+
+    def workout_joints(self, workout):
+        """Returns the static text between the workout's exercise lists.
+
+        That's the workout head and first routine head, each routine tail
+        joined with the next routine's head, and the last routine tail and
+        the workout tail: one more fragment than there are routines.
+        """
+        joints = self._workouts.get(workout)
+        if joints is None:
+            joints = [self._format_workout_head(workout)]
+            for head, tail in (self.routine_parts(routine) for routine in workout.routines):
+                joints[-1] += head
+                joints.append(tail)
+            joints[-1] += self._format_workout_tail(workout)
+            joints = self._workouts[workout] = tuple(joints)
+        return joints
+
+    def routine_parts(self, routine):
+        """Returns the routine's `(head, tail)`."""
+        parts = self._routines.get(routine)
+        if parts is None:
+            parts = self._routines[routine] = (
+                self._format_routine_head(routine), self._format_routine_tail(routine))
+        return parts
+
+    def exercise(self, exercise):
+        """Returns the fragment for an exercise. Also cached in `exercises`."""
+        fragment = self.exercises.get(exercise)
+        if fragment is None:
+            fragment = self.exercises[exercise] = "".join(self.exercise_parts(exercise))
+        return fragment
+
+    def exercise_parts(self, exercise):
+        """Returns the exercise's `(head, tail)`, to write a summary between."""
+        parts = self._exercise_parts.get(exercise)
+        if parts is None:
+            parts = self._exercise_parts[exercise] = (
+                self._format_exercise_head(exercise), self._format_exercise_tail(exercise))
+        return parts
+
+    def write_exercise(self, exercise, summary=None):
+        """Writes an exercise, noting its `training_log.Summary` if given."""
+        if summary is None:
+            self.write(self.exercise(exercise))
+            return
+        head, tail = self.exercise_parts(exercise)
+        self.write(head)
+        self.write(self._format_summary(summary))
+        self.write(tail)
+
+
+def _write_exercises(streams, exercises, history):
+    # The hot loop: every exercise goes to every writer, usually as a single
+    # cached fragment. `streams` holds a `(writer, write, exercises)` tuple
+    # per writer.
+    for exercise in exercises:
+        summary = history.get(exercise.name) if history else None
+        for writer, write, fragments in streams:
+            if summary is not None:
+                writer.write_exercise(exercise, summary)
+                continue
+            fragment = fragments.get(exercise)
+            write(fragment if fragment is not None else writer.exercise(exercise))
+
+
+def _streams(writers):
+    return [(writer, writer.write, writer.exercises) for writer in writers]
+
+
+class HtmlWriter(Writer):
+    """Minified html: a list of routines, each with a list of exercise links."""
+
+    format = HTML
+
+    def _format_workout_head(self, workout):
+        return (f"<p><b>{html.escape(workout.name)}</b></p>"
+                f"<p>Don't forget to <a href=\"{WARM_UP_URL}\">warm up</a>!</p><ul>")
+
+    def _format_workout_tail(self, workout):
+        return "</ul>"
+
+    def _format_routine_head(self, routine):
+        return (f"<li><b>{html.escape(routine.name)}</b> "
+                f"{html.escape(routine.instructions.rstrip('.'))}:<ul>")
+
+    def _format_routine_tail(self, routine):
+        return "</ul></li>"
+
+    def _format_exercise_head(self, exercise):
+        return f"<li>{exercise_html(exercise)}"
+
+    def _format_exercise_tail(self, exercise):
+        return "</li>"
+
+    def _format_summary(self, summary):
+        return f"<br><i>{html.escape(summary_text(summary))}</i>"
+
+
+class TextWriter(Writer):
+    """Plain text, for clients and gateways (SMS, chat) without html."""
+
+    format = TEXT
+
+    def _format_workout_head(self, workout):
+        return f"{workout.name}\n\nDon't forget to warm up: {WARM_UP_URL}\n\n"
+
+    def _format_workout_tail(self, workout):
+        return ""
+
+    def _format_routine_head(self, routine):
+        return f"{routine.name}: {routine.instructions}\n"
+
+    def _format_routine_tail(self, routine):
+        return "\n"
+
+    def _format_exercise_head(self, exercise):
+        return f"  - {exercise.name}: {exercise.url}"
+
+    def _format_exercise_tail(self, exercise):
+        return "\n"
+
+    def _format_summary(self, summary):
+        return f"\n    {summary_text(summary)}"
+
+
+def _markdown_escape(text):
+    return "".join(f"\\{c}" if c in "\\`*_[]#<>|" else c for c in text)
+
+
+class MarkdownWriter(Writer):
+    """Markdown, with the same structure as the html."""
+
+    format = MARKDOWN
+
+    def _format_workout_head(self, workout):
+        return f"**{_markdown_escape(workout.name)}**\n\nDon't forget to [warm up]({WARM_UP_URL})!\n\n"
+
+    def _format_workout_tail(self, workout):
+        return ""
+
+    def _format_routine_head(self, routine):
+        return f"- **{_markdown_escape(routine.name)}** {_markdown_escape(routine.instructions.rstrip('.'))}:\n"
+
+    def _format_routine_tail(self, routine):
+        return ""
+
+    def _format_exercise_head(self, exercise):
+        url = exercise.url.replace(" ", "%20").replace("(", "%28").replace(")", "%29")
+        return f"  - [{_markdown_escape(exercise.name)}]({url})"
+
+    def _format_exercise_tail(self, exercise):
+        return "\n"
+
+    def _format_summary(self, summary):
+        return f"  \n    *{_markdown_escape(summary_text(summary))}*"
+
+
+# Writer classes by format name.
+WRITERS = {writer.format: writer for writer in (HtmlWriter, TextWriter, MarkdownWriter)}
+
+
+class RoutineTemplate(object):
+    """A compiled `ExerciseRoutine`."""
+
+    def __init__(self, routine):
+        self.routine = routine
+
+    def render_to(self, writers, exercises, history=None):
+        """Writes the routine with the given exercises to every writer in one pass.
+
+        Args:
+            writers: `Writer` objects to write to.
+            exercises: The `Exercise` objects to list.
+            history: Optional mapping of exercise name to
+                `training_log.Summary`, noted under each exercise.
+        """
+        parts = [writer.routine_parts(self.routine) for writer in writers]
+        for writer, (head, _) in zip(writers, parts):
+            writer.write(head)
+        _write_exercises(_streams(writers), exercises, history)
+        for writer, (_, tail) in zip(writers, parts):
+            writer.write(tail)
+
+    def render(self, picker=None, history=None):
+        """Renders the routine as html."""
+        out = []
+        self.render_to((HtmlWriter(out.append),), self.routine.get_exercises(picker), history)
+        return "".join(out)
+
+
+class WorkoutTemplate(object):
+    """A compiled `Workout`: its routine templates."""
+
+    def __init__(self, workout):
+        self.workout = workout
+        self.routines = [compile_routine(routine) for routine in workout.routines]
+
+    def select(self, picker=None):
+        """Chooses the exercises for every routine.
+
+        Args:
+            picker: Optional picker passed to each routine's `get_exercises`.
+
+        Returns:
+            A `tuple` with a `tuple` of `Exercise` objects per routine.
+        """
+        return tuple(tuple(template.routine.get_exercises(picker)) for template in self.routines)
+
+    def render_to(self, writers, selection, history=None):
+        """Writes the workout for a selection from `select` to every writer in one pass.
+
+        Args:
+            writers: `Writer` objects to write to.
+            selection: The exercises chosen by `select`.
+            history: Optional mapping of exercise name to
+                `training_log.Summary` for the recipient.
+        """
+        streams = _streams(writers)
+        joints = [(write, writer.workout_joints(self.workout)) for writer, write, _ in streams]
+        for i, exercises in enumerate(selection):
+            for write, fragments in joints:
+                write(fragments[i])
+            _write_exercises(streams, exercises, history)
+        for write, fragments in joints:
+            write(fragments[-1])
+
+    def render_formats(self, selection, formats=(HTML,), history=None):
+        """Renders the workout for a selection in several formats at once.
+
+        Args:
+            selection: The exercises chosen by `select`.
+            formats: Names of formats in `WRITERS`.
+            history: Optional mapping of exercise name to
+                `training_log.Summary` for the recipient.
+
+        Returns:
+            A `tuple` of `string`s, one per format in `formats`.
+        """
+        outs = [[] for _ in formats]
+        self.render_to([WRITERS[name](out.append) for name, out in zip(formats, outs)], selection, history)
+        return tuple(map("".join, outs))
+
+    def render_selection(self, selection, history=None):
+        """Renders the workout for a selection from `select` as html.
+
+        Args:
+            selection: The exercises chosen by `select`.
+            history: Optional mapping of exercise name to
+                `training_log.Summary` for the recipient.
+
+        Returns:
+            The minified html `string`.
+        """
+        out = []
+        self.render_to((HtmlWriter(out.append),), selection, history)
+        return "".join(out)
+
+    def render(self, picker=None, history=None):
+        """Renders the workout as html in one pass.
+
+        Args:
+            picker: Optional picker passed to each routine's `get_exercises`.
+            history: Optional mapping of exercise name to
+                `training_log.Summary` for the recipient.
+
+        Returns:
+            The minified html `string`.
+        """
+        return self.render_selection(self.select(picker), history)
+
+
+def compile_routine(routine):
+    """Returns the cached `RoutineTemplate` for a routine."""
+    template = _routine_templates.get(routine)
+    if template is None:
+        template = _routine_templates[routine] = RoutineTemplate(routine)
+    return template
+
+
+def compile_workout(workout):
+    """Returns the cached `WorkoutTemplate` for a workout."""
+    template = _workout_templates.get(workout)
+    if template is None:
+        template = _workout_templates[workout] = WorkoutTemplate(workout)
+    return template
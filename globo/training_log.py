@@ -0,0 +1,386 @@
+"""
+A training log of the sets, reps and load each user did of each exercise.
+
+Rows are stored column by column in append-only segment files: each flush
+writes a new segment and existing segments are never modified (until
+`compact` merges them). Users and exercise names are dictionary encoded
+into small integer codes, so a row is 20 bytes.
+
+Queries run over whole columns at once, with NumPy when it is installed and
+a single pass over `array` columns otherwise, so summaries for thousands of
+users come from one query rather than one per user:
+
+    python globo/training_log.py --log training_log record someone@email.com "Bench Press" 3 5 100
+    python globo/training_log.py --log training_log import sets.csv
+    python globo/training_log.py --log training_log show someone@email.com
+"""
+import argparse
+import array
+import collections
+import csv
+import datetime
+import math
+import os
+import struct
+import sys
+import tempfile
+import time
+
+import recipients as recipient_list
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+LOAD_UNIT = "kg"
+
+# Days of history used for the weekly volume and the estimated 1RM trend.
+VOLUME_DAYS = 7
+TREND_DAYS = 56
+
+SEGMENT_SUFFIX = ".seg"
+_HEADER = struct.Struct("<8sI")
+_MAGIC = b"GLOGSEG1"
+
+# (name, array typecode, numpy dtype) of each column, in file order. Columns
+# are stored little endian.
+COLUMNS = (
+    ("user", "I", "<u4"),
+    ("exercise", "I", "<u4"),
+    ("day", "i", "<i4"),
+    ("sets", "H", "<u2"),
+    ("reps", "H", "<u2"),
+    ("load", "f", "<f4"),
+)
+
+# What a user has done of an exercise, as of a day. `last_*` is the best set
+# (by estimated 1RM) of the most recent session, `trend` the change in
+# estimated 1RM per week over the last TREND_DAYS (None with fewer than two
+# sessions), and `weekly_volume` the sets x reps x load of the last
+# VOLUME_DAYS.
+Summary = collections.namedtuple(
+    "Summary", ["last_day", "last_sets", "last_reps", "last_load", "best_e1rm", "trend", "weekly_volume"])
+
+
+def estimated_1rm(load, reps):
+    """Returns the Epley estimated one rep max of a set."""
+    return load * (1 + reps / 30) if reps > 1 else load
+
+
+class _Dictionary(object):
+    """An append-only file of names; a name's code is its line number."""
+
+    def __init__(self, path):
+        self.path = path
+        self.names = []
+        self.codes = {}
+        self._offset = 0
+        self.refresh()
+
+    def refresh(self):
+        """Reads names appended (by any process) since the last refresh."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        # Ignore a partly written last line.
+        complete = data[:data.rfind(b"\n") + 1]
+        for name in complete.decode("utf-8").splitlines():
+            self.codes[name] = len(self.names)
+            self.names.append(name)
+        self._offset += len(complete)
+
+    def code(self, name):
+        """Returns the code for a name, adding it if it is new."""
+        code = self.codes.get(name)
+        if code is None:
+            self.refresh()
+            code = self.codes.get(name)
+        if code is None:
+            with open(self.path, "ab") as f:
+                f.write(name.encode("utf-8") + b"\n")
+            self.refresh()
+            code = self.codes[name]
+        return code
+
+
+class TrainingLog(object):
+    """A directory of column segments plus the user and exercise dictionaries."""
+
+    def __init__(self, path):
+        """Opens (or creates) a training log.
+
+        Args:
+            path: `string` The log directory.
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.users = _Dictionary(os.path.join(path, "users.txt"))
+        self.exercises = _Dictionary(os.path.join(path, "exercises.txt"))
+
+        self._pending = {name: array.array(typecode) for name, typecode, _ in COLUMNS}
+        self._loaded = None
+        self._columns = None
+
+    def record(self, user, exercise_name, date, sets, reps, load):
+        """Adds a row. It is written to disk by the next `flush`.
+
+        Args:
+            user: `string` The user's email address. It is normalized like
+                the runner's recipients, so rows for one address are kept
+                together however it was capitalized.
+            exercise_name: `string` The `Exercise` name.
+            date: `date` When the sets were done.
+            sets: `int` Number of sets.
+            reps: `int` Reps per set.
+            load: `float` Load per rep, in LOAD_UNIT.
+        """
+        row = (self.users.code(recipient_list.normalize(user)), self.exercises.code(exercise_name), date.toordinal(), sets, reps, load)
+        for (name, _, _), value in zip(COLUMNS, row):
+            self._pending[name].append(value)
+
+    def flush(self):
+        """Writes recorded rows as a new segment."""
+        count = len(self._pending["user"])
+        if not count:
+            return
+        self._write(os.path.join(self.path, f"{time.time_ns():020d}-{os.getpid()}{SEGMENT_SUFFIX}"),
+                    self._pending, count)
+        self._pending = {name: array.array(typecode) for name, typecode, _ in COLUMNS}
+
+    def _write(self, path, columns, count):
+        fd, tmp = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, count))
+            for name, typecode, _ in COLUMNS:
+                column = array.array(typecode, columns[name])
+                if sys.byteorder == "big":
+                    column.byteswap()
+                column.tofile(f)
+        # Readers only ever see complete segments.
+        os.replace(tmp, path)
+
+    def segments(self):
+        """Returns the segment paths, oldest first."""
+        return sorted(os.path.join(self.path, name) for name in os.listdir(self.path)
+                      if name.endswith(SEGMENT_SUFFIX))
+
+    def columns(self):
+        """Returns every flushed row as a `dict` of column name to array.
+
+        The arrays are NumPy arrays when NumPy is installed, `array.array`
+        otherwise. Segments are only re-read when they have changed.
+        """
+        segments = self.segments()
+        if segments == self._loaded:
+            return self._columns
+        self.users.refresh()
+        self.exercises.refresh()
+
+        parts = {name: [] for name, _, _ in COLUMNS}
+        for segment in segments:
+            with open(segment, "rb") as f:
+                data = f.read()
+            magic, count = _HEADER.unpack_from(data)
+            if magic != _MAGIC:
+                raise ValueError(f"{segment} is not a training log segment")
+            offset = _HEADER.size
+            for name, typecode, dtype in COLUMNS:
+                if numpy is not None:
+                    column = numpy.frombuffer(data, dtype=dtype, count=count, offset=offset)
+                else:
+                    column = array.array(typecode)
+                    column.frombytes(data[offset:offset + count * column.itemsize])
+                    if sys.byteorder == "big":
+                        column.byteswap()
+                parts[name].append(column)
+                offset += count * struct.calcsize(typecode)
+
+        columns = {}
+        for name, typecode, dtype in COLUMNS:
+            if numpy is not None:
+                columns[name] = numpy.concatenate(parts[name]) if parts[name] else numpy.zeros(0, dtype)
+            else:
+                columns[name] = array.array(typecode)
+                for part in parts[name]:
+                    columns[name].extend(part)
+        self._loaded, self._columns = segments, columns
+        return columns
+
+    def compact(self):
+        """Merges all segments into one.
+
+        Returns:
+            The number of segments merged.
+        """
+        self.flush()
+        segments = self.segments()
+        if len(segments) < 2:
+            return len(segments)
+        columns = self.columns()
+        # Named after the newest segment, so it still sorts after older ones.
+        merged = segments[-1][:-len(SEGMENT_SUFFIX)] + "-compacted" + SEGMENT_SUFFIX
+        self._write(merged, columns, len(columns["user"]))
+        for segment in segments:
+            os.remove(segment)
+        return len(segments)
+
+    def __len__(self):
+        return len(self.columns()["user"])
+
+    def summaries(self, users, exercise_names, date):
+        """Summarizes many users' history of many exercises in one query.
+
+        Args:
+            users: Iterable of `string` email addresses, normalized like
+                `record` does.
+            exercise_names: Iterable of `string` exercise names.
+            date: `date` Summarize as of this day; later rows are ignored.
+
+        Returns:
+            A `dict` of `(user, exercise name)` to `Summary`, for the pairs
+            with any history.
+        """
+        columns = self.columns()
+        users = {recipient_list.normalize(user) for user in users}
+        user_codes = {self.users.codes[user] for user in users if user in self.users.codes}
+        exercise_codes = {self.exercises.codes[name] for name in exercise_names if name in self.exercises.codes}
+        if not user_codes or not exercise_codes or not len(columns["user"]):
+            return {}
+        if numpy is not None:
+            groups = _summaries_numpy(columns, user_codes, exercise_codes, date.toordinal())
+        else:
+            groups = _summaries_python(columns, user_codes, exercise_codes, date.toordinal())
+        return {(self.users.names[user], self.exercises.names[code]): summary
+                for (user, code), summary in groups.items()}
+
+
+def _slope_per_week(points):
+    """Least squares slope of `(day, value)` points, per week."""
+    if len(points) < 2:
+        return None
+    n = len(points)
+    sx = sum(x for x, _ in points)
+    sy = sum(y for _, y in points)
+    sxx = sum(x * x for x, _ in points)
+    sxy = sum(x * y for x, y in points)
+    denominator = n * sxx - sx * sx
+    return (n * sxy - sx * sy) / denominator * 7 if denominator else None
+
+
+def _summaries_python(columns, user_codes, exercise_codes, day):
+    last = {}
+    best = {}
+    volume = collections.Counter()
+    daily_best = collections.defaultdict(dict)
+    rows = zip(columns["user"], columns["exercise"], columns["day"], columns["sets"], columns["reps"],
+               columns["load"])
+    for user, code, row_day, sets, reps, load in rows:
+        if row_day > day or user not in user_codes or code not in exercise_codes:
+            continue
+        key = (user, code)
+        e1rm = estimated_1rm(load, reps)
+        if key not in last or (row_day, e1rm, sets) > last[key][:3]:
+            last[key] = (row_day, e1rm, sets, reps, load)
+        best[key] = max(best.get(key, 0.0), e1rm)
+        if row_day > day - VOLUME_DAYS:
+            volume[key] += sets * reps * load
+        if row_day > day - TREND_DAYS:
+            days = daily_best[key]
+            days[row_day - day] = max(days.get(row_day - day, 0.0), e1rm)
+
+    return {key: Summary(datetime.date.fromordinal(last[key][0]), last[key][2], last[key][3], float(last[key][4]),
+                         best[key], _slope_per_week(list(daily_best[key].items())), float(volume[key]))
+            for key in last}
+
+
+def _summaries_numpy(columns, user_codes, exercise_codes, day):
+    users, codes, days = columns["user"], columns["exercise"], columns["day"]
+    selected = (days <= day) & numpy.isin(users, list(user_codes)) & numpy.isin(codes, list(exercise_codes))
+    if not selected.any():
+        return {}
+    users, codes, days = users[selected], codes[selected], days[selected]
+    sets = columns["sets"][selected]
+    reps = columns["reps"][selected].astype(numpy.float64)
+    load = columns["load"][selected].astype(numpy.float64)
+    e1rm = numpy.where(reps > 1, load * (1 + reps / 30), load)
+
+    # Sort by (user, exercise), then day, estimated 1RM and sets, so each
+    # group's last row is the best set of its most recent session.
+    keys = (users.astype(numpy.uint64) << numpy.uint64(32)) | codes.astype(numpy.uint64)
+    order = numpy.lexsort((sets, e1rm, days, keys))
+    keys, days, sets, reps, load, e1rm = (column[order] for column in (keys, days, sets, reps, load, e1rm))
+
+    starts = numpy.flatnonzero(numpy.r_[True, keys[1:] != keys[:-1]])
+    lasts = numpy.r_[starts[1:], len(keys)] - 1
+    group = numpy.repeat(numpy.arange(len(starts)), numpy.diff(numpy.r_[starts, len(keys)]))
+    best = numpy.maximum.reduceat(e1rm, starts)
+    volume = numpy.bincount(group, weights=numpy.where(days > day - VOLUME_DAYS, sets * reps * load, 0),
+                            minlength=len(starts))
+
+    # Trend: regress each group's daily best estimated 1RM over the window.
+    day_starts = numpy.flatnonzero(numpy.r_[True, (keys[1:] != keys[:-1]) | (days[1:] != days[:-1])])
+    daily = numpy.maximum.reduceat(e1rm, day_starts)
+    daily_group, daily_day = group[day_starts], (days[day_starts] - day).astype(numpy.float64)
+    weight = (daily_day > -TREND_DAYS).astype(numpy.float64)
+    n = numpy.bincount(daily_group, weight, len(starts))
+    sx = numpy.bincount(daily_group, weight * daily_day, len(starts))
+    sy = numpy.bincount(daily_group, weight * daily, len(starts))
+    sxx = numpy.bincount(daily_group, weight * daily_day * daily_day, len(starts))
+    sxy = numpy.bincount(daily_group, weight * daily_day * daily, len(starts))
+    denominator = n * sxx - sx * sx
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        trend = numpy.where((n >= 2) & (denominator > 0), (n * sxy - sx * sy) / denominator * 7, math.nan)
+
+    summaries = {}
+    for i, last in enumerate(lasts.tolist()):
+        key = int(keys[last])
+        summaries[(key >> 32, key & 0xFFFFFFFF)] = Summary(
+            datetime.date.fromordinal(int(days[last])), int(sets[last]), int(reps[last]), float(load[last]),
+            float(best[i]), None if math.isnan(trend[i]) else float(trend[i]), float(volume[i]))
+    return summaries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record and query the Globo training log.")
+    parser.add_argument("--log", type=str, required=True, help="The training log directory.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record_parser = commands.add_parser("record", help="Record sets of an exercise.")
+    record_parser.add_argument("user", help="The user's email address.")
+    record_parser.add_argument("exercise", help="The exercise name, e.g. 'Bench Press'.")
+    record_parser.add_argument("sets", type=int)
+    record_parser.add_argument("reps", type=int)
+    record_parser.add_argument("load", type=float, help=f"Load in {LOAD_UNIT}.")
+    record_parser.add_argument("--date", type=datetime.date.fromisoformat, default=None,
+                               help="When the sets were done (YYYY-MM-DD). Defaults to today.")
+    import_parser = commands.add_parser("import", help="Import a CSV with user, date, exercise, sets, reps, load columns.")
+    import_parser.add_argument("csv", help="The CSV file.")
+    show_parser = commands.add_parser("show", help="Summarize a user's history.")
+    show_parser.add_argument("user", help="The user's email address.")
+    show_parser.add_argument("--date", type=datetime.date.fromisoformat, default=None, help="As of this day.")
+    commands.add_parser("compact", help="Merge all segments into one.")
+    args = parser.parse_args()
+
+    log = TrainingLog(args.log)
+    if args.command == "record":
+        log.record(args.user, args.exercise, args.date or datetime.date.today(), args.sets, args.reps, args.load)
+        log.flush()
+    elif args.command == "import":
+        count = 0
+        with open(args.csv, newline="", encoding="utf-8") as f:
+            for count, row in enumerate(csv.DictReader(f), 1):
+                log.record(row["user"], row["exercise"], datetime.date.fromisoformat(row["date"]),
+                           int(row["sets"]), int(row["reps"]), float(row["load"]))
+        log.flush()
+        print(f"Imported {count} rows")
+    elif args.command == "show":
+        summaries = log.summaries([args.user], log.exercises.names, args.date or datetime.date.today())
+        for (_, name), summary in sorted(summaries.items()):
+            trend = "-" if summary.trend is None else f"{summary.trend:+.1f}/wk"
+            print(f"{name}: last {summary.last_day} {summary.last_sets}x{summary.last_reps} @ {summary.last_load:g} "
+                  f"{LOAD_UNIT}, e1RM {summary.best_e1rm:.1f} ({trend}), {VOLUME_DAYS}-day volume "
+                  f"{summary.weekly_volume:,.0f} {LOAD_UNIT}")
+    elif args.command == "compact":
+        print(f"Merged {log.compact()} segments")
@@ -1,28 +1,57 @@
+import exercise
 import routine
+import templates
 
 
-class Workout(object):
+class Workout(exercise.Frozen):
     """An interface for a full workout. Typically this would be a full set of routines to do on a given day."""
 
+    __slots__ = ("name", "routines")
+
     def __init__(self, name, routines):
-        self.name = name
-        self.routines = routines
+        self._set(name=name, routines=tuple(routines))
 
-    def as_html(self):
+    def as_html(self, picker=None, history=None):
         """Helper method to format the routine as HTML.
 
+        Args:
+            picker: Optional picker (see `selection`) used to choose each
+                routine's exercises for a single recipient.
+            history: Optional mapping of exercise name to
+                `training_log.Summary` (see `TrainingLog.summaries`), noted
+                under each exercise the recipient has logged.
+
         Returns:
             A `string` of HTML formatted workout routines.
         """
-        routines_formatted = ''.join([routine.as_html() for routine in self.routines])
-        html = f"""
-            <p><b>{self.name}</b></p>
-            <p>Don't forget to <a href="https://www.youtube.com/watch?v=qQ96oXp5RTU">warm up</a>!</p>
-            <ul>
-                {routines_formatted}
-            </ul>"""
-
-        return html
+        return templates.compile_workout(self).render(picker, history)
+
+    def as_text(self, picker=None, history=None):
+        """Formats the workout as plain text. See `as_html` for the arguments."""
+        return self.render((templates.TEXT,), picker, history)[0]
+
+    def as_markdown(self, picker=None, history=None):
+        """Formats the workout as Markdown. See `as_html` for the arguments."""
+        return self.render((templates.MARKDOWN,), picker, history)[0]
+
+    def render(self, formats, picker=None, history=None):
+        """Formats the workout in several formats with one selection and one traversal.
+
+        Args:
+            formats: Names of formats in `templates.WRITERS`, e.g.
+                `("html", "text")`.
+            picker: Optional picker (see `selection`).
+            history: Optional mapping of exercise name to
+                `training_log.Summary`.
+
+        Returns:
+            A `tuple` of `string`s, one per format.
+        """
+        template = templates.compile_workout(self)
+        return template.render_formats(template.select(picker), formats, history)
+
+    def __reduce__(self):
+        return (Workout, (self.name, list(self.routines)))
 
     def __str__(self):
         return self.as_html()
@@ -1,11 +1,47 @@
-import workout
+import collections.abc
+import importlib
 
 MON, TUE, WED, THU, FRI, SAT, SUN = range(7)
 
 
-WS4SB = {
-    MON: workout.MaxEffortUpperBody,
-    WED: workout.DynamicEffortLowerBody,
-    FRI: workout.RepetitionUpperBody,
-    SAT: workout.MaxEffortLowerBody,
+class Program(collections.abc.Mapping):
+    """A DAY:Workout schedule whose workouts are only imported when looked up.
+
+    Checking whether a day is a workout day doesn't import the catalog, which
+    keeps rest day runs fast. Behaves like a plain `dict`.
+    """
+
+    def __init__(self, schedule, module="workout"):
+        """Constructs a Program.
+
+        Args:
+            schedule: `dict` of weekday ints to names of `Workout` objects.
+            module: `string` The module the workouts are defined in.
+        """
+        self.schedule = schedule
+        self.module = module
+
+    def __getitem__(self, day):
+        return getattr(importlib.import_module(self.module), self.schedule[day])
+
+    def __contains__(self, day):
+        return day in self.schedule
+
+    def __iter__(self):
+        return iter(self.schedule)
+
+    def __len__(self):
+        return len(self.schedule)
+
+
+WS4SB = Program({
+    MON: "MaxEffortUpperBody",
+    WED: "DynamicEffortLowerBody",
+    FRI: "RepetitionUpperBody",
+    SAT: "MaxEffortLowerBody",
+})
+
+# All programs by name.
+PROGRAMS = {
+    "WS4SB": WS4SB,
 }
@@ -0,0 +1,103 @@
+import functools
+import socket
+import unittest
+
+import mailer
+import smtp_sink
+
+SENDER = "sender@test.invalid"
+
+
+def pool_for(port, host="127.0.0.1", **kwargs):
+    factory = functools.partial(mailer.SMTPConnection, host, port, username=SENDER, password="secret",
+                                security=mailer.SECURITY_NONE, timeout=5)
+    return mailer.ConnectionPool(factory, **kwargs)
+
+
+def jobs(recipients):
+    return ((mailer.encode_message(mailer.build_message(SENDER, recipient, "Workout", "<p>Squats</p>")),
+             [recipient]) for recipient in recipients)
+
+
+def unused_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+RECIPIENTS = [f"user{i}@test.invalid" for i in range(20)]
+
+
+class DeliveryEngineTest(unittest.TestCase):
+
+    def deliver(self, sink, **pool_kwargs):
+        with pool_for(sink.port, **pool_kwargs) as pool:
+            return list(mailer.DeliveryEngine(pool).deliver(jobs(RECIPIENTS)))
+
+    def test_delivers_every_message(self):
+        with smtp_sink.SMTPSink() as sink:
+            results = self.deliver(sink)
+        self.assertEqual(sorted(r for result in results for r in result.recipients), sorted(RECIPIENTS))
+        self.assertTrue(all(result.error is None for result in results))
+        self.assertEqual(sorted(r for message in sink.messages for r in message.recipients), sorted(RECIPIENTS))
+        self.assertTrue(all(message.sender == SENDER for message in sink.messages))
+
+    def test_reconnects_when_the_server_hangs_up(self):
+        with smtp_sink.SMTPSink(drop_after=3) as sink:
+            results = self.deliver(sink)
+        self.assertTrue(all(result.error is None for result in results))
+        self.assertEqual(len(sink.messages), len(RECIPIENTS))
+
+    def test_retries_transient_errors(self):
+        with smtp_sink.SMTPSink(throttle_every=4) as sink:
+            results = self.deliver(sink)
+        self.assertTrue(all(result.error is None for result in results))
+        self.assertEqual(len(sink.messages), len(RECIPIENTS))
+
+    def test_refused_recipients_are_left_out(self):
+        message = mailer.encode_message(
+            mailer.build_message(SENDER, mailer.UNDISCLOSED_RECIPIENTS, "Workout", "<p>Squats</p>"))
+        with smtp_sink.SMTPSink(refuse=[RECIPIENTS[1]]) as sink:
+            with pool_for(sink.port) as pool:
+                jobs = mailer.batch_jobs(message, RECIPIENTS[:3], 3)
+                results = list(mailer.DeliveryEngine(pool).deliver(jobs))
+        self.assertEqual(len(results), 1)
+        self.assertIsNone(results[0].error)
+        self.assertEqual(results[0].recipients, [RECIPIENTS[0], RECIPIENTS[2]])
+        self.assertEqual(list(results[0].refused), [RECIPIENTS[1]])
+        self.assertEqual(sink.messages[0].recipients, [RECIPIENTS[0], RECIPIENTS[2]])
+
+    def test_rejected_login_stops_delivery(self):
+        with smtp_sink.SMTPSink(reject_login=True) as sink:
+            with pool_for(sink.port) as pool:
+                engine = mailer.DeliveryEngine(pool)
+                with self.assertRaises(mailer.SMTPUnavailable):
+                    for result in engine.deliver(jobs(RECIPIENTS)):
+                        self.fail(f"Unexpected result {result}")
+                # Later sends don't try to log in again.
+                with self.assertRaises(mailer.SMTPUnavailable):
+                    list(engine.deliver(jobs(RECIPIENTS)))
+        # One login, which smtplib tries with each method the server offers.
+        self.assertLessEqual(sink.logins, 2)
+        self.assertEqual(sink.messages, [])
+
+    def test_unreachable_server_stops_delivery(self):
+        with pool_for(unused_port()) as pool:
+            with self.assertRaises(mailer.SMTPUnavailable):
+                for result in mailer.DeliveryEngine(pool).deliver(jobs(RECIPIENTS)):
+                    self.fail(f"Unexpected result {result}")
+
+    def test_reset_pool_connects_again(self):
+        port = unused_port()
+        with pool_for(port) as pool:
+            with self.assertRaises(mailer.SMTPUnavailable):
+                list(mailer.DeliveryEngine(pool).deliver(jobs(RECIPIENTS)))
+            with smtp_sink.SMTPSink(port=port) as sink:
+                pool.reset()
+                results = list(mailer.DeliveryEngine(pool).deliver(jobs(RECIPIENTS)))
+        self.assertTrue(all(result.error is None for result in results))
+        self.assertEqual(len(sink.messages), len(RECIPIENTS))
+
+
+if __name__ == "__main__":
+    unittest.main()
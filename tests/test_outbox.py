@@ -0,0 +1,68 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+import outbox
+
+DAY = datetime.date(2021, 3, 1)
+
+
+class OutboxTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.box = outbox.Outbox(os.path.join(directory.name, "outbox.db"), batch_size=2)
+        self.addCleanup(self.box.close)
+
+    def put(self, program, recipients, body=b"body", day=DAY):
+        return self.box.put(day, program, "Upper Body", "WORKOUT: Upper Body",
+                            ((recipient, body) for recipient in recipients))
+
+    def pending(self, program, recipients=None, day=DAY):
+        return [message.recipient for message in self.box.pending(day, program, recipients)]
+
+    def test_pending_until_marked_sent(self):
+        self.assertEqual(self.put("WS4SB", ["c@x.com", "a@x.com", "b@x.com", "d@x.com", "e@x.com"]), 5)
+        self.assertEqual(self.pending("WS4SB"), ["a@x.com", "b@x.com", "c@x.com", "d@x.com", "e@x.com"])
+        self.box.mark_sent(DAY, "WS4SB", ["b@x.com", "d@x.com"])
+        self.assertEqual(self.pending("WS4SB"), ["a@x.com", "c@x.com", "e@x.com"])
+        self.assertEqual(self.pending("WS4SB", recipients={"c@x.com", "d@x.com"}), ["c@x.com"])
+        self.assertEqual(self.pending("WS4SB", day=DAY + datetime.timedelta(days=1)), [])
+
+    def test_messages_carry_their_body(self):
+        self.put("WS4SB", ["a@x.com"], b"first")
+        message, = self.box.pending(DAY, "WS4SB")
+        self.assertEqual(message, outbox.OutboxMessage(
+            "a@x.com", "WS4SB", "Upper Body", "WORKOUT: Upper Body", outbox.body_key(b"first")))
+        self.assertEqual(self.box.body(message.body_key), b"first")
+        with self.assertRaises(KeyError):
+            self.box.body(outbox.body_key(b"missing"))
+
+    def test_programs_are_kept_apart(self):
+        self.put("WS4SB", ["a@x.com", "b@x.com"])
+        self.put("Alt", ["a@x.com"])
+        self.assertEqual(self.box.programs(DAY), ["Alt", "WS4SB"])
+        self.box.mark_sent(DAY, "Alt", ["a@x.com"])
+        self.assertEqual(self.box.programs(DAY), ["WS4SB"])
+        self.assertEqual(self.pending("WS4SB"), ["a@x.com", "b@x.com"])
+
+    def test_putting_again_replaces_only_unsent_emails(self):
+        self.put("WS4SB", ["a@x.com", "b@x.com"], b"old")
+        self.box.mark_sent(DAY, "WS4SB", ["a@x.com"])
+        self.assertEqual(self.put("WS4SB", ["a@x.com", "b@x.com"], b"new"), 1)
+        message, = self.box.pending(DAY, "WS4SB")
+        self.assertEqual(self.box.body(message.body_key), b"new")
+
+    def test_purge_deletes_old_days_and_unused_bodies(self):
+        self.put("WS4SB", ["a@x.com"], b"old", DAY)
+        self.put("WS4SB", ["a@x.com"], b"new", DAY + datetime.timedelta(days=1))
+        self.assertEqual(self.box.purge(DAY + datetime.timedelta(days=1)), 1)
+        with self.assertRaises(KeyError):
+            self.box.body(outbox.body_key(b"old"))
+        self.assertEqual(self.box.body(outbox.body_key(b"new")), b"new")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+import datetime
+import functools
+import os
+import tempfile
+import threading
+import unittest
+
+import mailer
+import ratelimit
+import smtp_sink
+
+DAY = datetime.date(2021, 3, 1)
+
+
+class FakeClock(object):
+    """A clock that only moves when slept on."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_paces_after_the_burst(self):
+        clock = FakeClock()
+        bucket = ratelimit.TokenBucket(10, clock=clock, sleep=clock.sleep)
+        for _ in range(10):
+            bucket.acquire()
+        self.assertEqual(clock.now, 0)
+        bucket.acquire()
+        self.assertAlmostEqual(clock.now, 0.1)
+
+    def test_drain_makes_the_next_acquire_wait(self):
+        clock = FakeClock()
+        bucket = ratelimit.TokenBucket(2, clock=clock, sleep=clock.sleep)
+        bucket.drain()
+        bucket.acquire()
+        self.assertAlmostEqual(clock.now, 0.5)
+
+
+class AdaptiveRateLimiterTest(unittest.TestCase):
+
+    def limiter(self, **kwargs):
+        clock = FakeClock()
+        return ratelimit.AdaptiveRateLimiter(10, clock=clock, sleep=clock.sleep, **kwargs)
+
+    def test_throttling_halves_the_rate_down_to_the_minimum(self):
+        limiter = self.limiter(min_rate=2)
+        limiter.throttled()
+        self.assertEqual(limiter.rate, 5)
+        limiter.throttled()
+        limiter.throttled()
+        self.assertEqual(limiter.rate, 2)
+
+    def test_rate_recovers_additively_after_a_streak(self):
+        limiter = self.limiter(recover_after=3)
+        limiter.throttled()
+        for _ in range(2):
+            limiter.success()
+        self.assertEqual(limiter.rate, 5)
+        limiter.success()
+        self.assertEqual(limiter.rate, 6)
+        for _ in range(30):
+            limiter.success()
+        self.assertEqual(limiter.rate, 10)
+
+    def test_throttling_resets_the_streak(self):
+        limiter = self.limiter(recover_after=3)
+        limiter.throttled()
+        limiter.success()
+        limiter.success()
+        limiter.throttled()
+        limiter.success()
+        self.assertEqual(limiter.rate, 2.5)
+
+
+class DailyBudgetTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "budget.db")
+        self.day = DAY
+
+    def budget(self, limit=10, path=None):
+        budget = ratelimit.DailyBudget(limit, today=lambda: self.day, path=path)
+        if budget.db is not None:
+            self.addCleanup(budget.db.close)
+        return budget
+
+    def check_limit(self, budget):
+        budget.take(4)
+        budget.take(6)
+        self.assertEqual(budget.remaining, 0)
+        with self.assertRaises(ratelimit.BudgetExhausted):
+            budget.take()
+        self.day += datetime.timedelta(days=1)
+        self.assertEqual(budget.remaining, 10)
+        budget.take(10)
+
+    def test_limit_in_memory(self):
+        self.check_limit(self.budget())
+
+    def test_limit_in_sqlite(self):
+        self.check_limit(self.budget(path=self.path))
+
+    def test_a_take_over_the_limit_takes_nothing(self):
+        for budget in (self.budget(), self.budget(path=self.path)):
+            budget.take(8)
+            with self.assertRaises(ratelimit.BudgetExhausted):
+                budget.take(3)
+            with self.assertRaises(ratelimit.BudgetExhausted):
+                budget.take(11)
+            self.assertEqual(budget.remaining, 2)
+
+    def test_give_back_never_goes_below_zero(self):
+        for budget in (self.budget(), self.budget(path=self.path)):
+            budget.take(3)
+            budget.give_back(2)
+            self.assertEqual(budget.remaining, 9)
+            budget.give_back(5)
+            self.assertEqual(budget.remaining, 10)
+
+    def test_instances_share_a_database(self):
+        first, second = self.budget(path=self.path), self.budget(path=self.path)
+        first.take(7)
+        self.assertEqual(second.remaining, 3)
+        with self.assertRaises(ratelimit.BudgetExhausted):
+            second.take(4)
+        second.take(3)
+        self.assertEqual(self.budget(path=self.path).remaining, 0)
+
+    def test_concurrent_takes_never_overshoot(self):
+        budgets = [self.budget(limit=50, path=self.path) for _ in range(4)]
+        taken = []
+
+        def take(budget):
+            for _ in range(30):
+                try:
+                    budget.take()
+                except ratelimit.BudgetExhausted:
+                    continue
+                taken.append(1)
+
+        threads = [threading.Thread(target=take, args=(budget,)) for budget in budgets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(taken), 50)
+        self.assertEqual(budgets[0].remaining, 0)
+
+
+class DeliveryBudgetTest(unittest.TestCase):
+
+    def send(self, sink, recipients):
+        factory = functools.partial(mailer.SMTPConnection, sink.host, sink.port, username="sender@test.invalid",
+                                    password="secret", security=mailer.SECURITY_NONE, timeout=5)
+        limiter = ratelimit.AdaptiveRateLimiter(1000, per_day=10)
+        message = mailer.encode_message(
+            mailer.build_message("sender@test.invalid", mailer.UNDISCLOSED_RECIPIENTS, "Workout", "<p>Squats</p>"))
+        with mailer.ConnectionPool(factory) as pool:
+            results = []
+            try:
+                for result in mailer.DeliveryEngine(pool, limiter=limiter).deliver([(message, recipients)]):
+                    results.append(result)
+            except mailer.SMTPUnavailable:
+                pass
+        return limiter.budget.remaining, results
+
+    def test_refused_recipients_are_given_back(self):
+        with smtp_sink.SMTPSink(refuse=["b@test.invalid"]) as sink:
+            remaining, results = self.send(sink, ["a@test.invalid", "b@test.invalid", "c@test.invalid"])
+        self.assertEqual(remaining, 8)
+        self.assertEqual(results[0].recipients, ["a@test.invalid", "c@test.invalid"])
+
+    def test_failed_sends_are_given_back(self):
+        with smtp_sink.SMTPSink(reject_login=True) as sink:
+            remaining, results = self.send(sink, ["a@test.invalid", "b@test.invalid"])
+        self.assertEqual(remaining, 10)
+        self.assertEqual(results, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
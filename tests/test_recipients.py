@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+import recipients
+
+
+class NormalizeTest(unittest.TestCase):
+
+    def test_lower_cases_only_the_domain(self):
+        self.assertEqual(recipients.normalize("  John.Doe@Example.COM "), "John.Doe@example.com")
+        self.assertEqual(recipients.normalize(" no-at-sign "), "no-at-sign")
+
+
+class DeduplicatorTest(unittest.TestCase):
+
+    def test_exact_across_the_spill(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        deduplicator = recipients.Deduplicator(max_in_memory=10, spill_dir=directory.name)
+        addresses = [f"user{i}@test.invalid" for i in range(100)]
+        self.assertTrue(all(deduplicator.add(address) for address in addresses))
+        self.assertFalse(any(deduplicator.add(address) for address in addresses))
+        self.assertTrue(deduplicator.add("User0@test.invalid"))
+        deduplicator.close()
+        self.assertEqual(os.listdir(directory.name), [])
+
+
+class ReadRecipientsTest(unittest.TestCase):
+
+    def test_cleans_in_input_order(self):
+        invalid = []
+        result = list(recipients.read_recipients(
+            "b@x.com, a@X.com,not-an-address,b@x.com ,A@x.com", on_invalid=invalid.append))
+        self.assertEqual(result, ["b@x.com", "a@x.com", "A@x.com"])
+        self.assertEqual(invalid, ["not-an-address"])
+
+    def test_csv_email_column(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "recipients.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("name,Email\nA,a@x.com\nB,b@x.com\n\nA again,a@x.com\n")
+        self.assertEqual(list(recipients.read_recipients(path=path)), ["a@x.com", "b@x.com"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import collections
+import datetime
+import os
+import random
+import tempfile
+import unittest
+
+import rotation
+
+Routine = collections.namedtuple("Routine", ["name"])
+
+ROUTINE = Routine("Max Effort")
+START = datetime.date(2021, 3, 1)
+
+
+def picks(picker_for, options, days):
+    """Picks from `options` once a day for `days` days."""
+    return [picker_for(START + datetime.timedelta(days=day)).pick(ROUTINE, 0, options) for day in range(days)]
+
+
+class NthUnsetTest(unittest.TestCase):
+
+    def test_matches_a_scan_of_the_bits(self):
+        rng = random.Random(0)
+        for count in list(range(1, 20)) + [63, 64, 65, 200]:
+            for _ in range(20):
+                mask = rng.getrandbits(count)
+                unset = [i for i in range(count) if not mask >> i & 1]
+                for n, index in enumerate(unset):
+                    self.assertEqual(rotation._nth_unset(mask, n, count), index)
+                with self.assertRaises(ValueError):
+                    rotation._nth_unset(mask, len(unset), count)
+
+
+class RotationPickerTest(unittest.TestCase):
+
+    def test_every_option_once_per_round(self):
+        for count in list(range(1, 20)) + [64, 70]:
+            options = list(range(count))
+            states = {}
+            picked = picks(lambda date: rotation.RotationPicker("user@test.invalid", date, states), options, count * 4)
+            for start in range(0, len(picked), count):
+                self.assertEqual(sorted(picked[start:start + count]), options, f"{count} options")
+            if count > 1:
+                # A new round never starts with the previous round's last pick.
+                for start in range(count, len(picked), count):
+                    self.assertNotEqual(picked[start], picked[start - 1])
+
+    def test_same_day_picks_the_same_option(self):
+        options = list(range(10))
+        states = {}
+        first = rotation.RotationPicker("user@test.invalid", START, states).pick(ROUTINE, 0, options)
+        for _ in range(3):
+            self.assertEqual(rotation.RotationPicker("user@test.invalid", START, states).pick(ROUTINE, 0, options),
+                             first)
+        self.assertEqual(states[(ROUTINE.name, 0)].count, 1)
+
+    def test_users_get_different_orders(self):
+        options = list(range(20))
+        orders = {tuple(picks(lambda date, user=user: rotation.RotationPicker(user, date, {}), options, 1))
+                  for user in (f"user{i}@test.invalid" for i in range(20))}
+        self.assertGreater(len(orders), 1)
+
+    def test_shrunk_pool_starts_a_new_round(self):
+        states = {}
+        picks(lambda date: rotation.RotationPicker("user@test.invalid", date, states), list(range(8)), 5)
+        picker = rotation.RotationPicker("user@test.invalid", START + datetime.timedelta(days=10), states)
+        self.assertIn(picker.pick(ROUTINE, 0, list(range(3))), range(3))
+
+    def test_state_round_trips_through_bytes(self):
+        state = rotation.RotationState()
+        for index in (3, 70, 0):
+            state.push(index, START.toordinal())
+        copy = rotation.RotationState.from_bytes(state.to_bytes())
+        self.assertEqual((copy.count, copy.day, copy.last, copy.used),
+                         (state.count, state.day, state.last, state.used))
+        self.assertEqual(rotation.RotationState.from_bytes(rotation.RotationState().to_bytes()).last, -1)
+
+
+class RotationStoreTest(unittest.TestCase):
+
+    def test_rounds_continue_across_runs(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "rotation.db")
+        options = list(range(6))
+        picked = []
+        for day in range(12):
+            store = rotation.RotationStore(path)
+            picker = store.picker("user@test.invalid", START + datetime.timedelta(days=day))
+            picked.append(picker.pick(ROUTINE, 0, options))
+            store.save(picker)
+            store.close()
+        self.assertEqual(sorted(picked[:6]), options)
+        self.assertEqual(sorted(picked[6:]), options)
+
+
+if __name__ == "__main__":
+    unittest.main()
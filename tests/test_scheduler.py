@@ -0,0 +1,120 @@
+import asyncio
+import contextlib
+import datetime
+import io
+import os
+import time
+import unittest
+
+import scheduler
+
+
+class FakeJob(object):
+    """Fires at fixed timestamps and records the calls it gets."""
+
+    name = "fake"
+
+    def __init__(self, fires):
+        self.fires = fires
+        self.calls = []
+
+    def next_fire(self, after):
+        return next((fire for fire in self.fires if fire > after), float("inf"))
+
+    def __call__(self, fire_time):
+        self.calls.append(fire_time)
+
+
+class FailingJob(FakeJob):
+
+    def __call__(self, fire_time):
+        super().__call__(fire_time)
+        raise RuntimeError("boom")
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def run_at(self, job, times, grace=60):
+        """Runs a scheduler whose clock reads each of `times` in turn."""
+        now = [times[0]]
+        daily = scheduler.Scheduler(grace=grace, check_interval=0.001, clock=lambda: now[0])
+        daily.add(job)
+
+        async def run():
+            task = asyncio.ensure_future(daily.run())
+            for value in times[1:]:
+                now[0] = value
+                await asyncio.sleep(0.05)
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            asyncio.run(run())
+        return out.getvalue()
+
+    def test_fires_on_time(self):
+        job = FakeJob([1010, 1020])
+        self.run_at(job, [1000, 1010, 1020])
+        self.assertEqual(job.calls, [1010, 1020])
+
+    def test_late_fires_within_grace_still_run(self):
+        job = FakeJob([1010])
+        self.run_at(job, [1000, 1069])
+        self.assertEqual(job.calls, [1010])
+
+    def test_fires_missed_by_more_than_grace_are_skipped(self):
+        job = FakeJob([1010, 2000])
+        log = self.run_at(job, [1000, 1071, 2000])
+        self.assertEqual(job.calls, [2000])
+        self.assertIn("Skipping fake: missed its fire time by 61s", log)
+
+    def test_clock_jumps_forward_skip_the_fires_passed_over(self):
+        job = FakeJob([1010, 1020, 1030, 5000])
+        self.run_at(job, [1000, 1035, 5000])
+        # 1010 is late by 25s and runs; 1020 and 1030 are passed over.
+        self.assertEqual(job.calls, [1010, 5000])
+
+    def test_failing_jobs_keep_the_scheduler_running(self):
+        job = FailingJob([1010, 1020])
+        with contextlib.redirect_stderr(io.StringIO()) as err:
+            self.run_at(job, [1000, 1010, 1020])
+        self.assertEqual(job.calls, [1010, 1020])
+        self.assertIn("Job fake failed: RuntimeError('boom')", err.getvalue())
+
+
+class DailyJobTest(unittest.TestCase):
+
+    def setUp(self):
+        tz = os.environ.get("TZ")
+        os.environ["TZ"] = "America/New_York"
+        time.tzset()
+
+        def restore():
+            if tz is None:
+                os.environ.pop("TZ", None)
+            else:
+                os.environ["TZ"] = tz
+            time.tzset()
+
+        self.addCleanup(restore)
+
+    def test_next_fire_keeps_the_local_time_across_dst(self):
+        job = scheduler.DailyJob("job", datetime.time(6, 0), None)
+        utc = datetime.timezone.utc
+        # Clocks go forward at 02:00 on 2021-03-14.
+        after = datetime.datetime(2021, 3, 13, 12, 0, tzinfo=utc).timestamp()
+        fire = job.next_fire(after)
+        self.assertEqual(datetime.datetime.fromtimestamp(fire, utc), datetime.datetime(2021, 3, 14, 10, 0, tzinfo=utc))
+        fire = job.next_fire(fire)
+        self.assertEqual(datetime.datetime.fromtimestamp(fire, utc), datetime.datetime(2021, 3, 15, 10, 0, tzinfo=utc))
+
+    def test_next_fire_is_strictly_later(self):
+        job = scheduler.DailyJob("job", datetime.time(6, 0), None)
+        fire = datetime.datetime(2021, 6, 1, 6, 0).timestamp()
+        self.assertEqual(job.next_fire(fire - 1), fire)
+        self.assertEqual(job.next_fire(fire), datetime.datetime(2021, 6, 2, 6, 0).timestamp())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import contextlib
+import datetime
+import io
+import os
+import tempfile
+import unittest
+
+import runner
+import sharding
+
+DAY = datetime.date(2021, 3, 1)
+RECIPIENTS = [f"user{i}@test.invalid" for i in range(20000)]
+
+
+class ShardTest(unittest.TestCase):
+
+    def test_parse_shard(self):
+        self.assertEqual(sharding.parse_shard("2/5"), (2, 5))
+        for value in ("5/5", "-1/3", "1/0", "x/2"):
+            with self.assertRaises(ValueError):
+                sharding.parse_shard(value)
+
+    def test_every_recipient_is_in_exactly_one_shard(self):
+        shards = [sharding.Shard(index, 4) for index in range(4)]
+        owners = [[shard.index for shard in shards if recipient in shard] for recipient in RECIPIENTS]
+        self.assertTrue(all(len(owner) == 1 for owner in owners))
+        filtered = sorted(recipient for shard in shards for recipient in shard.filter(RECIPIENTS))
+        self.assertEqual(filtered, sorted(RECIPIENTS))
+
+    def test_shards_are_about_even(self):
+        ring = sharding.HashRing(4)
+        sizes = [0] * 4
+        for recipient in RECIPIENTS:
+            sizes[ring.shard_for(recipient)] += 1
+        for size in sizes:
+            self.assertAlmostEqual(size / len(RECIPIENTS), 1 / 4, delta=0.05)
+
+    def test_adding_a_shard_moves_about_its_share(self):
+        before, after = sharding.HashRing(4), sharding.HashRing(5)
+        moved = [recipient for recipient in RECIPIENTS if before.shard_for(recipient) != after.shard_for(recipient)]
+        self.assertAlmostEqual(len(moved) / len(RECIPIENTS), 1 / 5, delta=0.05)
+        # Recipients only move to the new shard.
+        self.assertTrue(all(after.shard_for(recipient) == 4 for recipient in moved))
+
+    def test_a_single_shard_has_everyone(self):
+        shard = sharding.Shard(0, 1)
+        self.assertIn("anyone@test.invalid", shard)
+        self.assertEqual(list(shard.filter(RECIPIENTS[:3])), RECIPIENTS[:3])
+
+
+class LeaseStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.now = 1000.0
+        self.leases = sharding.LeaseStore(os.path.join(directory.name, "leases.db"), clock=lambda: self.now)
+        self.addCleanup(self.leases.close)
+
+    def test_lease_lifecycle(self):
+        store = self.leases
+        self.assertEqual(store.status(DAY, "WS4SB", 2), [store.UNCLAIMED, store.UNCLAIMED])
+        self.assertTrue(store.acquire(DAY, "WS4SB", 0, "a", 60))
+        self.assertTrue(store.acquire(DAY, "WS4SB", 0, "a", 60))
+        self.assertFalse(store.acquire(DAY, "WS4SB", 0, "b", 60))
+        self.assertEqual(store.status(DAY, "WS4SB", 2), [store.HELD, store.UNCLAIMED])
+
+        self.now += 50
+        self.assertTrue(store.renew(DAY, "WS4SB", 0, "a", 60))
+        self.now += 50
+        self.assertFalse(store.acquire(DAY, "WS4SB", 0, "b", 60))
+
+        self.now += 61
+        self.assertEqual(store.status(DAY, "WS4SB", 1), [store.EXPIRED])
+        self.assertTrue(store.acquire(DAY, "WS4SB", 0, "b", 60))
+        # The old owner finds out when it next renews.
+        self.assertFalse(store.renew(DAY, "WS4SB", 0, "a", 60))
+
+        store.complete(DAY, "WS4SB", 0, "b")
+        self.now += 1000
+        self.assertEqual(store.status(DAY, "WS4SB", 1), [store.DONE])
+        self.assertFalse(store.acquire(DAY, "WS4SB", 0, "c", 60))
+
+    def test_leases_are_per_day_and_job(self):
+        store = self.leases
+        self.assertTrue(store.acquire(DAY, "WS4SB", 0, "a", 60))
+        self.assertTrue(store.acquire(DAY, "outbox", 0, "b", 60))
+        self.assertTrue(store.acquire(DAY + datetime.timedelta(days=1), "WS4SB", 0, "b", 60))
+
+
+class ShardedRunnerTest(unittest.TestCase):
+
+    def test_stdin_recipients_are_rejected_when_read_more_than_once(self):
+        for flags in (["--daemon"], ["--shard", "0/2", "--lease_db", "leases.db", "--journal", "journal.db"]):
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()) as err:
+                runner.main(["--username", "a@test.invalid", "--app_password", "x", "--recipients_file", "-"] + flags)
+            self.assertIn("stdin can only be read once", err.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
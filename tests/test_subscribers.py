@@ -0,0 +1,116 @@
+import datetime
+import unittest
+import zoneinfo
+
+import subscribers
+import workout_program
+
+NEW_YORK = zoneinfo.ZoneInfo("America/New_York")
+UTC = datetime.timezone.utc
+DAILY = "Daily"
+
+
+def timestamp(*args):
+    return datetime.datetime(*args, tzinfo=UTC).timestamp()
+
+
+def subscriber(email="user@test.invalid", program=DAILY, send_time=datetime.time(6, 0), timezone=NEW_YORK):
+    return subscribers.Subscriber(email, program, timezone, send_time, None)
+
+
+class ScheduleTest(unittest.TestCase):
+
+    def setUp(self):
+        workout = workout_program.PROGRAMS["WS4SB"][workout_program.MON]
+        workout_program.PROGRAMS[DAILY] = {day: workout for day in range(7)}
+        self.addCleanup(workout_program.PROGRAMS.pop, DAILY)
+
+
+class NextFireTest(ScheduleTest):
+
+    def test_local_send_time_across_spring_forward(self):
+        # New York moves from UTC-5 to UTC-4 at 02:00 on 2021-03-14.
+        fire, day = subscribers.next_fire(subscriber(), timestamp(2021, 3, 13, 12, 0))
+        self.assertEqual((fire, day), (timestamp(2021, 3, 14, 10, 0), datetime.date(2021, 3, 14)))
+        fire, day = subscribers.next_fire(subscriber(), timestamp(2021, 3, 13, 0, 0))
+        self.assertEqual((fire, day), (timestamp(2021, 3, 13, 11, 0), datetime.date(2021, 3, 13)))
+
+    def test_skips_rest_days(self):
+        # 2021-03-02 is a Tuesday; WS4SB trains Monday, Wednesday, Friday and Saturday.
+        fire, day = subscribers.next_fire(subscriber(program="WS4SB"), timestamp(2021, 3, 2, 0, 0))
+        self.assertEqual(day, datetime.date(2021, 3, 3))
+
+    def test_programs_without_workouts_never_fire(self):
+        workout_program.PROGRAMS["Rest"] = {}
+        self.addCleanup(workout_program.PROGRAMS.pop, "Rest")
+        self.assertIsNone(subscribers.next_fire(subscriber(program="Rest"), 0))
+
+
+class ScheduleIndexTest(ScheduleTest):
+
+    def fires(self, index, start, end, step=60, grace=None):
+        """Ticks `index` every `step` seconds and returns the `Due`s."""
+        due = []
+        now = start
+        while now <= end:
+            due.extend(index.due(now, grace))
+            now += step
+        return due
+
+    def test_fires_once_a_day_across_dst_changes(self):
+        for send_time, start, end in (
+                # Spring forward: 02:30 doesn't exist on 2021-03-14.
+                (datetime.time(2, 30), (2021, 3, 12), (2021, 3, 17)),
+                # Fall back: 01:30 happens twice on 2021-11-07.
+                (datetime.time(1, 30), (2021, 11, 5), (2021, 11, 10)),
+                (datetime.time(6, 0), (2021, 11, 5), (2021, 11, 10))):
+            index = subscribers.ScheduleIndex()
+            start, end = timestamp(*start), timestamp(*end)
+            index.add(subscriber(send_time=send_time), start)
+            due = self.fires(index, start, end)
+            dates = [item.date for item in due]
+            self.assertEqual(dates, sorted(set(dates)), f"{send_time} fired twice on a day")
+            self.assertEqual(len(dates), 5, f"{send_time} missed a day")
+            self.assertEqual(len(index), 1)
+
+    def test_fire_keeps_the_local_time(self):
+        index = subscribers.ScheduleIndex()
+        index.add(subscriber(), timestamp(2021, 3, 13, 0, 0))
+        due = self.fires(index, timestamp(2021, 3, 13, 0, 0), timestamp(2021, 3, 15, 0, 0))
+        self.assertEqual([item.fire_time for item in due], [timestamp(2021, 3, 13, 11, 0), timestamp(2021, 3, 14, 10, 0)])
+        self.assertEqual([item.date for item in due], [datetime.date(2021, 3, 13), datetime.date(2021, 3, 14)])
+
+    def test_late_ticks_cover_the_buckets_in_between(self):
+        index = subscribers.ScheduleIndex()
+        index.add(subscriber(), timestamp(2021, 3, 1, 0, 0))
+        index.due(timestamp(2021, 3, 1, 10, 0))
+        due = index.due(timestamp(2021, 3, 1, 11, 30))
+        self.assertEqual([item.subscriber.email for item in due], ["user@test.invalid"])
+
+    def test_fires_missed_by_more_than_grace_are_dropped(self):
+        index = subscribers.ScheduleIndex()
+        index.add(subscriber(), timestamp(2021, 3, 1, 0, 0))
+        index.due(timestamp(2021, 3, 1, 10, 0))
+        self.assertEqual(index.due(timestamp(2021, 3, 1, 13, 0), grace=3600), [])
+        # Re-indexed for the next day.
+        self.assertEqual(len(index), 1)
+        due = index.due(timestamp(2021, 3, 2, 11, 0), grace=3600)
+        self.assertEqual([item.date for item in due], [datetime.date(2021, 3, 2)])
+
+    def test_only_due_programs_and_buckets_fire(self):
+        index = subscribers.ScheduleIndex()
+        after = timestamp(2021, 3, 1, 0, 0)
+        index.add(subscriber("early@test.invalid"), after)
+        index.add(subscriber("late@test.invalid", send_time=datetime.time(7, 0)), after)
+        index.add(subscriber("tokyo@test.invalid", timezone=zoneinfo.ZoneInfo("Asia/Tokyo")), after)
+        index.due(after)
+        self.assertEqual([item.subscriber.email for item in index.due(timestamp(2021, 3, 1, 11, 0))],
+                         ["early@test.invalid"])
+        self.assertEqual([item.subscriber.email for item in index.due(timestamp(2021, 3, 1, 12, 0))],
+                         ["late@test.invalid"])
+        self.assertEqual([item.subscriber.email for item in index.due(timestamp(2021, 3, 1, 21, 0))],
+                         ["tokyo@test.invalid"])
+
+
+if __name__ == "__main__":
+    unittest.main()